@@ -0,0 +1,70 @@
+import functools
+import time
+from collections import deque
+
+import numpy as np
+
+from z2xy import mount_transform
+
+
+class AttitudeProjection:
+    # Grid rays levelled by the vessel's roll/pitch, for the horizon of each frame
+    def __init__(self, config, rays, valid):
+        attitude = config.get("ATTITUDE") or {}
+        self.rate = attitude.get("RATE", 20)  # Requested ATTITUDE rate, in Hz
+        self.max_age = attitude.get("MAX_AGE", 0.5)  # in s, level if older
+        self.step = attitude.get("STEP", 1.0)  # Quantization, in degree
+        self.elevation = attitude.get("ELEVATION", [-12, 12])  # in degree
+        self.rays = rays  # (H,W,3) body frame (FRD)
+        self.valid = valid  # IGNORE_GRIDS
+
+        # (receive time, roll, pitch), appended by the receiving thread
+        self.history = deque(maxlen=64)
+        self.received = self.hits = self.misses = 0
+        # Levelled tables by quantized attitude, so a frame is usually a lookup
+        self.level = functools.lru_cache(maxsize=attitude.get("CACHE_SIZE", 256))(
+            self._level
+        )
+
+    def update(self, message):
+        # ATTITUDE message, roll/pitch in rad
+        self.history.append((time.monotonic(), message.roll, message.pitch))
+        self.received += 1
+
+    def at(self, timestamp):
+        # (rotation body to level frame, valid grids) at the capture time
+        history = list(self.history)  # Copy, appended concurrently
+        # The last attitude received before the capture, or the oldest one
+        for sample in reversed(history):
+            if sample[0] <= timestamp:
+                break
+        else:
+            sample = history[0] if history else None
+        if sample is None or abs(timestamp - sample[0]) > self.max_age:
+            return self.level(0, 0)  # Unknown, assume level
+        roll, pitch = np.degrees(sample[1:]) / self.step
+        return self.level(int(round(roll)), int(round(pitch)))
+
+    def _level(self, roll, pitch):
+        # roll/pitch: in steps
+        rotation, _ = mount_transform(
+            {"ROLL": roll * self.step, "PITCH": pitch * self.step}
+        )
+        rays = self.rays @ rotation.T  # All grids in one step
+        elevation = np.degrees(
+            np.arctan2(-rays[..., 2], np.hypot(rays[..., 0], rays[..., 1]))
+        )  # Up positive
+        valid = (
+            self.valid
+            & (elevation >= self.elevation[0])
+            & (elevation <= self.elevation[1])
+        )
+        return rotation, valid
+
+    def report(self):
+        # Since the last report
+        info = self.level.cache_info()
+        hits, misses = info.hits - self.hits, info.misses - self.misses
+        report = f"received {self.received} cache hits {hits}/{hits + misses}"
+        self.received, self.hits, self.misses = 0, info.hits, info.misses
+        return report
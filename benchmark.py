@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+import argparse
+import time
+
+import numpy as np
+import yaml
+
+from depth_filter import DepthFilter
+from frame_source import DepthaiSource, ParallelSource, SyntheticSource
+from host_side_detection import GridReducer
+from point_cloud import PointCloud
+from quadtree import QuadtreeReducer
+from z2xy import deduplicate, frd_rays, grids2frd, ignore_grids_mask
+
+
+def synthetic_config(config, args):
+    # HOST_SIDE synthetic frames, as fast as possible
+    synthetic = dict(
+        config.get("SYNTHETIC") or {},
+        INPUT_SHAPE=args.shape,
+        FPS=0,
+        FRAMES=args.frames,
+    )
+    return dict(config, FRAME_SOURCE="synthetic", HOST_SIDE=True, SYNTHETIC=synthetic)
+
+
+def benchmark_pipeline(config, args):
+    # Detected frames per second, in the main process and with 1..N WORKERS
+    config = synthetic_config(config, args)
+    synthetic = config["SYNTHETIC"]
+
+    source = SyntheticSource(
+        config,
+        INPUT_SHAPE=args.shape,
+        fps=0,
+        frames=args.frames,
+        obstacles=synthetic.get("OBSTACLES"),
+    )
+    reducer = GridReducer(config, source.INPUT_SHAPE)
+    with source:
+        start = time.perf_counter()
+        count = 0
+        for frame in source:
+            reducer(mask=frame.nn, depth=frame.depth)
+            count += 1
+        elapsed = time.perf_counter() - start
+    print(f"main process: {count / elapsed:.1f}fps ({count} frames)")
+
+    for workers in args.workers:
+        # The source is unpaced, so frames wait for the workers instead of dropping
+        with ParallelSource(dict(config, WORKERS=workers), drop=False) as source:
+            start = time.perf_counter()
+            count = 0
+            for frame in source:
+                count += 1
+            elapsed = time.perf_counter() - start
+        print(
+            f"{workers} workers: {count / elapsed:.1f}fps "
+            f"({count}/{args.frames} frames in order, {source.late} late)"
+        )
+
+
+def benchmark_pointcloud(config, args):
+    # Grids vs point cloud on the same frames: time, obstacles and nearest one
+    config = synthetic_config(config, args)
+    synthetic = config["SYNTHETIC"]
+    point_cloud = dict(config.get("POINT_CLOUD") or {}, ENABLE=True)
+    if args.stride:
+        point_cloud["STRIDE"] = args.stride
+    config["POINT_CLOUD"] = point_cloud
+
+    source = SyntheticSource(
+        config,
+        INPUT_SHAPE=args.shape,
+        fps=0,
+        frames=args.frames,
+        obstacles=synthetic.get("OBSTACLES"),
+        noise=synthetic.get("NOISE", 0),
+    )
+    shape = (config["GRID_NUM"][0], config["GRID_NUM"][1], 2)
+    valid = ignore_grids_mask(config)
+    voxel = config.get("FUSION_VOXEL", 0)
+
+    def grids(frame):
+        out = reducer(mask=frame.nn, depth=frame.depth)
+        out = np.array(out, dtype=np.float64).reshape(shape)
+        _, points = grids2frd(out, rays, origins, valid)
+        if voxel > 0:
+            points = points[deduplicate(points, voxel)]
+        return points
+
+    def points(frame):
+        return cloud(mask=frame.nn, depth=frame.depth)
+
+    methods = {"grids": grids, "point cloud": points}
+    elapsed = dict.fromkeys(methods, 0.0)
+    obstacles = {name: [] for name in methods}
+    nearest = {name: [] for name in methods}
+    with source:
+        reducer = GridReducer(config, source.INPUT_SHAPE)
+        rays, origins = frd_rays(*source.z2xy(config), config.get("MOUNT"))
+        cloud = PointCloud(
+            config,
+            source.INPUT_SHAPE,
+            source.intrinsics,
+            source.hfov,
+            source.distortion,
+        )
+        for frame in source:  # Frame buffers are reused, run both on each
+            for name, detect in methods.items():
+                start = time.perf_counter()
+                result = detect(frame)
+                elapsed[name] += time.perf_counter() - start
+                obstacles[name].append(len(result))
+                if len(result):
+                    nearest[name].append(np.linalg.norm(result, axis=1).min())
+
+    for name in methods:
+        count = len(obstacles[name])
+        print(
+            f"{name}: {elapsed[name] / count * 1000:.2f}ms/frame, "
+            f"{np.mean(obstacles[name]):.1f} obstacles/frame, nearest "
+            f"{np.mean(nearest[name]) if nearest[name] else np.nan:.2f}m on average"
+        )
+
+
+def benchmark_quadtree(config, args):
+    # GRID_NUM grids vs QUADTREE vs grids as fine as its leaves, on the same frames
+    # Still obstacles beyond and within REFINE_DISTANCE, so both sides are covered
+    config = synthetic_config(config, args)
+    synthetic = config["SYNTHETIC"]
+    quadtree = dict(config.get("QUADTREE") or {}, ENABLE=True)
+    if args.levels is not None:
+        quadtree["LEVELS"] = args.levels
+    config["QUADTREE"] = quadtree
+    # The quadtree's statistic, for all so the depths compare
+    config["GRID_STATISTIC"] = dict(config.get("GRID_STATISTIC") or {}, TYPE="mean")
+    scale = 1 << quadtree.get("LEVELS", 2)
+    fine_config = dict(
+        config,
+        GRID_NUM=[config["GRID_NUM"][0] * scale, config["GRID_NUM"][1] * scale],
+        IGNORE_GRIDS=[n * scale for n in config["IGNORE_GRIDS"]],
+    )
+    refine_distance = quadtree.get("REFINE_DISTANCE", 10)
+    distances = args.distances or [refine_distance * 1.5, refine_distance * 0.5]
+    obstacles = synthetic.get("OBSTACLES") or [{"BOX": [0.4, 0.4, 0.6, 0.7]}]
+
+    for distance in distances:
+        source = SyntheticSource(
+            config,
+            INPUT_SHAPE=args.shape,
+            fps=0,
+            frames=args.frames,
+            obstacles=[
+                dict(obstacle, DISTANCE=distance, SPEED=0) for obstacle in obstacles
+            ],
+            noise=synthetic.get("NOISE", 0),
+        )
+
+        def grids(config):
+            shape = (config["GRID_NUM"][0], config["GRID_NUM"][1], 2)
+            reducer = GridReducer(config, source.INPUT_SHAPE)
+            rays, origins = frd_rays(*source.z2xy(config), config.get("MOUNT"))
+            valid = ignore_grids_mask(config)
+
+            def detect(frame):
+                out = reducer(mask=frame.nn, depth=frame.depth)
+                out = np.array(out, dtype=np.float64).reshape(shape)
+                return grids2frd(out, rays, origins, valid)[1]
+
+            return detect
+
+        with source:
+            reducer = QuadtreeReducer(
+                config, source.INPUT_SHAPE, source.intrinsics, source.hfov
+            )
+            methods = {
+                f"grids {config['GRID_NUM']}": grids(config),
+                f"grids {fine_config['GRID_NUM']}": grids(fine_config),
+                "quadtree": lambda frame: reducer(mask=frame.nn, depth=frame.depth),
+            }
+            elapsed = dict.fromkeys(methods, 0.0)
+            counts = {name: [] for name in methods}
+            nearest = {name: [] for name in methods}
+            cells = []
+            for frame in source:  # Frame buffers are reused, run all on each
+                for name, detect in methods.items():
+                    start = time.perf_counter()
+                    result = detect(frame)
+                    elapsed[name] += time.perf_counter() - start
+                    counts[name].append(len(result))
+                    if len(result):
+                        nearest[name].append(np.linalg.norm(result, axis=1).min())
+                cells.append(reducer.cells)
+
+        side = "within" if distance < refine_distance else "beyond"
+        print(f"Obstacles at {distance:g}m, {side} REFINE_DISTANCE:")
+        for name in methods:
+            count = len(counts[name])
+            print(
+                f"  {name}: {elapsed[name] / count * 1000:.2f}ms/frame, "
+                f"{np.mean(counts[name]):.1f} obstacles/frame, nearest "
+                f"{np.mean(nearest[name]) if nearest[name] else np.nan:.2f}m on average"
+            )
+        print(f"  quadtree: {np.mean(cells):.1f} cells evaluated/frame")
+
+
+def device_latency(config, frames):
+    # Capture to host receive latency of the depth stream, p50/p95 in ms
+    latencies = []
+    with DepthaiSource(config, passthroughs=not config["HOST_SIDE"]) as source:
+        for frame in source:
+            latencies.append(time.monotonic() - frame.timestamp)
+            if len(latencies) >= frames:
+                break
+    return np.percentile(latencies, [50, 95]) * 1000
+
+
+def benchmark_depth_filter(config, args):
+    # Host side DEPTH_FILTER cost, and the on-device filters' latency with --device
+    settings = config.get("DEPTH_FILTER") or {}
+    device_config = dict(config, FRAME_SOURCE="device", DECIMATION_FACTOR=1)
+    config = synthetic_config(config, args)
+    synthetic = config["SYNTHETIC"]
+
+    filters = {
+        name: DepthFilter(
+            {"DEPTH_FILTER": {name: dict(settings.get(name) or {}, ENABLE=True)}},
+            args.shape,
+        )
+        for name in ("SPECKLE", "TEMPORAL", "HOLE_FILLING")
+    }
+    filters["ALL"] = DepthFilter(
+        {
+            "DEPTH_FILTER": {
+                name: dict(settings.get(name) or {}, ENABLE=True)
+                for name in ("SPECKLE", "TEMPORAL", "HOLE_FILLING")
+            }
+        },
+        args.shape,
+    )
+    elapsed = dict.fromkeys(filters, 0.0)
+    invalid = dict.fromkeys(["NONE", *filters], 0)
+
+    source = SyntheticSource(
+        config,
+        INPUT_SHAPE=args.shape,
+        fps=0,
+        frames=args.frames,
+        obstacles=synthetic.get("OBSTACLES"),
+        noise=synthetic.get("NOISE", 0) or 50,
+    )
+    rng = np.random.default_rng(0)
+    depth = np.empty((args.shape[1], args.shape[0]), dtype=np.uint16)
+    with source:
+        count = 0
+        for frame in source:
+            # Stereo artifacts: holes and far speckles
+            np.copyto(depth, frame.depth)
+            depth[rng.random(depth.shape) < args.holes] = 0
+            speckles = rng.random(depth.shape) < args.speckles
+            depth[speckles] = rng.integers(500, 30000, np.count_nonzero(speckles))
+            invalid["NONE"] += np.count_nonzero(depth == 0)
+            for name, depth_filter in filters.items():
+                start = time.perf_counter()
+                out = depth_filter(depth)
+                elapsed[name] += time.perf_counter() - start
+                invalid[name] += np.count_nonzero(out == 0)
+            count += 1
+
+    pixels = count * depth.size
+    print(f"host NONE: {invalid['NONE'] / pixels * 100:.1f}% invalid pixels")
+    for name in filters:
+        print(
+            f"host {name}: {elapsed[name] / count * 1000:.2f}ms/frame, "
+            f"{invalid[name] / pixels * 100:.1f}% invalid pixels"
+        )
+
+    if args.device:
+        # On-device filters add to the depth stream's latency
+        device_filters = ("SPECKLE_FILTER", "TEMPORAL_FILTER", "SPATIAL_FILTER")
+        off = dict.fromkeys(device_filters, False)
+        p50, p95 = device_latency(dict(device_config, **off), args.frames)
+        print(f"device NONE: p50/p95 {p50:.1f}/{p95:.1f}ms latency")
+        for name in device_filters:
+            latency = device_latency(
+                dict(device_config, **off, **{name: True}), args.frames
+            )
+            print(f"device {name}: p50/p95 {latency[0]:.1f}/{latency[1]:.1f}ms latency")
+        for name in filters:
+            print(
+                f"device NONE + host {name}: "
+                f"p50 {p50 + elapsed[name] / count * 1000:.1f}ms latency"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host side benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pipeline = subparsers.add_parser(
+        "pipeline", help="Process pipeline (WORKERS) scaling"
+    )
+    pipeline.add_argument("--frames", type=int, default=600)
+    pipeline.add_argument("--shape", type=int, nargs=2, default=[640, 360])
+    pipeline.add_argument("--workers", type=int, nargs="+", default=[1, 2, 3, 4])
+
+    pointcloud = subparsers.add_parser(
+        "pointcloud", help="Grids vs POINT_CLOUD detection cost and output"
+    )
+    pointcloud.add_argument("--frames", type=int, default=300)
+    pointcloud.add_argument("--shape", type=int, nargs=2, default=[640, 360])
+    pointcloud.add_argument("--stride", type=int, help="Override POINT_CLOUD.STRIDE")
+
+    quadtree = subparsers.add_parser(
+        "quadtree", help="QUADTREE vs uniform grids cost and output"
+    )
+    quadtree.add_argument("--frames", type=int, default=300)
+    quadtree.add_argument("--shape", type=int, nargs=2, default=[640, 360])
+    quadtree.add_argument("--levels", type=int, help="Override QUADTREE.LEVELS")
+    quadtree.add_argument(
+        "--distances",
+        type=float,
+        nargs="+",
+        help="Of the obstacles, in m (default 1.5 and 0.5 REFINE_DISTANCE)",
+    )
+
+    depth_filter = subparsers.add_parser(
+        "depthfilter", help="Host side DEPTH_FILTER vs on-device depth filters"
+    )
+    depth_filter.add_argument("--frames", type=int, default=300)
+    depth_filter.add_argument("--shape", type=int, nargs=2, default=[640, 360])
+    depth_filter.add_argument("--holes", type=float, default=0.05, help="Ratio")
+    depth_filter.add_argument("--speckles", type=float, default=0.01, help="Ratio")
+    depth_filter.add_argument(
+        "--device", action="store_true", help="Also measure the on-device filters"
+    )
+    args = parser.parse_args()
+
+    with open("config.yaml") as f:  # Read only
+        config = yaml.safe_load(f)
+
+    if args.benchmark == "pipeline":
+        benchmark_pipeline(config, args)
+    elif args.benchmark == "pointcloud":
+        benchmark_pointcloud(config, args)
+    elif args.benchmark == "quadtree":
+        benchmark_quadtree(config, args)
+    elif args.benchmark == "depthfilter":
+        benchmark_depth_filter(config, args)
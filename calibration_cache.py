@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import yaml
+
+
+def cache_key(mxid, INPUT_SHAPE, config):
+    # Everything the cached values depend on
+    return "{}_{}x{}_{}x{}_{}".format(
+        mxid,
+        INPUT_SHAPE[0],
+        INPUT_SHAPE[1],
+        config["GRID_NUM"][0],
+        config["GRID_NUM"][1],
+        "intrinsic" if config["USE_INTRINSIC"] else "hfov",
+    )
+
+
+def calibration_hash(calibData):
+    # Of the whole EEPROM content
+    eeprom = json.dumps(calibData.eepromToJson(), sort_keys=True)
+    return hashlib.sha1(eeprom.encode()).hexdigest()
+
+
+def load(path, key):
+    # Returns (calibration, z2x, z2y), z2x/z2y memory-mapped, or None if not cached
+    directory = os.path.join(path, key)
+    try:
+        with open(os.path.join(directory, "calibration.yaml")) as f:
+            calibration = yaml.safe_load(f)
+        tables = np.load(os.path.join(directory, "projection.npy"), mmap_mode="r")
+    except (OSError, ValueError, yaml.YAMLError):
+        return None
+    return calibration, tables[0], tables[1]
+
+
+def save(path, key, calibration, z2x, z2y):
+    # Atomic per file, calibration.yaml last so a partial cache is never loaded
+    directory = os.path.join(path, key)
+    os.makedirs(directory, exist_ok=True)
+    for name in ("calibration.yaml", "projection.npy"):
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+    file = os.path.join(directory, "projection.npy")
+    with open(file + ".tmp", "wb") as f:
+        np.save(f, np.stack((z2x, z2y)))
+    os.replace(file + ".tmp", file)
+
+    file = os.path.join(directory, "calibration.yaml")
+    with open(file + ".tmp", "w") as f:
+        yaml.safe_dump(calibration, f)
+    os.replace(file + ".tmp", file)
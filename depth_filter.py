@@ -0,0 +1,123 @@
+import numpy as np
+
+INVALID = np.iinfo(np.uint16).max  # Stand-in for 0(no depth) when taking minimums
+
+# (center, neighbor) slices of the 4-neighborhood, views without padding
+NEIGHBORS = [
+    ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),  # Left
+    ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),  # Right
+    ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),  # Upper
+    ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),  # Lower
+]
+
+
+class DepthFilter:
+    # Host side speckle, temporal and hole filling filters, in this order
+    def __init__(self, config, INPUT_SHAPE):
+        depth_filter = config.get("DEPTH_FILTER") or {}
+        speckle = depth_filter.get("SPECKLE") or {}
+        self.speckle = speckle.get("ENABLE", False)
+        self.speckle_diff = speckle.get("DIFF", 200)  # in mm
+        self.speckle_neighbors = speckle.get("NEIGHBORS", 2)  # Similar ones, of 4
+        temporal = depth_filter.get("TEMPORAL") or {}
+        self.temporal = temporal.get("ENABLE", False)
+        self.alpha = temporal.get("ALPHA", 0.4)
+        self.delta = temporal.get("DELTA", 500)  # in mm, larger steps reset
+        self.persistence = temporal.get("PERSISTENCE", 3)  # in frames
+        hole_filling = depth_filter.get("HOLE_FILLING") or {}
+        self.hole_filling = hole_filling.get("ENABLE", False)
+        self.radius = hole_filling.get("RADIUS", 2)  # in pixels
+
+        # Scratch buffers (full frame)
+        self.width, self.height = INPUT_SHAPE[0], INPUT_SHAPE[1]
+        shape = (self.height, self.width)
+        self.out = np.empty(shape, dtype=np.uint16)  # in mm
+        self._valid = np.empty(shape, dtype=bool)
+        self._similar = np.empty(shape, dtype=bool)
+        self._holes = np.empty(shape, dtype=bool)
+        self._signed = np.empty(shape, dtype=np.int32)
+        self._diff = np.empty(shape, dtype=np.int32)
+        self._count = np.empty(shape, dtype=np.uint8)
+        self._fill = np.empty(shape, dtype=np.uint16)
+        self._nearest = np.empty(shape, dtype=np.uint16)
+        self._step = np.empty(shape, dtype=np.float32)
+        self._distance = np.empty(shape, dtype=np.float32)
+        self._known = np.empty(shape, dtype=bool)
+        # Temporal state
+        self._average = np.zeros(shape, dtype=np.float32)  # in mm, 0 for none
+        self._age = np.zeros(shape, dtype=np.uint8)  # Frames since valid
+
+    @property
+    def enabled(self):
+        return self.speckle or self.temporal or self.hole_filling
+
+    def __call__(self, depth):
+        # Returns the filtered copy of depth(uint16, in mm), reused
+        depth = np.asarray(depth).reshape(self.height, self.width)  # No copy
+        np.copyto(self.out, depth)
+        if self.speckle:
+            self._speckle()
+        if self.temporal:
+            self._temporal()
+        if self.hole_filling:
+            self._hole_filling()
+        return self.out
+
+    def _speckle(self):
+        # Pixels with less than NEIGHBORS similar 4-neighbors are removed
+        np.copyto(self._signed, self.out)
+        np.not_equal(self.out, 0, out=self._valid)
+        self._count.fill(0)
+        for center, neighbor in NEIGHBORS:
+            diff, similar = self._diff[center], self._similar[center]
+            np.subtract(self._signed[center], self._signed[neighbor], out=diff)
+            np.abs(diff, out=diff)
+            np.less_equal(diff, self.speckle_diff, out=similar)
+            similar &= self._valid[neighbor]
+            self._count[center] += similar
+        np.less(self._count, self.speckle_neighbors, out=self._similar)
+        np.copyto(self.out, 0, where=self._similar)
+
+    def _temporal(self):
+        # Exponential moving average, reset on steps larger than DELTA
+        # Invalid pixels keep their average for PERSISTENCE frames
+        np.not_equal(self.out, 0, out=self._valid)
+        np.subtract(self.out, self._average, out=self._step)
+        np.abs(self._step, out=self._distance)
+        np.less_equal(self._distance, self.delta, out=self._similar)
+        np.greater(self._average, 0, out=self._known)
+        self._similar &= self._known
+        self._similar &= self._valid
+        self._step *= self.alpha
+        np.add(self._average, self._step, out=self._average, where=self._similar)
+        np.logical_not(self._similar, out=self._similar)
+        self._similar &= self._valid
+        np.copyto(self._average, self.out, where=self._similar)  # New or stepped
+
+        np.add(self._age, 1, out=self._age)
+        np.minimum(self._age, self.persistence + 1, out=self._age)  # No overflow
+        np.copyto(self._age, 0, where=self._valid)
+        np.greater(self._age, self.persistence, out=self._similar)
+        np.copyto(self._average, 0, where=self._similar)  # Expired
+        np.rint(self._average, out=self._step)
+        np.copyto(self.out, self._step, casting="unsafe")
+
+    def _hole_filling(self):
+        # Invalid pixels take their nearest valid 4-neighbor, RADIUS times
+        for _ in range(self.radius):
+            np.equal(self.out, 0, out=self._holes)
+            np.copyto(self._fill, self.out)
+            np.copyto(self._fill, INVALID, where=self._holes)
+            np.copyto(self._nearest, INVALID)
+            for center, neighbor in NEIGHBORS:
+                nearest = self._nearest[center]
+                np.minimum(nearest, self._fill[neighbor], out=nearest)
+            np.not_equal(self._nearest, INVALID, out=self._valid)
+            self._holes &= self._valid
+            np.copyto(self.out, self._nearest, where=self._holes)
+
+
+def create_depth_filter(config, INPUT_SHAPE):
+    # None if no DEPTH_FILTER is enabled
+    depth_filter = DepthFilter(config, INPUT_SHAPE)
+    return depth_filter if depth_filter.enabled else None
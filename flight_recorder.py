@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+import argparse
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import yaml
+
+
+def record_dtype(meta):
+    # One record per frame, fixed size
+    mask = tuple(meta["MASK_SHAPE"])
+    if meta["MASK_FORMAT"] == "bits":
+        mask = (mask[0], (mask[1] + 7) // 8)  # Packed along rows
+    return np.dtype(
+        [
+            ("seq", np.int64),  # -1 while being written or never written
+            ("timestamp", np.float64),  # Capture, in s, time.monotonic() clock
+            ("mask", np.uint8, mask),  # 0-255, or bits after MASK_THRESHOLD
+            ("depth", np.uint16, tuple(meta["DEPTH_SHAPE"])),  # in mm, 0 for none
+            ("grids", np.float32, tuple(meta["GRIDS_SHAPE"])),  # label,z,closing
+            ("message_bytes", np.int32),  # Written, may exceed the stored ones
+            ("messages", np.uint8, (meta["MAX_MESSAGE_BYTES"],)),  # MAVLink frames
+        ]
+    )
+
+
+class FlightRecorder:
+    # Always-on ring of the latest frames in a preallocated memory-mapped file
+    def __init__(self, config, INPUT_SHAPE):
+        recorder = config.get("RECORDER") or {}
+        self.path = recorder["PATH"]
+        self.rate = recorder.get("RATE", 10)  # Max records per s, 0 for all
+        self.flush_interval = recorder.get("FLUSH_INTERVAL", 5)  # in s
+        self.decimation = recorder.get("DECIMATION", 4)
+        self.mask_threshold = config["MASK_THRESHOLD"]
+        if INPUT_SHAPE is None:
+            INPUT_SHAPE = (0, 0)  # Grids only, e.g. CAMERAS reduced in their processes
+        width, height = INPUT_SHAPE[0], INPUT_SHAPE[1]
+        shape = (-(-height // self.decimation), -(-width // self.decimation))
+        self.meta = {
+            "INPUT_SHAPE": [int(width), int(height)],
+            "DECIMATION": self.decimation,
+            "MASK_FORMAT": recorder.get("MASK_FORMAT", "bits"),  # bits/uint8
+            "MASK_THRESHOLD": self.mask_threshold,
+            "MASK_SHAPE": list(shape),
+            "DEPTH_SHAPE": list(shape),
+            "GRIDS_SHAPE": [config["GRID_NUM"][0], config["GRID_NUM"][1], 3],
+            "MAX_MESSAGE_BYTES": recorder.get("MAX_MESSAGE_BYTES", 2048),
+        }
+        assert self.meta["MASK_FORMAT"] in ("bits", "uint8")
+        self.dtype = record_dtype(self.meta)
+        self.slots = max(
+            int(recorder.get("SIZE", 256) * 2**20 // self.dtype.itemsize), 1
+        )
+
+        # Staged on the control path, copied into the file by the thread
+        self.staging = np.zeros(4, dtype=self.dtype)
+        self.free = queue.SimpleQueue()
+        for i in range(len(self.staging)):
+            self.free.put(i)
+        self.tasks = queue.SimpleQueue()
+        self.slot_of = {}  # seq -> slot, of the recent records
+        self.next_record = 0  # time.monotonic()
+        self.recorded = self.dropped = 0
+        self.thread = None
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        file = os.path.join(self.path, "records.npy")
+        self.records = None
+        try:
+            # Same layout: keep the previous records, write after them
+            records = np.load(file, mmap_mode="r+")
+            if records.dtype == self.dtype and records.shape == (self.slots,):
+                self.records = records
+        except (OSError, ValueError):
+            pass
+        if self.records is None:
+            self.records = np.lib.format.open_memmap(
+                file, mode="w+", dtype=self.dtype, shape=(self.slots,)
+            )
+            self.records["seq"] = -1
+        with open(os.path.join(self.path, "meta.yaml"), "w") as f:
+            yaml.safe_dump(self.meta, f)
+        self.seq = int(self.records["seq"].max()) + 1  # Of the ring
+
+        self.thread = threading.Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        if self.thread is not None:
+            self.tasks.put(None)
+            self.thread.join()
+            self.thread = None
+            self.records.flush()
+            self.records = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, seq, timestamp, nn, depth, grids):
+        # Control path: decimated copies into a staging record, never blocks
+        # seq: the frame's, to attach the messages later
+        now = time.monotonic()
+        if self.rate and now < self.next_record:
+            return
+        try:
+            index = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1  # Thread is behind
+            return
+        if self.rate:
+            self.next_record += 1 / self.rate
+            if self.next_record < now:
+                self.next_record = now + 1 / self.rate  # Behind, no burst
+        staged = self.staging[index]
+        staged["timestamp"] = timestamp
+        staged["mask"] = 0
+        staged["depth"] = 0
+        d = self.decimation
+        if depth is not None:
+            # nn is the mask too, unless reduced to grids already
+            height, width = self.meta["INPUT_SHAPE"][1], self.meta["INPUT_SHAPE"][0]
+            mask = np.asarray(nn).reshape(height, width)[::d, ::d]
+            if self.meta["MASK_FORMAT"] == "bits":
+                staged["mask"] = np.packbits(mask > self.mask_threshold, axis=1)
+            else:
+                np.multiply(mask, 255, out=staged["mask"], casting="unsafe")
+            staged["depth"] = np.asarray(depth).reshape(height, width)[::d, ::d]
+        staged["grids"] = 0
+        if grids is not None:
+            staged["grids"][..., : grids.shape[-1]] = grids
+        staged["message_bytes"] = 0
+        self.tasks.put(("record", seq, index))
+
+    def messages(self, seq, frame):
+        # Write thread: the MAVLink bytes written for the frame seq
+        self.tasks.put(("messages", seq, bytes(frame)))
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            kind, seq, value = task
+            if kind == "record":
+                slot = self.seq % self.slots
+                record = self.records[slot]
+                record["seq"] = -1  # Invalid until complete
+                record["timestamp"] = self.staging[value]["timestamp"]
+                for field in ("mask", "depth", "grids"):
+                    record[field] = self.staging[value][field]
+                record["message_bytes"] = 0
+                record["seq"] = self.seq
+                self.free.put(value)
+                self.slot_of[seq] = slot
+                if len(self.slot_of) > len(self.staging) * 4:
+                    del self.slot_of[next(iter(self.slot_of))]  # Oldest
+                self.seq += 1
+                self.recorded += 1
+            elif seq in self.slot_of:
+                record = self.records[self.slot_of.pop(seq)]
+                stored = min(len(value), len(record["messages"]))
+                record["messages"][:stored] = np.frombuffer(value, np.uint8, stored)
+                record["message_bytes"] = len(value)
+
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                self.records.flush()  # Dirty pages only
+                last_flush = now
+
+    def report(self):
+        report = f"recorded {self.recorded} dropped {self.dropped}"
+        self.recorded = self.dropped = 0
+        return report
+
+
+def read_records(path):
+    # Yields the records (views, not copies) oldest first, and the meta
+    with open(os.path.join(path, "meta.yaml")) as f:
+        meta = yaml.safe_load(f)
+    records = np.load(os.path.join(path, "records.npy"), mmap_mode="r")
+    seq = records["seq"]
+    for slot in np.argsort(seq, kind="stable")[np.count_nonzero(seq < 0) :]:
+        yield records[slot], meta
+
+
+def unpack_mask(record, meta):
+    # (H,W) of the decimated frame, bool for bits, else 0-1 floats
+    if meta["MASK_FORMAT"] == "bits":
+        width = meta["MASK_SHAPE"][1]
+        return np.unpackbits(record["mask"], axis=1, count=width).astype(bool)
+    return record["mask"] / 255
+
+
+def parse_messages(record):
+    # The MAVLink messages written for the record's frame
+    os.environ.setdefault("MAVLINK20", "1")  # As main.py, before the first import
+    from pymavlink import mavutil
+
+    stored = min(int(record["message_bytes"]), len(record["messages"]))
+    mav = mavutil.mavlink.MAVLink(None)
+    mav.robust_parsing = True
+    return mav.parse_buffer(record["messages"][:stored].tobytes()) or []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints a flight recorder's records")
+    parser.add_argument("path", help="RECORDER.PATH")
+    parser.add_argument("--last", type=int, default=0, help="Only the last N")
+    args = parser.parse_args()
+
+    records = list(read_records(args.path))
+    for record, meta in records[-args.last :]:
+        obstacle = record["grids"][..., 0] > 0
+        nearest = record["grids"][..., 1][obstacle].min() if obstacle.any() else 0
+        messages = parse_messages(record)
+        print(
+            f"{record['seq']} {record['timestamp']:.3f}s: "
+            f"{np.count_nonzero(obstacle)} obstacle grids, nearest {nearest:.2f}m, "
+            f"depth {np.count_nonzero(record['depth'])} pixels, "
+            f"{len(messages)} messages ({record['message_bytes']}B)"
+            + "".join(f" {message.get_type()}" for message in messages[:4])
+        )
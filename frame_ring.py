@@ -0,0 +1,53 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRing:
+    # Mask/depth frames in shared memory, written by one process, read in place
+    def __init__(self, INPUT_SHAPE, slots=8):
+        width, height = INPUT_SHAPE
+        self.slots = slots
+        layout = [
+            ("seq", np.int64, (slots,)),  # -1 while being written
+            ("timestamp", np.float64, (slots,)),  # in s, time.monotonic() clock
+            ("mask", np.float16, (slots, height * width)),  # As the NN outputs it
+            ("depth", np.uint16, (slots, height, width)),  # in mm
+        ]
+        sizes = [
+            np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in layout
+        ]
+        self.shm = shared_memory.SharedMemory(create=True, size=sum(sizes))
+        offset = 0
+        for (field, dtype, shape), size in zip(layout, sizes):
+            setattr(
+                self,
+                field,
+                np.ndarray(shape, dtype, buffer=self.shm.buf, offset=offset),
+            )
+            offset += size
+        self.seq.fill(-1)
+
+    def write(self, seq, timestamp, mask, depth, slot=None):
+        # Returns the slot, by default overwriting the frame self.slots frames ago
+        if slot is None:
+            slot = seq % self.slots
+        self.seq[slot] = -1
+        np.copyto(self.mask[slot], mask.reshape(-1), casting="unsafe")
+        np.copyto(self.depth[slot], depth)
+        self.timestamp[slot] = timestamp
+        self.seq[slot] = seq
+        return slot
+
+    def valid(self, slot, seq):
+        # False if the slot has been (or is being) overwritten since seq
+        return self.seq[slot] == seq
+
+    def close(self):
+        # Views must go before the mapping
+        self.seq = self.timestamp = self.mask = self.depth = None
+        self.shm.close()
+
+    def unlink(self):
+        # By the creator, once every process is done
+        self.shm.unlink()
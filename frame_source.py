@@ -0,0 +1,914 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import yaml
+
+import calibration_cache
+from depth_filter import create_depth_filter
+from frame_ring import FrameRing
+from frame_sync import FrameSync
+from host_side_detection import GridReducer
+from ignore_mask import ignored_grids
+from log import log
+from tensor import get_frame, get_layer_fp16
+from z2xy import frd_rays, ignore_grids_mask, z2xy_grid
+
+# seq, timestamp(in s, time.monotonic() clock), nn(flat), depth(uint16 HxW), img(BGR)
+Frame = namedtuple("Frame", ["seq", "timestamp", "nn", "depth", "img"])
+Frame.__new__.__defaults__ = (None,)  # img is optional
+
+
+class FrameSource:
+    INPUT_SHAPE = None  # (W,H)
+    intrinsics = None  # 3x3
+    hfov = None  # in degree
+    calibration_changed = False  # Set when the projection must be taken again
+    distortion = None  # Lens distortion coefficients, None for none
+    reduced = False  # nn is already grids, even with HOST_SIDE
+
+    def open(self):
+        return self
+
+    def close(self):
+        pass
+
+    def get(self):
+        # Blocking, returns None when exhausted
+        raise NotImplementedError
+
+    def z2xy(self, config):
+        # Fixed z to x,y coefficient of each grid, see z2xy.z2xy_grid
+        return z2xy_grid(config, self.INPUT_SHAPE, self.intrinsics, self.hfov)
+
+    def projection(self, config):
+        # Body frame (FRD) rays and origins of each grid, see z2xy.frd_rays
+        return frd_rays(*self.z2xy(config), config.get("MOUNT"))
+
+    def report(self):
+        # Counters since the last report, for the periodic summary
+        return ""
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+
+DEVICE_OPTIONS = {"version": "VERSION_2021_4", "usb2Mode": True}  # As main.py
+
+
+class DepthaiSource(FrameSource):
+    # The OAK-D itself
+    def __init__(self, config, passthroughs=False, device_options=None, log_level=None):
+        # device_options: dai.Device keyword arguments, None for DEVICE_OPTIONS
+        # log_level: dai.LogLevel name (e.g. "DEBUG"), set before the pipeline starts
+        self.config = config
+        self.passthroughs = passthroughs
+        self.device_options = device_options
+        self.log_level = log_level
+        self.device = None
+        self.cache_path = config.get("CALIBRATION_CACHE")  # None to disable
+        self._z2x = self._z2y = None
+        self.sync = None  # FrameSync, when more than the nn stream is received
+
+    def open(self):
+        import depthai as dai
+
+        from pipeline import create_pipeline
+
+        options = dict(
+            DEVICE_OPTIONS if self.device_options is None else self.device_options
+        )
+        if "version" in options:
+            options["version"] = getattr(dai.OpenVINO.Version, options["version"])
+        if self.config.get("DEVICE_ID"):
+            # A specific device, by MXID
+            options["deviceInfo"] = dai.DeviceInfo(self.config["DEVICE_ID"])
+        self.device = dai.Device(**options)
+        if self.log_level is not None:
+            # Before the pipeline starts, so its boot is logged too
+            self.device.setLogLevel(getattr(dai.LogLevel, self.log_level))
+            self.device.setLogOutputLevel(getattr(dai.LogLevel, self.log_level))
+        try:
+            # Loading blob
+            blob = dai.OpenVINO.Blob(self.config["MODEL_PATH"])
+            for name, tensorInfo in blob.networkInputs.items():
+                print(name, tensorInfo.dims)
+            self.INPUT_SHAPE = blob.networkInputs["rgb"].dims[:2]  # Auto INPUT_SHAPE
+
+            # Getting calibration data, from the cache if possible
+            self.cache_key = calibration_cache.cache_key(
+                self.device.getMxId(), self.INPUT_SHAPE, self.config
+            )
+            cached = None
+            if self.cache_path:
+                cached = calibration_cache.load(self.cache_path, self.cache_key)
+            if cached is not None:
+                calibration, self._z2x, self._z2y = cached
+                print(f"Calibration cache: {self.cache_key}")
+            else:
+                calibration, self._z2x, self._z2y = self.read_calibration()
+                if self.cache_path:
+                    calibration_cache.save(
+                        self.cache_path,
+                        self.cache_key,
+                        calibration,
+                        self._z2x,
+                        self._z2y,
+                    )
+
+            lensPosition = calibration["LENS_POSITION"]
+            print(f"RGB Cam lensPosition: {lensPosition}")
+
+            self.intrinsics = np.array(calibration["INTRINSICS"])
+            print(f"RGB Cam intrinsics: {self.intrinsics}")
+
+            self.hfov = calibration["HFOV"]
+            print(f"RGB Cam HFOV: {self.hfov}")
+
+            self.distortion = calibration.get("DISTORTION")  # Not in older caches
+
+            # Start pipeline
+            self.device.startPipeline(
+                create_pipeline(
+                    blob=blob,
+                    lensPosition=lensPosition,
+                    passthroughs=self.passthroughs,
+                    **self.config,
+                )
+            )
+            self.q_nn = self.device.getOutputQueue(name="nn", maxSize=4, blocking=False)  # type: ignore
+            self.q_depth = self.q_img = None
+            if self.config["HOST_SIDE"] or self.passthroughs:
+                self.q_depth = self.device.getOutputQueue(name="depth", maxSize=4, blocking=False)  # type: ignore
+            if self.passthroughs:
+                self.q_img = self.device.getOutputQueue(name="img", maxSize=4, blocking=False)  # type: ignore
+
+            # Mask, depth (and RGB) of the same capture only
+            self.queues = {"nn": self.q_nn, "depth": self.q_depth, "img": self.q_img}
+            self.queues = {k: q for k, q in self.queues.items() if q is not None}
+            if len(self.queues) > 1:
+                sync = self.config.get("SYNC") or {}
+                self.sync = FrameSync(
+                    self.queues,
+                    key=sync.get("KEY", "timestamp"),
+                    tolerance=sync.get("TOLERANCE", 0.01),
+                    max_buffer=sync.get("MAX_BUFFER", 4),
+                )
+        except:
+            self.close()
+            raise
+
+        if cached is not None:
+            # Checked once running, the EEPROM read is off the startup path
+            threading.Thread(
+                target=self.validate_calibration,
+                args=(calibration["HASH"],),
+                name="calibration",
+                daemon=True,
+            ).start()
+        return self
+
+    def close(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    def read_calibration(self):
+        # From the device's EEPROM (slow), with the projection tables
+        import depthai as dai
+
+        calibData = self.device.readCalibration2()
+        calibration = {
+            "LENS_POSITION": int(calibData.getLensPosition(dai.CameraBoardSocket.RGB)),
+            "INTRINSICS": np.array(
+                calibData.getCameraIntrinsics(
+                    dai.CameraBoardSocket.RGB, *self.INPUT_SHAPE  # type: ignore
+                )
+            ).tolist(),
+            "HFOV": float(calibData.getFov(dai.CameraBoardSocket.RGB)),
+            "DISTORTION": [
+                float(k)
+                for k in calibData.getDistortionCoefficients(dai.CameraBoardSocket.RGB)
+            ],
+            "HASH": calibration_cache.calibration_hash(calibData),
+        }
+        z2x, z2y = z2xy_grid(
+            self.config,
+            self.INPUT_SHAPE,
+            calibration["INTRINSICS"],
+            calibration["HFOV"],
+        )
+        return calibration, z2x, z2y
+
+    def validate_calibration(self, cached_hash):
+        try:
+            calibration, z2x, z2y = self.read_calibration()
+        except Exception as e:  # e.g. closed meanwhile
+            log.error("main", "Calibration not validated: %s", e)
+            return
+        if calibration["HASH"] != cached_hash:
+            calibration_cache.save(
+                self.cache_path, self.cache_key, calibration, z2x, z2y
+            )
+            # Swapped in for the next frames, the flag last
+            self.intrinsics = np.array(calibration["INTRINSICS"])
+            self.hfov = calibration["HFOV"]
+            self.distortion = calibration.get("DISTORTION")
+            self._z2x, self._z2y = z2x, z2y
+            self.calibration_changed = True
+            log.error(
+                "main",
+                "Calibration changed since cached: cache updated, projection "
+                "swapped, the lens position applies after a restart",
+            )
+
+    def z2xy(self, config):
+        # Cached tables, unless asked for another GRID_NUM/USE_INTRINSIC
+        key = calibration_cache.cache_key(
+            self.device.getMxId(), self.INPUT_SHAPE, config
+        )
+        if self._z2x is not None and key == self.cache_key:
+            return self._z2x, self._z2y
+        return super().z2xy(config)
+
+    def get(self):
+        if self.sync is None:
+            msgs = self.q_nn.get()
+            return Frame(
+                msgs.getSequenceNum(),
+                msgs.getTimestamp().total_seconds(),
+                get_layer_fp16(msgs, "out"),  # float16 view
+                None,
+            )
+
+        matched = None
+        while matched is None:
+            # Whichever stream has messages first
+            name = self.device.getQueueEvent(self.sync.streams)
+            for message in self.queues[name].tryGetAll():
+                if self.sync.key == "seq":
+                    key = message.getSequenceNum()
+                else:
+                    key = message.getTimestamp().total_seconds()
+                matched = self.sync.add(name, key, message) or matched
+        matched = dict(zip(self.sync.streams, matched))
+        msgs = matched["nn"]
+        nn = get_layer_fp16(msgs, "out")  # float16 view
+        depth = img = None
+        if "depth" in matched:
+            depth = get_frame(matched["depth"])  # uint16 view
+        if "img" in matched:
+            img = matched["img"].getCvFrame()
+        return Frame(
+            msgs.getSequenceNum(), msgs.getTimestamp().total_seconds(), nn, depth, img
+        )
+
+    def report(self):
+        return self.sync.report() if self.sync is not None else ""
+
+
+class SyntheticSource(FrameSource):
+    # Generated scenes: sky(mask 1, no depth), water(mask 0), obstacles(mask 1)
+    def __init__(
+        self,
+        config,
+        INPUT_SHAPE=(640, 360),
+        fps=30,
+        frames=0,
+        hfov=69.0,
+        horizon=0.45,
+        obstacles=None,
+        noise=0,
+        seed=0,
+        passthroughs=False,
+    ):
+        self.config = config
+        self.passthroughs = passthroughs
+        self.INPUT_SHAPE = tuple(INPUT_SHAPE)
+        self.fps = fps  # 0 for as fast as possible
+        self.frames = frames  # 0 for endless
+        self.hfov = hfov
+        self.obstacles = obstacles
+        if self.obstacles is None:
+            self.obstacles = [{"BOX": [0.4, 0.4, 0.6, 0.7], "DISTANCE": 15, "SPEED": 2}]
+        self.noise = noise  # Depth noise std, in mm
+        self.rng = np.random.default_rng(seed)
+
+        # Ideal pinhole camera
+        width, height = self.INPUT_SHAPE
+        f = (width / 2) / np.tan(hfov / 180 * np.pi / 2)
+        self.intrinsics = np.array(
+            [[f, 0.0, width / 2], [0.0, f, height / 2], [0.0, 0.0, 1.0]]
+        )
+
+        # Static background (1m above a flat water surface)
+        horizon_row = int(height * horizon)
+        self._base_mask = np.zeros((height, width), dtype=np.float16)
+        self._base_mask[:horizon_row] = 1
+        rows = np.arange(height) - horizon_row + 0.5
+        water = np.where(rows > 0, 1000 * f / np.maximum(rows, 0.5), 0)
+        water = np.minimum(water, config["MAX_DISTANCE"] * 1000)
+        self._base_depth = np.repeat(water.astype(np.uint16)[:, None], width, axis=1)
+
+        # Triple buffered, a frame stays valid while the next two are generated
+        self._mask = [np.empty_like(self._base_mask) for _ in range(3)]
+        self._depth = [np.empty_like(self._base_depth) for _ in range(3)]
+        self._noise = np.empty((height, width), dtype=np.float32)
+        if not config["HOST_SIDE"]:
+            # Emulate the on-device detection
+            self._reducer = GridReducer(config, self.INPUT_SHAPE)
+            self._grids = [
+                np.empty(self._reducer.out.size, dtype=np.float16) for _ in range(3)
+            ]
+
+    def open(self):
+        self.seq = 0
+        self.start = self.next_time = time.monotonic()
+        return self
+
+    def get(self):
+        if self.frames and self.seq >= self.frames:
+            return None
+        if self.fps:
+            delay = self.next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_time += 1 / self.fps
+        timestamp = time.monotonic()
+
+        k = self.seq % 3
+        mask, depth = self._mask[k], self._depth[k]
+        np.copyto(mask, self._base_mask)
+        np.copyto(depth, self._base_depth)
+        if self.noise:
+            self.rng.standard_normal(dtype=np.float32, out=self._noise)
+            self._noise *= self.noise
+            self._noise += depth
+            np.clip(self._noise, 0, 65535, out=self._noise)
+            np.copyto(depth, self._noise, casting="unsafe", where=depth > 0)
+
+        height, width = depth.shape
+        min_distance = self.config["MIN_DISTANCE"]
+        for obstacle in self.obstacles:
+            x0, y0, x1, y1 = obstacle["BOX"]  # Normalized
+            box = (
+                slice(int(y0 * height), int(y1 * height)),
+                slice(int(x0 * width), int(x1 * width)),
+            )
+            # Approaching at SPEED, restarting when too close
+            distance = obstacle["DISTANCE"]
+            travel = obstacle.get("SPEED", 0) * (timestamp - self.start)
+            distance -= travel % max(distance - min_distance, 1e-3)
+            mask[box] = 1
+            depth[box] = int(distance * 1000)
+
+        if self.config["HOST_SIDE"]:
+            nn = mask.reshape(-1)
+        else:
+            nn = self._grids[k]
+            np.copyto(nn, self._reducer(mask, depth).reshape(-1), casting="unsafe")
+        img = None
+        if self.passthroughs:
+            img = np.repeat((mask * 255).astype(np.uint8)[..., None], 3, axis=2)
+
+        self.seq += 1
+        return Frame(self.seq - 1, timestamp, nn, depth, img)
+
+
+class ReplaySource(FrameSource):
+    # Sessions written by SessionWriter, memory-mapped
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.realtime = realtime  # Keep recorded frame intervals
+        self.loop = loop
+
+    def open(self):
+        with open(os.path.join(self.path, "meta.yaml")) as f:
+            self.meta = yaml.safe_load(f)
+        self.INPUT_SHAPE = tuple(self.meta["INPUT_SHAPE"])
+        self.intrinsics = np.array(self.meta["INTRINSICS"])
+        self.hfov = self.meta["HFOV"]
+        self.distortion = self.meta.get("DISTORTION")
+        self.frames = self.meta["FRAMES"]
+
+        def load(name):
+            file = os.path.join(self.path, name + ".npy")
+            return np.load(file, mmap_mode="r") if os.path.exists(file) else None
+
+        self._nn = load("nn")
+        self._depth = load("depth")
+        self._img = load("img")
+        self._timestamp = load("timestamp")
+        self._seq = load("seq")
+        self.index = 0
+        return self
+
+    def close(self):
+        # Drop the maps
+        self._nn = self._depth = self._img = self._timestamp = self._seq = None
+
+    def get(self):
+        if self.index >= self.frames:
+            if not self.loop or self.frames == 0:
+                return None
+            self.index = 0
+        i = self.index
+        if i == 0:
+            self.start = time.monotonic() - self._timestamp[0]
+
+        timestamp = time.monotonic()
+        if self.realtime:
+            delay = self.start + self._timestamp[i] - timestamp
+            if delay > 0:
+                time.sleep(delay)
+                timestamp = time.monotonic()
+
+        self.index += 1
+        return Frame(
+            int(self._seq[i]),
+            timestamp,
+            self._nn[i],  # Views into the maps
+            None if self._depth is None else self._depth[i],
+            None if self._img is None else self._img[i],
+        )
+
+
+def camera_worker(config, index, messages, stopped):
+    # One camera of a MultiSource, in its own process: frames to grids
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Stopped by the parent
+    try:
+        with create_frame_source(config) as source:
+            messages.put(("projection", index) + source.projection(config))
+            reducer = depth_filter = None
+            if config["HOST_SIDE"] and not source.reduced:
+                reducer = GridReducer(config, source.INPUT_SHAPE)
+                depth_filter = create_depth_filter(config, source.INPUT_SHAPE)
+            shape = (config["GRID_NUM"][0], config["GRID_NUM"][1], 2)
+            ignored = ~ignore_grids_mask(config)
+            if reducer is None and not source.reduced:
+                ignored |= ignored_grids(config, source.INPUT_SHAPE)  # IGNORE_MASK
+            for frame in source:
+                if stopped.is_set():
+                    break
+                if reducer is not None:
+                    depth = frame.depth
+                    if depth_filter is not None:
+                        depth = depth_filter(depth)
+                    grids = reducer(mask=frame.nn, depth=depth)
+                else:
+                    grids = frame.nn
+                grids = np.array(grids, dtype=np.float32).reshape(shape)
+                grids[ignored, 0] = 0  # IGNORE_GRIDS of this camera
+                try:
+                    messages.put_nowait(("grids", index, frame.timestamp, grids))
+                except queue.Full:
+                    pass  # Parent is behind, newer ones will follow
+    except Exception as e:
+        messages.put(("error", index, str(e)))
+
+
+class MultiSource(FrameSource):
+    # Several cameras, one process each, grids side by side (see expand_cameras)
+    reduced = True
+
+    def __init__(self, config):
+        self.config = config
+        self.cameras = config["CAMERAS"]
+        self.max_age = config.get("FUSION_MAX_AGE", 0.5)  # in s
+        self.open_timeout = 30  # in s, opening a device takes a while
+
+    def open(self):
+        # fork: spawn would run main.py again in each process
+        context = multiprocessing.get_context("fork")
+        self.messages = context.Queue(maxsize=4 * len(self.cameras))
+        self.stopped = context.Event()
+        self.processes = [
+            context.Process(
+                target=camera_worker,
+                args=(camera, index, self.messages, self.stopped),
+                name=f"camera{index}",
+                daemon=True,
+            )
+            for index, camera in enumerate(self.cameras)
+        ]
+        for process in self.processes:
+            process.start()
+
+        grid_num_h, grid_num_w = self.cameras[0]["GRID_NUM"]
+        self.columns = [
+            slice(grid_num_w * index, grid_num_w * (index + 1))
+            for index in range(len(self.cameras))
+        ]
+        self.rays = np.empty((grid_num_h, grid_num_w * len(self.cameras), 3))
+        self.origins = np.empty_like(self.rays)
+        try:
+            # Each camera's projection, once opened
+            pending = set(range(len(self.cameras)))
+            deadline = time.monotonic() + self.open_timeout
+            while pending:
+                try:
+                    kind, index, *values = self.messages.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except queue.Empty:
+                    raise TimeoutError(f"Camera {sorted(pending)} not opened")
+                if kind == "error":
+                    raise RuntimeError(f"Camera {index}: {values[0]}")
+                if kind == "projection":
+                    self.rays[:, self.columns[index]] = values[0]
+                    self.origins[:, self.columns[index]] = values[1]
+                    pending.discard(index)
+        except:
+            self.close()
+            raise
+
+        self.grids = np.zeros(self.rays.shape[:2] + (2,), dtype=np.float32)
+        self.timestamps = np.full(len(self.cameras), -np.inf)  # Of each camera
+        self._grids = [np.empty_like(self.grids) for _ in range(3)]
+        self.seq = 0
+        return self
+
+    def close(self):
+        self.stopped.set()
+        for process in self.processes:
+            process.join(timeout=3)
+            if process.is_alive():
+                process.terminate()
+
+    def projection(self, config):
+        return self.rays, self.origins
+
+    def get(self):
+        # A fused frame on each camera's frame, stale cameras cleared
+        while True:
+            try:
+                kind, index, *values = self.messages.get(timeout=0.1)
+            except queue.Empty:
+                if self.stopped.is_set() or not any(
+                    process.is_alive() for process in self.processes
+                ):
+                    return None
+                continue
+            if kind == "error":
+                log.error(
+                    "main", "Camera %d: %s", index, values[0]
+                )  # The others keep going
+            if kind == "grids":
+                break
+
+        timestamp, grids = values
+        self.grids[:, self.columns[index]] = grids
+        self.timestamps[index] = timestamp
+        out = self._grids[self.seq % 3]  # Triple buffered
+        np.copyto(out, self.grids)
+        for stale in np.flatnonzero(timestamp - self.timestamps > self.max_age):
+            out[:, self.columns[stale], 0] = 0
+
+        self.seq += 1
+        return Frame(self.seq - 1, timestamp, out.reshape(-1), None)
+
+
+def acquisition_worker(config, ring, free, tasks, results, workers, stopped, drop):
+    # Frames into the free slots of the ring, their slots to the detection workers
+    # drop: skip frames while no slot is free, else wait for one
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Stopped by the parent
+    try:
+        with create_frame_source(dict(config, WORKERS=0)) as source:
+            results.put(("opened", source.intrinsics, source.hfov))
+            # Stateful(temporal), so here in order rather than in the workers
+            depth_filter = create_depth_filter(config, source.INPUT_SHAPE)
+            seq = 0  # Of the ring, the source's may repeat (e.g. looped replay)
+            for frame in source:
+                if stopped.is_set():
+                    break
+                slot = None
+                while slot is None and not stopped.is_set():
+                    try:
+                        slot = free.get(block=not drop, timeout=0.1)
+                    except queue.Empty:
+                        if drop:
+                            break  # Workers are behind, drop it
+                if slot is None:
+                    continue
+                depth = frame.depth
+                if depth_filter is not None:
+                    depth = depth_filter(depth)
+                ring.write(seq, frame.timestamp, frame.nn, depth, slot)
+                tasks.put((seq, slot))
+                seq += 1
+    except Exception as e:
+        results.put(("error", str(e)))
+    finally:
+        for _ in range(workers):
+            tasks.put(None)
+
+
+def detection_worker(config, ring, free, tasks, results):
+    # Grids of the frames in the ring, without copying them out
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Stopped by the parent
+    reducer = GridReducer(config, (ring.depth.shape[2], ring.depth.shape[1]))
+    while True:
+        task = tasks.get()
+        if task is None:
+            results.put(("end",))
+            return
+        seq, slot = task
+        grids = reducer(mask=ring.mask[slot], depth=ring.depth[slot])
+        timestamp = ring.timestamp[slot]
+        if ring.valid(slot, seq):  # Not overwritten meanwhile
+            results.put(("grids", seq, timestamp, grids.copy()))
+        free.put(slot)
+
+
+class ParallelSource(FrameSource):
+    # HOST_SIDE detection in WORKERS processes, frames shared in place
+    reduced = True
+
+    def __init__(self, config, drop=True):
+        # drop: False to detect every frame, e.g. of an unpaced source
+        self.config = config
+        self.workers = config["WORKERS"]
+        self.drop = drop
+        self.reorder_wait = 0.1  # in s, for a result before skipping it
+        self.INPUT_SHAPE = input_shape(config)
+        self.open_timeout = 30  # in s, opening a device takes a while
+
+    def open(self):
+        # fork: spawn would run main.py again in each process
+        context = multiprocessing.get_context("fork")
+        # Never lapped: a slot is only written again once its worker freed it
+        self.ring = FrameRing(self.INPUT_SHAPE, slots=2 * self.workers + 2)
+        self.free = context.Queue()
+        for slot in range(self.ring.slots):
+            self.free.put(slot)
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.stopped = context.Event()
+        self.processes = [
+            context.Process(
+                target=acquisition_worker,
+                args=(
+                    self.config,
+                    self.ring,
+                    self.free,
+                    self.tasks,
+                    self.results,
+                    self.workers,
+                    self.stopped,
+                    self.drop,
+                ),
+                name="acquisition",
+                daemon=True,
+            )
+        ] + [
+            context.Process(
+                target=detection_worker,
+                args=(self.config, self.ring, self.free, self.tasks, self.results),
+                name=f"detection{index}",
+                daemon=True,
+            )
+            for index in range(self.workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        try:
+            try:
+                kind, *values = self.results.get(timeout=self.open_timeout)
+            except queue.Empty:
+                raise TimeoutError("Frame source not opened")
+            if kind == "error":
+                raise RuntimeError(values[0])
+            self.intrinsics, self.hfov = values
+        except:
+            self.close()
+            raise
+
+        self.next_seq = 0  # Of the ring, the next one to return
+        self.pending = {}  # seq -> results arrived before next_seq
+        self.waiting = None  # Since when a later result waits for next_seq
+        self.ended = 0  # Workers
+        self.late = 0  # Results arriving after being given up on, dropped
+        return self
+
+    def close(self):
+        self.stopped.set()
+        for process in self.processes:
+            process.join(timeout=3)
+            if process.is_alive():
+                process.terminate()
+        self.ring.close()
+        self.ring.unlink()
+
+    def get(self):
+        # In order: results are held until the ones before them arrive, or for
+        # reorder_wait at most (a frame lost in a worker), then skipped over
+        while True:
+            if self.next_seq in self.pending:
+                seq = self.next_seq
+                timestamp, grids = self.pending.pop(seq)
+                self.next_seq += 1
+                self.waiting = time.monotonic() if self.pending else None
+                return Frame(seq, timestamp, grids.reshape(-1), None)
+            if self.pending and (
+                self.ended == self.workers
+                or time.monotonic() - self.waiting >= self.reorder_wait
+            ):
+                self.next_seq = min(self.pending)
+                continue
+            if self.ended == self.workers:
+                return None
+
+            timeout = 0.1
+            if self.pending:
+                timeout = self.waiting + self.reorder_wait - time.monotonic()
+            try:
+                kind, *values = self.results.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                if self.stopped.is_set() or not any(
+                    process.is_alive() for process in self.processes
+                ):
+                    return None
+                continue
+            if kind == "error":
+                log.error("main", "Frame source: %s", values[0])
+            elif kind == "end":
+                self.ended += 1
+            elif kind == "grids":
+                seq, timestamp, grids = values
+                if seq < self.next_seq:
+                    self.late += 1
+                    continue
+                if not self.pending:
+                    self.waiting = time.monotonic()
+                self.pending[seq] = (timestamp, grids)
+
+
+def input_shape(config):
+    # INPUT_SHAPE (W,H) of the configured source, without opening it
+    kind = config.get("FRAME_SOURCE", "device")
+    if kind == "device":
+        import depthai as dai
+
+        blob = dai.OpenVINO.Blob(config["MODEL_PATH"])
+        return tuple(blob.networkInputs["rgb"].dims[:2])
+    elif kind == "synthetic":
+        return tuple((config.get("SYNTHETIC") or {}).get("INPUT_SHAPE", (640, 360)))
+    elif kind == "replay":
+        with open(os.path.join(config["REPLAY"]["PATH"], "meta.yaml")) as f:
+            return tuple(yaml.safe_load(f)["INPUT_SHAPE"])
+    raise ValueError(f"Unknown FRAME_SOURCE: {kind}")
+
+
+def expand_cameras(config):
+    # With CAMERAS: each camera's full config, and their grids side by side as one
+    if not config.get("CAMERAS"):
+        return config
+    # Camera processes are daemonic, they cannot start WORKERS of their own
+    cameras = [
+        dict(config, **camera, CAMERAS=[], WORKERS=0) for camera in config["CAMERAS"]
+    ]
+    grid_num_h, grid_num_w = cameras[0]["GRID_NUM"]
+    assert all(camera["GRID_NUM"] == [grid_num_h, grid_num_w] for camera in cameras)
+    return dict(
+        config,
+        CAMERAS=cameras,
+        GRID_NUM=[grid_num_h, grid_num_w * len(cameras)],
+        HOST_SIDE=False,  # Reduced by each camera's process
+        IGNORE_GRIDS=[0, 0, 0, 0],  # Applied by each camera's process
+    )
+
+
+class SessionWriter:
+    # Writes a session for ReplaySource, preallocated
+    def __init__(self, path, frames, source, config):
+        self.path = path
+        self.frames = frames
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+        self.meta = {
+            "INPUT_SHAPE": [int(v) for v in source.INPUT_SHAPE],
+            "INTRINSICS": np.asarray(source.intrinsics).tolist(),
+            "HFOV": float(source.hfov),
+            "DISTORTION": (
+                None
+                if source.distortion is None
+                else [float(k) for k in source.distortion]
+            ),
+            "HOST_SIDE": config["HOST_SIDE"],
+            "GRID_NUM": config["GRID_NUM"],
+            "FRAMES": 0,
+        }
+        self._arrays = {}
+
+    def _array(self, name, value):
+        if name not in self._arrays:
+            self._arrays[name] = np.lib.format.open_memmap(
+                os.path.join(self.path, name + ".npy"),
+                mode="w+",
+                dtype=np.asarray(value).dtype,
+                shape=(self.frames,) + np.shape(value),
+            )
+        return self._arrays[name]
+
+    def write(self, frame):
+        if self.count >= self.frames:
+            return False  # Full
+        for name, value in zip(Frame._fields, frame):
+            if value is not None:
+                self._array(name, value)[self.count] = value
+        self.count += 1
+        return True
+
+    def close(self):
+        for array in self._arrays.values():
+            array.flush()
+        self.meta["FRAMES"] = self.count
+        with open(os.path.join(self.path, "meta.yaml"), "w") as f:
+            yaml.safe_dump(self.meta, f)
+        self._arrays = {}
+
+
+def create_frame_source(
+    config, passthroughs=False, device_options=None, log_level=None
+):
+    # config: after expand_cameras if CAMERAS is used
+    # device_options, log_level: of a DepthaiSource, see there
+    kind = config.get("FRAME_SOURCE", "device")
+    if config.get("CAMERAS") and not passthroughs:
+        return MultiSource(config)
+    elif config.get("WORKERS") and config["HOST_SIDE"] and not passthroughs:
+        return ParallelSource(config)
+    elif kind == "device":
+        return DepthaiSource(
+            config,
+            passthroughs=passthroughs,
+            device_options=device_options,
+            log_level=log_level,
+        )
+    elif kind == "synthetic":
+        synthetic = config.get("SYNTHETIC") or {}
+        return SyntheticSource(
+            config,
+            INPUT_SHAPE=synthetic.get("INPUT_SHAPE", (640, 360)),
+            fps=synthetic.get("FPS", 30),
+            frames=synthetic.get("FRAMES", 0),
+            hfov=synthetic.get("HFOV", 69.0),
+            horizon=synthetic.get("HORIZON", 0.45),
+            obstacles=synthetic.get("OBSTACLES"),
+            noise=synthetic.get("NOISE", 0),
+            passthroughs=passthroughs,
+        )
+    elif kind == "replay":
+        replay = config["REPLAY"]
+        source = ReplaySource(
+            replay["PATH"],
+            realtime=replay.get("REALTIME", True),
+            loop=replay.get("LOOP", False),
+        )
+        with open(os.path.join(replay["PATH"], "meta.yaml")) as f:
+            meta = yaml.safe_load(f)
+        assert meta["HOST_SIDE"] == config["HOST_SIDE"]
+        assert meta["GRID_NUM"] == config["GRID_NUM"] or config["HOST_SIDE"]
+        return source
+    else:
+        raise ValueError(f"Unknown FRAME_SOURCE: {kind}")
+
+
+if __name__ == "__main__":
+    # Record a session from the configured source
+    parser = argparse.ArgumentParser(description="Record a session for replay")
+    parser.add_argument("path", help="Output directory")
+    parser.add_argument("--frames", type=int, default=900)
+    parser.add_argument("--passthroughs", action="store_true", help="Also save RGB")
+    args = parser.parse_args()
+
+    with open("config.yaml") as f:  # Read only
+        config = yaml.safe_load(f)
+        config["CAMERAS"] = []  # Only the base camera
+
+    with create_frame_source(config, passthroughs=args.passthroughs) as source:
+        writer = SessionWriter(args.path, args.frames, source, config)
+        try:
+            for frame in source:
+                if not writer.write(frame):
+                    break
+        finally:
+            writer.close()
+            print(f"{writer.count} frames saved to {args.path}")
@@ -0,0 +1,63 @@
+from collections import deque
+
+
+class FrameSync:
+    # Matches the messages of several streams by sequence number or timestamp
+    def __init__(self, streams, key="timestamp", tolerance=0.01, max_buffer=4):
+        assert key in ("seq", "timestamp")
+        self.streams = list(streams)  # Names, the order of matched sets
+        self.key = key
+        self.tolerance = tolerance if key == "timestamp" else 0  # in s
+        self.buffers = {
+            stream: deque(maxlen=max_buffer) for stream in self.streams
+        }  # (key, message), oldest first
+
+        # Counters, since the last report
+        self.matched = 0
+        self.dropped = dict.fromkeys(self.streams, 0)
+        self.skew_sum = self.skew_max = 0  # in s, or in frames for seq
+
+    def add(self, stream, key, message):
+        # Returns the matched messages (in streams order) completed by this one
+        buffer = self.buffers[stream]
+        if len(buffer) == buffer.maxlen:
+            self.dropped[stream] += 1  # Oldest one, never matched
+        buffer.append((key, message))
+
+        # The nearest message of every other stream
+        matched = []
+        for other in self.streams:
+            candidates = self.buffers[other]
+            if not candidates:
+                return None
+            i = min(range(len(candidates)), key=lambda i: abs(candidates[i][0] - key))
+            if abs(candidates[i][0] - key) > self.tolerance:
+                return None
+            matched.append(i)
+
+        # Matched, anything older can never be matched (monotonic keys)
+        keys = []
+        for other, i in zip(self.streams, matched):
+            candidates = self.buffers[other]
+            self.dropped[other] += i
+            for _ in range(i):
+                candidates.popleft()
+            keys.append(candidates[0][0])
+        skew = max(keys) - min(keys)
+        self.matched += 1
+        self.skew_sum += skew
+        self.skew_max = max(self.skew_max, skew)
+        return [self.buffers[other].popleft()[1] for other in self.streams]
+
+    def report(self):
+        unit, scale = ("ms", 1000) if self.key == "timestamp" else ("", 1)
+        report = "sync: matched {} dropped {} skew mean/max {:.1f}/{:.1f}{}".format(
+            self.matched,
+            "/".join(str(self.dropped[stream]) for stream in self.streams),
+            self.skew_sum / max(self.matched, 1) * scale,
+            self.skew_max * scale,
+            unit,
+        )
+        self.matched = self.skew_sum = self.skew_max = 0
+        self.dropped = dict.fromkeys(self.streams, 0)
+        return report
@@ -1,43 +1,124 @@
 import numpy as np
 
+from ignore_mask import grid_pixel_counts, load_ignore_mask
+
+
+class GridReducer:
+    # Built once, reused for every frame (no per-frame allocation)
+    def __init__(self, config, INPUT_SHAPE):
+        self.width, self.height = INPUT_SHAPE[0], INPUT_SHAPE[1]
+        self.grid_num_h = config["GRID_NUM"][0]
+        self.grid_num_w = config["GRID_NUM"][1]
+        assert self.height % self.grid_num_h == 0
+        assert self.width % self.grid_num_w == 0
+        self.grid_height = self.height // self.grid_num_h
+        self.grid_width = self.width // self.grid_num_w
+
+        # IGNORE_MASK pixels are never over the mask threshold
+        self.mask_threshold = config["MASK_THRESHOLD"]
+        assert self.mask_threshold >= 0 and self.mask_threshold <= 1
+        grid_size = self.grid_height * self.grid_width  # Pixels not ignored
+        valid = load_ignore_mask(config, INPUT_SHAPE)
+        if valid is not None:
+            self.mask_threshold = np.where(
+                valid, np.float16(self.mask_threshold), np.float16(np.inf)
+            )
+            grid_size = grid_pixel_counts(valid, config["GRID_NUM"])
+
+        if isinstance(config["GRID_THRESHOLD"], float):
+            assert config["GRID_THRESHOLD"] >= 0 and config["GRID_THRESHOLD"] <= 1
+            self.grid_threshold = config["GRID_THRESHOLD"] * grid_size
+        else:
+            self.grid_threshold = config["GRID_THRESHOLD"]
+
+        # Depth of each grid from its obstacle pixels
+        statistic = config.get("GRID_STATISTIC") or {}
+        self.statistic = statistic.get("TYPE", "mean")  # mean/percentile/trimmed
+        assert self.statistic in ("mean", "percentile", "trimmed")
+        self.percentile = statistic.get("PERCENTILE", 5)
+        self.trim = statistic.get("TRIM", 10)  # Nearest pixels ignored
+        self.bin = statistic.get("BIN", 50)  # Histogram bin width, in mm
+        self.bin_num = int(np.ceil(config["MAX_DISTANCE"] * 1000 / self.bin)) + 1
+
+        # Scratch buffers (full frame)
+        shape = (self.height, self.width)
+        self._mask = np.empty(shape, dtype=bool)
+        self._valid = np.empty(shape, dtype=bool)
+        self._filtered = np.empty(shape, dtype=np.uint16)  # in mm
+        # Per grid buffers
+        grid_shape = (self.grid_num_h, self.grid_num_w)
+        self._sum = np.empty(grid_shape, dtype=np.int64)  # in mm
+        self._non_zero_num = np.empty(grid_shape, dtype=np.int64)
+        if self.statistic != "mean":
+            # Histogram index of each pixel: grid*bin_num+bin
+            self._bins_total = self.grid_num_h * self.grid_num_w * self.bin_num
+            # uint16 when it fits, much faster to count
+            dtype = np.int64
+            if self._bins_total <= np.iinfo(np.uint16).max:
+                dtype = np.uint16
+            self._offset = np.arange(
+                0, self._bins_total, self.bin_num, dtype=dtype
+            ).reshape(self.grid_num_h, 1, self.grid_num_w, 1)
+            self._bins = np.empty(shape, dtype=dtype)
+            self._cumulative = np.empty(
+                (self.grid_num_h * self.grid_num_w, self.bin_num), dtype=np.int64
+            )
+        # Output: label,z(in m)
+        self.out = np.zeros(grid_shape + (2,), dtype=np.float64)
+
+    def _split(self, frame):
+        # (H,W)->(GRID_H,grid_height,GRID_W,grid_width), a view
+        return frame.reshape(
+            self.grid_num_h, self.grid_height, self.grid_num_w, self.grid_width
+        )
+
+    def __call__(self, mask, depth):
+        mask = np.asarray(mask).reshape(self.height, self.width)  # No copy
+        depth = np.asarray(depth).reshape(self.height, self.width)
+
+        np.greater(mask, self.mask_threshold, out=self._mask)
+        np.multiply(depth, self._mask, out=self._filtered)
+        np.not_equal(self._filtered, 0, out=self._valid)
+
+        np.sum(self._split(self._valid), axis=(1, 3), out=self._non_zero_num)
+
+        z = self.out[..., 1]
+        z.fill(0)
+        if self.statistic == "mean":
+            # Integer mm until the final division
+            np.sum(self._split(self._filtered), axis=(1, 3), out=self._sum)
+            np.divide(
+                self._sum, self._non_zero_num, out=z, where=self._non_zero_num > 0
+            )
+        else:
+            self._histogram_depth(z)
+        z /= 1000  # mm->m
+        np.greater(self._non_zero_num, self.grid_threshold, out=self.out[..., 0])
+        return self.out  # 0:background 1:obstacle, reused
+
+    def _histogram_depth(self, z):
+        # Nearest percentile/trimmed minimum(in mm) of each grid, O(pixels) no sort
+        np.floor_divide(self._filtered, self.bin, out=self._bins, casting="unsafe")
+        np.minimum(self._bins, self.bin_num - 1, out=self._bins)
+        self._split(self._bins)[...] += self._offset
+        histogram = np.bincount(self._bins.reshape(-1), minlength=self._bins_total)
+        histogram = histogram.reshape(self._cumulative.shape)
+        count = self._non_zero_num.reshape(-1)
+        # Pixels without depth are in the first bin, faster than masking them
+        histogram[:, 0] -= self.grid_height * self.grid_width - count
+        np.cumsum(histogram, axis=1, out=self._cumulative)
+
+        # Rank of the wanted pixel in each grid, 1 for the nearest
+        if self.statistic == "percentile":
+            rank = np.ceil(count * (self.percentile / 100))
+        else:
+            rank = np.minimum(self.trim + 1, count)
+        rank = np.maximum(rank, 1)
+        index = np.argmax(self._cumulative >= rank[:, None], axis=1)
+        z[...] = ((index + 0.5) * self.bin).reshape(z.shape)  # Bin center
+        z[self._non_zero_num == 0] = 0
+
 
 def detection(config, INPUT_SHAPE, mask, depth):
-    mask = np.array(mask).reshape(INPUT_SHAPE[1], INPUT_SHAPE[0])
-    depth = depth.astype("float64")
-
-    grid_num_h = config["GRID_NUM"][0]
-    grid_num_w = config["GRID_NUM"][1]
-    assert mask.shape[0] % grid_num_h == 0 and mask.shape[1] % grid_num_w == 0
-    grid_height = mask.shape[0] // grid_num_h
-    grid_width = mask.shape[1] // grid_num_w
-    if isinstance(config["GRID_THRESHOLD"], float):
-        assert config["GRID_THRESHOLD"] >= 0 and config["GRID_THRESHOLD"] <= 1
-        grid_threshold = config["GRID_THRESHOLD"] * grid_height * grid_width
-    else:
-        grid_threshold = config["GRID_THRESHOLD"]
-    mask_threshold = config["MASK_THRESHOLD"]
-    assert mask_threshold >= 0 and mask_threshold <= 1
-
-    mask = mask > mask_threshold
-    depth /= 1000  # mm->m
-
-    filtered = np.multiply(mask, depth)
-    grids = (
-        filtered.reshape(grid_num_h, grid_height, grid_num_w, grid_width)
-        .transpose(0, 2, 1, 3)
-        .reshape(grid_num_h * grid_num_w, grid_height * grid_width)
-    )
-    non_zero_num = np.where(grids > 0, np.ones_like(grids), np.zeros_like(grids)).sum(
-        axis=1
-    )
-    non_zero_num[non_zero_num == 0] = -1  # In case of getting nan
-    z = grids.sum(axis=1) / non_zero_num  # To get the mean value of the nonzeros
-
-    label = np.where(
-        non_zero_num > grid_threshold,
-        np.ones_like(non_zero_num),
-        np.zeros_like(non_zero_num),
-    )  # 0:background 1:obstacle
-
-    out = np.stack((label, z), axis=1)
-    return out.flatten()
+    # One-shot wrapper, prefer keeping a GridReducer for streams
+    return GridReducer(config, INPUT_SHAPE)(mask, depth).flatten()
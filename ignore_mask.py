@@ -0,0 +1,55 @@
+import numpy as np
+
+
+def polygons_mask(polygons, INPUT_SHAPE):
+    # True for the pixels inside any polygon, [[x,y],...] in pixels (even-odd)
+    width, height = INPUT_SHAPE
+    x, y = np.meshgrid(np.arange(width) + 0.5, np.arange(height) + 0.5)  # Centers
+    inside = np.zeros((height, width), dtype=bool)
+    for polygon in polygons:
+        polygon = np.asarray(polygon, dtype=np.float64)
+        crossings = np.zeros_like(inside)
+        for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+            if y0 == y1:
+                continue  # Horizontal edge
+            # Edges crossing the pixel's row on its right
+            spans = (y0 > y) != (y1 > y)
+            crossings ^= spans & (x < x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+        inside |= crossings
+    return inside
+
+
+def load_ignore_mask(config, INPUT_SHAPE):
+    # (H,W) True for the pixels not ignored by IGNORE_MASK, None if not set
+    ignore_mask = config.get("IGNORE_MASK")
+    if not ignore_mask:
+        return None
+    if isinstance(ignore_mask, str):
+        # Image, white(>127) for ignored
+        import cv2
+
+        image = cv2.imread(ignore_mask, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise FileNotFoundError(f"IGNORE_MASK: cannot read {ignore_mask}")
+        image = cv2.resize(image, tuple(INPUT_SHAPE), interpolation=cv2.INTER_NEAREST)
+        ignored = image > 127
+    else:
+        ignored = polygons_mask(ignore_mask, INPUT_SHAPE)
+    return ~ignored
+
+
+def grid_pixel_counts(valid, GRID_NUM):
+    # Pixels of each grid not ignored
+    height, width = valid.shape
+    return valid.reshape(
+        GRID_NUM[0], height // GRID_NUM[0], GRID_NUM[1], width // GRID_NUM[1]
+    ).sum(axis=(1, 3))
+
+
+def ignored_grids(config, INPUT_SHAPE):
+    # Grids mostly (more than half) ignored by IGNORE_MASK, for grids from a blob
+    valid = load_ignore_mask(config, INPUT_SHAPE)
+    if valid is None:
+        return np.zeros(config["GRID_NUM"], dtype=bool)
+    grid_size = valid.size // (config["GRID_NUM"][0] * config["GRID_NUM"][1])
+    return grid_pixel_counts(valid, config["GRID_NUM"]) * 2 < grid_size
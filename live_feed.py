@@ -0,0 +1,171 @@
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import yaml
+
+HEADER = 4096  # Layout (yaml) of the feed, for the readers
+
+
+def feed_layout(meta):
+    grid_shape = tuple(meta["GRID_SHAPE"])
+    layout = [
+        ("counter", np.int64, ()),  # Odd while being written
+        ("seq", np.int64, ()),
+        ("timestamp", np.float64, ()),  # Capture, in s, time.monotonic() clock
+        ("grids", np.float32, grid_shape + (3,)),  # label,z(in m),closing(in m/s)
+        ("xyz", np.float32, grid_shape + (3,)),  # Body frame (FRD), in m, 0 for none
+        ("count", np.int64, ()),  # Of points
+        ("points", np.float32, (meta["MAX_POINTS"], 3)),  # Obstacles, FRD, in m
+        ("images", np.int64, ()),  # Bits of those sent with the frame
+    ]
+    if meta["DECIMATION"]:
+        height, width = meta["IMAGE_SHAPE"]
+        layout += [
+            ("mask", np.uint8, (height, width)),  # 0-255
+            ("depth", np.uint16, (height, width)),  # in mm
+            ("img", np.uint8, (height, width, 3)),  # BGR
+        ]
+    return layout
+
+
+IMAGES = {"mask": 1, "depth": 2, "img": 4}  # Bits of the images field
+
+
+class LiveFeed:
+    # Latest results in named shared memory, any number of readers
+    # The writer never waits: readers retry when a frame is overwritten meanwhile
+    def __init__(self, name, meta=None, rays=None, origins=None):
+        # meta to create it (writer), with the body frame rays/origins of the grids
+        self.name = name
+        self.rays, self.origins = rays, origins
+        self.writer = meta is not None
+        if self.writer:
+            header = yaml.safe_dump(meta).encode()
+            assert len(header) < HEADER
+            size = HEADER + sum(
+                np.dtype(dtype).itemsize * int(np.prod(shape))
+                for _, dtype, shape in feed_layout(meta)
+            )
+            try:
+                self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            except FileExistsError:
+                # Left by an instance that did not exit cleanly
+                stale = shared_memory.SharedMemory(name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            self.shm.buf[: len(header)] = header
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            # Not ours to unlink when this process exits
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+            meta = yaml.safe_load(bytes(self.shm.buf[:HEADER]).rstrip(b"\0"))
+        self.meta = meta
+
+        self.fields = {}
+        offset = HEADER
+        for field, dtype, shape in feed_layout(meta):
+            self.fields[field] = np.ndarray(
+                shape, dtype, buffer=self.shm.buf, offset=offset
+            )
+            offset += self.fields[field].nbytes
+        self.counter = self.fields["counter"]
+        if self.writer:
+            self.counter[...] = 0
+        else:
+            # Copies of the last read frame, reused
+            self.frame = {
+                field: np.empty_like(value) for field, value in self.fields.items()
+            }
+            self.last = 0  # Counter of the last read frame, 0 before the first write
+            self.retries = 0  # Overwritten while copying
+
+    def write(self, seq, timestamp, grids=None, points=None, **images):
+        # grids: (GRID_SHAPE,2 or 3), points: (N,3) FRD, images: full size
+        # Points are those of the obstacle grids unless given
+        fields = self.fields
+        self.counter[...] += 1  # Odd
+        fields["seq"][...] = seq
+        fields["timestamp"][...] = timestamp
+        fields["grids"].fill(0)
+        xyz = fields["xyz"]
+        xyz.fill(0)
+        if grids is not None:
+            fields["grids"][..., : grids.shape[-1]] = grids
+            obstacle = grids[..., 0] > 0
+            np.multiply(self.rays, grids[..., 1:2], out=xyz)
+            xyz += self.origins
+            xyz[~obstacle] = 0
+            if points is None:
+                points = xyz[obstacle]
+        count = 0
+        if points is not None:
+            count = min(len(points), len(fields["points"]))
+            fields["points"][:count] = points[:count]
+        fields["count"][...] = count
+        bits = 0
+        d = self.meta["DECIMATION"]
+        height, width = self.meta["INPUT_SHAPE"][1], self.meta["INPUT_SHAPE"][0]
+        for name, image in images.items():
+            if not d or image is None:
+                continue
+            image = np.asarray(image)
+            if name == "mask":
+                image = image.reshape(height, width)
+                np.multiply(image[::d, ::d], 255, out=fields[name], casting="unsafe")
+            else:
+                np.copyto(fields[name], image[::d, ::d], casting="unsafe")
+            bits |= IMAGES[name]
+        fields["images"][...] = bits
+        self.counter[...] += 1  # Even, complete
+
+    def read(self, timeout=1.0, poll=0.005):
+        # The frame written after the last read one, None on timeout
+        # Copied, valid until the next read
+        deadline = time.monotonic() + timeout
+        while True:
+            counter = int(self.counter)
+            if counter % 2 == 0 and counter != self.last:
+                for field, value in self.fields.items():
+                    np.copyto(self.frame[field], value)
+                if int(self.counter) == counter:
+                    self.last = counter
+                    frame = dict(self.frame)
+                    frame["points"] = frame["points"][: int(frame["count"])]
+                    for name, bit in IMAGES.items():
+                        if not int(frame["images"]) & bit:
+                            frame[name] = None
+                    return frame
+                self.retries += 1
+                continue
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        # Views must go before the mapping
+        self.fields = self.frame = self.counter = None
+        self.shm.close()
+        if self.writer:
+            self.shm.unlink()
+
+
+def create_live_feed(config, INPUT_SHAPE, rays, origins):
+    # Writer of the LIVE feed, None if disabled
+    live = config.get("LIVE") or {}
+    if not live.get("ENABLE", False):
+        return None
+    d = live.get("DECIMATION", 2)  # Of the images, 0 for none
+    if INPUT_SHAPE is None:
+        # Grids only, e.g. CAMERAS reduced in their own processes
+        d, INPUT_SHAPE = 0, (0, 0)
+    width, height = INPUT_SHAPE[0], INPUT_SHAPE[1]
+    meta = {
+        "INPUT_SHAPE": [int(width), int(height)],
+        "GRID_SHAPE": [int(rays.shape[0]), int(rays.shape[1])],
+        "MAX_POINTS": live.get("MAX_POINTS", 256),
+        "DECIMATION": d,
+        "IMAGE_SHAPE": [-(-height // d), -(-width // d)] if d else [0, 0],
+    }
+    return LiveFeed(live.get("NAME", "oak_d_live"), meta, rays, origins)
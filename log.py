@@ -0,0 +1,182 @@
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+# Console color of each category
+COLORS = {"heartbeat": 45, "message": 44, "main": 46, "summary": 46}
+
+# Binary record: monotonic time(in s), category id, format id, number of args
+RECORD = struct.Struct("<dBHB")
+
+
+class Log:
+    # Never blocks the caller: records are queued, formatted and written by a thread
+    def __init__(self, size=4096):
+        self.records = deque(maxlen=size)  # Oldest dropped when full
+        self.start_time = time.monotonic()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.quiet = False
+        self.rate_limits = {}  # category -> interval in s
+        self.windows = {}  # category -> [start, count, last record]
+        self.binary = None
+        self.ids = {}  # category/format -> id, for the binary log
+
+        # Held while writing, and across fork() so a child never inherits it held
+        self.lock = threading.Lock()
+        os.register_at_fork(
+            before=self.lock.acquire,
+            after_in_parent=self.lock.release,
+            after_in_child=self.after_fork,
+        )
+
+    def start(self, config=None):
+        config = config or {}
+        self.quiet = config.get("QUIET", False)
+        self.rate_limits = config.get("RATE_LIMITS") or {}
+        if config.get("BINARY_PATH"):
+            self.binary = open(config["BINARY_PATH"], "wb")
+            self.binary_formats = open(config["BINARY_PATH"] + ".fmt", "w")
+        self.thread = threading.Thread(target=self.run, name="log", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()  # Flushes everything left
+            self.thread = None
+        else:
+            self.write([], final=True)
+        if self.binary is not None:
+            self.binary.close()
+            self.binary_formats.close()
+            self.binary = None
+
+    def info(self, category, fmt, *args):
+        # fmt % args is only evaluated if the line is printed
+        self._append((time.monotonic(), category, fmt, args, False))
+
+    def error(self, category, fmt, *args):
+        # Never rate limited or quieted
+        self._append((time.monotonic(), category, fmt, args, True))
+
+    def _append(self, record):
+        if self.thread is None:
+            self.write([record])  # Not started, synchronous
+        else:
+            self.records.append(record)  # O(1), thread-safe
+
+    def run(self):
+        while not self.stopped.wait(0.05):  # 20Hz flush
+            self.flush()
+        self.flush(final=True)
+
+    def flush(self, final=False):
+        # final: also the lines held back by open rate limit windows
+        records = []
+        while self.records:
+            records.append(self.records.popleft())
+        self.write(records, final)
+
+    def format(self, record, suffix=""):
+        timestamp, category, fmt, args, _ = record
+        current_time = round((timestamp - self.start_time) * 1000)  # in ms
+        text = fmt % args if args else fmt
+        color = COLORS.get(category, 46)
+        return f"\033[1;{color}m{current_time}\033[0m {text}{suffix}\n"
+
+    def write(self, records, final=False):
+        with self.lock:
+            lines = []
+            now = time.monotonic()
+            for record in records:
+                _, category, _, _, is_error = record
+                if self.binary is not None:
+                    self.write_binary(record)
+                if is_error:
+                    lines.append(self.format(record))
+                elif self.quiet and category != "summary":
+                    continue
+                elif self.rate_limits.get(category):
+                    # Only the latest one, with a count, once per interval
+                    window = self.windows.setdefault(category, [record[0], 0, None])
+                    window[1] += 1
+                    window[2] = record
+                else:
+                    lines.append(self.format(record))
+
+            for category, window in self.windows.items():
+                start, count, last = window
+                if count and (final or now - start >= self.rate_limits[category]):
+                    lines.append(
+                        self.format(last, f" ({count} in {now - start:.1f}s)")
+                        if count > 1
+                        else self.format(last)
+                    )
+                    window[:] = [now, 0, None]
+
+            if lines:
+                sys.stdout.write("".join(lines))
+                sys.stdout.flush()
+
+    def after_fork(self):
+        # In the child: no thread, and the parent's files are not ours
+        self.lock.release()
+        self.thread = None
+        self.records.clear()
+        self.binary = None
+
+    def binary_id(self, kind, name):
+        key = (kind, name)
+        if key not in self.ids:
+            self.ids[key] = len([k for k in self.ids if k[0] == kind])
+            self.binary_formats.write(
+                json.dumps({"kind": kind, "id": self.ids[key], "name": name}) + "\n"
+            )
+            self.binary_formats.flush()  # Rare, keeps the log readable after a crash
+        return self.ids[key]
+
+    def write_binary(self, record):
+        # Numbers only, anything else becomes nan
+        timestamp, category, fmt, args, _ = record
+        values = []
+        for arg in args:
+            try:
+                values.append(float(arg))
+            except (TypeError, ValueError):
+                values.append(math.nan)
+        self.binary.write(
+            RECORD.pack(
+                timestamp,
+                self.binary_id("category", category),
+                self.binary_id("format", fmt),
+                len(values),
+            )
+        )
+        self.binary.write(struct.pack(f"<{len(values)}d", *values))
+
+
+def read_binary(path):
+    # Yields (time, category, format, values) from a binary log
+    names = {"category": {}, "format": {}}
+    with open(path + ".fmt") as f:
+        for line in f:
+            entry = json.loads(line)
+            names[entry["kind"]][entry["id"]] = entry["name"]
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        timestamp, category, fmt, count = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        values = struct.unpack_from(f"<{count}d", data, offset)
+        offset += 8 * count
+        yield timestamp, names["category"][category], names["format"][fmt], values
+
+
+log = Log()  # Shared by all modules
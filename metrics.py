@@ -0,0 +1,172 @@
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Per frame stages, in order
+STAGES = ("capture", "receive", "detect", "queued", "written")
+CAPTURE, RECEIVE, DETECT, QUEUED, WRITTEN = range(len(STAGES))
+
+# Log-spaced latency bins, 10us to 100s
+BIN_NUM = 256
+BIN_MIN = 1e-5  # in s
+BIN_LOG_RATIO = math.log(1e7) / (BIN_NUM - 2)
+BIN_EDGES = BIN_MIN * np.exp(BIN_LOG_RATIO * np.arange(BIN_NUM - 1))  # Upper edges
+
+
+def finite(values):
+    # JSON has no nan/inf
+    return [v if math.isfinite(v) else None for v in values]
+
+
+class Metrics:
+    # Stage timestamps of recent frames, O(1) to record
+    def __init__(self, size=1024, interval=5.0, dump_path=None, http_port=0):
+        self.size = size  # Frames kept in the ring buffer
+        self.interval = interval  # Summary interval, in s
+        self.dump_path = dump_path
+
+        self.seq = np.full(size, -1, dtype=np.int64)
+        self.times = np.full((size, len(STAGES)), np.nan)  # time.monotonic()
+        self.bytes = np.zeros(size, dtype=np.int64)  # Written per frame
+
+        # Latency since capture, per stage: this summary window and in total
+        self.window = np.zeros((len(STAGES), BIN_NUM), dtype=np.int64)
+        self.total = np.zeros((len(STAGES), BIN_NUM), dtype=np.int64)
+        self.counts = np.zeros(len(STAGES), dtype=np.int64)  # Window, for FPS
+        self.bytes_window = 0
+        self.window_start = time.monotonic()
+        self.last_fps = None  # Of the last window
+
+        self.server = None
+        if http_port:
+            self.serve(http_port)
+
+    def mark(self, seq, stage, timestamp=None):
+        # stage: index in STAGES, timestamp: time.monotonic() clock
+        if timestamp is None:
+            timestamp = time.monotonic()
+        slot = seq % self.size
+        if self.seq[slot] != seq:  # First mark of this frame
+            self.seq[slot] = seq
+            self.times[slot] = np.nan
+            self.bytes[slot] = 0
+        self.times[slot, stage] = timestamp
+        self.counts[stage] += 1
+
+        latency = timestamp - self.times[slot, 0]  # nan before capture
+        if latency > BIN_MIN:
+            index = min(
+                int(math.log(latency / BIN_MIN) / BIN_LOG_RATIO) + 1, BIN_NUM - 1
+            )
+        elif latency >= 0:
+            index = 0
+        else:
+            return
+        self.window[stage, index] += 1
+        self.total[stage, index] += 1
+
+    def written(self, seq, nbytes, timestamp=None):
+        self.mark(seq, WRITTEN, timestamp)
+        self.bytes[seq % self.size] = nbytes
+        self.bytes_window += nbytes
+
+    @staticmethod
+    def percentiles(histogram, q=(50, 95, 99)):
+        # Upper edge of the bin holding each percentile, in s
+        total = histogram.sum()
+        if total == 0:
+            return [math.nan] * len(q)
+        index = np.searchsorted(np.cumsum(histogram), np.array(q) / 100 * total)
+        return np.append(BIN_EDGES, math.inf)[index].tolist()
+
+    def fps(self, stage=RECEIVE):
+        if self.last_fps is not None:
+            return self.last_fps[stage]
+        elapsed = time.monotonic() - self.window_start
+        return self.counts[stage] / elapsed if elapsed > 0 else 0.0
+
+    def due(self):
+        return time.monotonic() - self.window_start >= self.interval
+
+    def summary(self):
+        # One line for the window, then starts a new window
+        elapsed = max(time.monotonic() - self.window_start, 1e-9)
+        parts = []
+        for stage, name in enumerate(STAGES):
+            if not self.total[stage].any():
+                continue  # Never marked, e.g. nothing published by test.py
+            if stage == 0:
+                parts.append(f"{name} {self.counts[stage] / elapsed:.1f}fps")
+                continue
+            p50, p95, p99 = self.percentiles(self.window[stage])
+            parts.append(
+                f"{name} {self.counts[stage] / elapsed:.1f}fps "
+                f"p50/95/99 {p50 * 1000:.1f}/{p95 * 1000:.1f}/{p99 * 1000:.1f}ms"
+            )
+        parts.append(f"{self.bytes_window / elapsed:.0f}B/s")
+        self.last_fps = self.counts / elapsed
+        self.window.fill(0)
+        self.counts.fill(0)
+        self.bytes_window = 0
+        self.window_start = time.monotonic()
+        return ", ".join(parts)
+
+    def snapshot(self):
+        # Everything, JSON serializable
+        valid = self.seq >= 0
+        order = np.argsort(self.seq[valid])
+        return {
+            "stages": STAGES,
+            "latency": {
+                name: dict(
+                    zip(("p50", "p95", "p99"), finite(self.percentiles(self.total[i])))
+                )
+                for i, name in enumerate(STAGES)
+                if i > 0
+            },
+            "histogram": {
+                "upper_edges": finite(np.append(BIN_EDGES, math.inf).tolist()),
+                "counts": {
+                    name: self.total[i].tolist() for i, name in enumerate(STAGES)
+                },
+            },
+            "frames": {
+                "seq": self.seq[valid][order].tolist(),
+                "times": [finite(row) for row in self.times[valid][order].tolist()],
+                "bytes": self.bytes[valid][order].tolist(),
+            },
+        }
+
+    def dump(self, path=None):
+        path = path or self.dump_path
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f)
+        return path
+
+    def serve(self, port):
+        # GET http://127.0.0.1:port/ for the snapshot
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Quiet
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
@@ -0,0 +1,117 @@
+import numpy as np
+
+from ignore_mask import load_ignore_mask
+from z2xy import frd_rays
+
+
+def undistort(x, y, distortion, iterations=10):
+    # Distorted to ideal normalized coordinates, as cv2.undistortPoints does
+    # distortion: k1,k2,p1,p2[,k3[,k4,k5,k6]], others (e.g. thin prism) ignored
+    k = np.zeros(8)
+    k[: min(len(distortion), 8)] = distortion[:8]
+    k1, k2, p1, p2, k3, k4, k5, k6 = k
+    x0, y0 = x, y
+    for _ in range(iterations):
+        r2 = x * x + y * y
+        icdist = (1 + ((k6 * r2 + k5) * r2 + k4) * r2) / (
+            1 + ((k3 * r2 + k2) * r2 + k1) * r2
+        )
+        delta_x = 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+        delta_y = p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+        x = (x0 - delta_x) * icdist
+        y = (y0 - delta_y) * icdist
+    return x, y
+
+
+class PointCloud:
+    # Masked depth pixels to body frame (FRD) points, voxel downsampled
+    def __init__(
+        self, config, INPUT_SHAPE, intrinsics=None, hfov=None, distortion=None
+    ):
+        point_cloud = config.get("POINT_CLOUD") or {}
+        self.stride = point_cloud.get("STRIDE", 2)  # in pixels
+        self.voxel = point_cloud.get("VOXEL", 0.5)  # in m
+        self.min_points = point_cloud.get("MIN_POINTS", 3)  # Per voxel, noise
+        self.nearest = point_cloud.get("NEAREST", 8)  # Obstacles per frame
+        self.mask_threshold = config["MASK_THRESHOLD"]
+        self.max_depth = config["MAX_DISTANCE"] * 1000  # in mm
+        self.width, self.height = INPUT_SHAPE[0], INPUT_SHAPE[1]
+
+        # Pixel ray tables, computed once (sampled pixels only)
+        if config["USE_INTRINSIC"]:
+            intrinsics = np.array(intrinsics)
+        else:
+            # Use HFOV only (assuming fx==fy)
+            f = (self.width / 2) / np.tan(hfov / 180 * np.pi / 2)
+            intrinsics = np.array(
+                [[f, 0, self.width / 2], [0, f, self.height / 2], [0, 0, 1]]
+            )
+        u, v = np.meshgrid(
+            np.arange(0, self.width, self.stride),
+            np.arange(0, self.height, self.stride),
+        )
+        x = (u - intrinsics[0, 2]) / intrinsics[0, 0]
+        y = (v - intrinsics[1, 2]) / intrinsics[1, 1]
+        if point_cloud.get("UNDISTORT", True) and distortion is not None:
+            x, y = undistort(x, y, np.asarray(distortion, dtype=np.float64))
+        rays, origins = frd_rays(x, -y, config.get("MOUNT"))
+        self.rays = rays.reshape(-1, 3)
+        self.origin = origins[0, 0]
+
+        # IGNORE_GRIDS and IGNORE_MASK, per sampled pixel
+        grid_height = self.height // config["GRID_NUM"][0]
+        grid_width = self.width // config["GRID_NUM"][1]
+        upper, lower, left, right = config["IGNORE_GRIDS"]
+        self.valid = (
+            (v >= upper * grid_height)
+            & (v < self.height - lower * grid_height)
+            & (u >= left * grid_width)
+            & (u < self.width - right * grid_width)
+        )
+        valid = load_ignore_mask(config, INPUT_SHAPE)
+        if valid is not None:
+            self.valid &= valid[v, u]
+
+        # Scratch buffers (sampled frame)
+        shape = u.shape
+        self._obstacle = np.empty(shape, dtype=bool)
+        self._in_range = np.empty(shape, dtype=bool)
+        self._depth = np.empty(shape, dtype=np.uint16)
+        # Voxel keys packed into one int64, within +-MAX_DISTANCE
+        self.key_range = int(np.ceil(config["MAX_DISTANCE"] / self.voxel)) + 2
+
+    def __call__(self, mask, depth):
+        # Returns (N,3) body frame points in m, nearest first, N<=NEAREST
+        mask = np.asarray(mask).reshape(self.height, self.width)  # No copy
+        depth = np.asarray(depth).reshape(self.height, self.width)
+        sampled = (slice(None, None, self.stride), slice(None, None, self.stride))
+
+        np.greater(mask[sampled], self.mask_threshold, out=self._obstacle)
+        np.copyto(self._depth, depth[sampled])
+        np.greater(self._depth, 0, out=self._in_range)
+        self._obstacle &= self._in_range
+        np.less_equal(self._depth, self.max_depth, out=self._in_range)
+        self._obstacle &= self._in_range
+        self._obstacle &= self.valid
+
+        index = np.flatnonzero(self._obstacle)
+        z = self._depth.reshape(-1)[index] / 1000  # in m
+        points = self.origin + self.rays[index] * z[:, None]
+
+        # Voxel downsampling: nearest point of each voxel with enough points
+        keys = np.floor(points / self.voxel).astype(np.int64) + self.key_range
+        keys = (keys[:, 0] * (2 * self.key_range) + keys[:, 1]) * (
+            2 * self.key_range
+        ) + keys[:, 2]
+        distance = np.linalg.norm(points, axis=1)
+        order = np.lexsort((distance, keys))  # By voxel, nearest first
+        _, first, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        first = order[first[counts >= self.min_points]]
+
+        # The nearest voxels
+        if len(first) > self.nearest:
+            first = first[
+                np.argpartition(distance[first], self.nearest)[: self.nearest]
+            ]
+        first = first[np.argsort(distance[first])]
+        return points[first]
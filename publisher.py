@@ -0,0 +1,253 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from attitude import AttitudeProjection
+from log import log
+from scheduler import MessageScheduler
+from tracker import GridTracker
+from z2xy import deduplicate, grids2frd, ignore_grids_mask
+
+SECTOR_NUM = 72  # OBSTACLE_DISTANCE.distances
+
+# One frame's messages, to be written after delay(in s)
+Batch = namedtuple(
+    "Batch", ["timestamp", "delay", "count", "distances", "index", "points", "empty"]
+)
+
+
+class ObstaclePublisher:
+    # Turns each frame into one batch of messages (no waiting/threading here)
+    def __init__(self, config, writer, get_current_time):
+        self.config = config
+        self.writer = writer  # MavlinkWriter
+        self.get_current_time = get_current_time  # For timestamps, in ms
+        self.message_interval_min = 1 / config["MESSAGE_RATE_MAX"]  # in s
+        self.valid = ignore_grids_mask(config)
+        self.rays = self.origins = None  # Must be set before publishing
+        self.mode = config.get("MESSAGE_MODE", "3D")  # 3D/DISTANCE/HYBRID
+        assert self.mode in ("3D", "DISTANCE", "HYBRID")
+        self.hybrid_nearest = config.get("HYBRID_NEAREST", 3)
+        self.voxel = config.get("FUSION_VOXEL", 1.0) if config.get("CAMERAS") else 0
+        self.scheduler = MessageScheduler(
+            config, {"3D": self.encoded_size("3D"), "DISTANCE": self.encoded_size()}
+        )
+
+        self.next_send = 0  # time.monotonic() of the next allowed message
+
+        # Only changes are reported when tracking, updated by the runtime
+        self.tracker = None
+        if (config.get("TRACKER") or {}).get("ENABLE", False):
+            self.tracker = GridTracker(config)
+
+        # Horizon from the autopilot's attitude, set with the projection
+        self.attitude = None
+
+    def set_projection(self, rays, origins):
+        # rays, origins: (GRID_NUM, 3) body frame (FRD), see z2xy.frd_rays
+        self.rays, self.origins = rays, origins
+        if (self.config.get("ATTITUDE") or {}).get("ENABLE", False):
+            self.attitude = AttitudeProjection(self.config, rays, self.valid)
+
+        # Azimuth of each grid column's edges, from its center ray
+        center = np.degrees(np.arctan2(rays[..., 1].sum(0), rays[..., 0].sum(0)))
+        cameras = max(len(self.config.get("CAMERAS") or []), 1)
+        lower, upper = [], []
+        for camera in np.split(center, cameras):  # Side by side
+            camera = np.degrees(np.unwrap(np.radians(camera)))
+            if len(camera) > 1:
+                half = np.diff(camera) / 2
+                edges = np.concatenate(
+                    ([camera[0] - half[0]], camera[:-1] + half, [camera[-1] + half[-1]])
+                )
+            else:  # Single column, assuming symmetric
+                edges = np.array([camera[0] - 1, camera[0] + 1])
+            lower.append(edges[:-1])
+            upper.append(edges[1:])
+        lower, upper = np.concatenate(lower), np.concatenate(upper)
+
+        # OBSTACLE_DISTANCE sectors spread over the FOV
+        self.angle_offset = float(lower.min())  # in degree, FRD (clockwise)
+        span = min(float(upper.max() - lower.min()), 360)
+        self.increment_f = span / SECTOR_NUM  # in degree
+        sector_center = self.angle_offset + self.increment_f * (
+            np.arange(SECTOR_NUM) + 0.5
+        )
+        # Grid columns covering each sector
+        self.sector_cover = (sector_center[:, None] - lower) % 360 < upper - lower
+        self.column_distance = np.empty(len(center), dtype=np.float64)  # in cm
+
+    def drop(self, grids):
+        # A frame superseded before being planned
+        obstacle = (grids[..., 0] > 0) & self.valid
+        self.scheduler.drop(max(np.count_nonzero(obstacle), 1))
+
+    def rate_limit(self, count):
+        # MESSAGE_RATE_MAX Hz on average, no wait if the link has been idle
+        now = time.monotonic()
+        delay = max(self.next_send - now, 0)
+        self.next_send = now + delay + self.message_interval_min * count
+        return delay
+
+    def plan(self, grids, timestamp):
+        # grids: (GRID_NUM, 2) label,z(in m), plus closing speed(in m/s) if tracked
+        # timestamp: capture time, time.monotonic() clock
+        rotation, valid = None, self.valid
+        if self.attitude is not None:
+            # Cells above/below the horizon at this attitude
+            rotation, valid = self.attitude.at(timestamp)
+        index, points = grids2frd(grids, self.rays, self.origins, valid)
+        if self.voxel:
+            # Overlapping cameras
+            keep = deduplicate(points, self.voxel)
+            index, points = index[keep], points[keep]
+        closing = grids[..., 2].flat[index] if grids.shape[-1] > 2 else None
+        changed, frame_due = None, True
+        if self.tracker is not None:
+            changed, frame_due = self.tracker.changes(grids, valid, timestamp)
+
+        message_types = []
+        distances = None
+        if self.mode != "3D" and frame_due:
+            # One message for the whole frame
+            distances = self.sector_distances(index, points, rotation)
+            message_types.append("DISTANCE")
+        empty = len(index) == 0 and self.mode == "3D" and frame_due  # "No obstacle"
+        if self.mode != "DISTANCE":
+            if changed is not None:
+                keep = changed.flat[index]
+                index, points, closing = index[keep], points[keep], closing[keep]
+            # Most urgent first, within the link budget
+            index, points = self.scheduler.rank(index, points, timestamp, closing)
+            if self.mode == "HYBRID":
+                # Plus 3D messages for the most urgent grids only
+                points = points[: self.hybrid_nearest]
+        else:
+            points = points[:0]
+        message_types += ["3D"] * max(len(points), empty)
+        if self.tracker is not None:
+            self.tracker.reported(
+                grids,
+                valid,
+                index[: len(points)],
+                timestamp,
+                distances is not None or empty,
+            )
+
+        return self._batch(timestamp, message_types, distances, index, points, empty)
+
+    def plan_points(self, points, timestamp):
+        # Point cloud mode: (N,3) body frame points(in m), not tied to grids
+        message_types = []
+        distances = None
+        if self.mode != "3D":
+            distances = self.point_sector_distances(points)
+            message_types.append("DISTANCE")
+        empty = len(points) == 0 and self.mode == "3D"  # "No obstacle"
+        index = np.arange(len(points))
+        if self.mode != "DISTANCE":
+            # No history per point, nearest first
+            index, points = self.scheduler.rank(
+                index, points, timestamp, np.zeros(len(points))
+            )
+            if self.mode == "HYBRID":
+                points = points[: self.hybrid_nearest]
+        else:
+            points = points[:0]
+        message_types += ["3D"] * max(len(points), empty)
+        return self._batch(timestamp, message_types, distances, index, points, empty)
+
+    def _batch(self, timestamp, message_types, distances, index, points, empty):
+        # Wait for the link once, then write the whole frame at once
+        delay = 0
+        if message_types:
+            delay = max(
+                self.rate_limit(len(message_types)),
+                self.scheduler.acquire(message_types),
+            )
+        return Batch(
+            timestamp, delay, len(message_types), distances, index, points, empty
+        )
+
+    def write(self, batch):
+        # Blocking, one write syscall, returns bytes written
+        current_time = self.get_current_time()
+        with self.writer:
+            if batch.distances is not None:
+                self.writer.message(
+                    self.writer.mav.obstacle_distance_encode(
+                        current_time * 1000,  # UNIX Timestamp in us
+                        4,  # MAV_DISTANCE_SENSOR_UNKNOWN
+                        batch.distances.tolist(),  # in cm
+                        0,  # Use increment_f instead
+                        int(self.config["MIN_DISTANCE"] * 100),  # in cm
+                        int(self.config["MAX_DISTANCE"] * 100),  # in cm
+                        self.increment_f,  # in degree
+                        self.angle_offset,  # in degree
+                        12,  # MAV_FRAME_BODY_FRD
+                    )
+                )
+            if batch.empty:
+                # "No obstacle" message (MAX_DISTANCE+1)
+                value = float(self.config["MAX_DISTANCE"] + 1)
+                self.writer.obstacle_distance_3d(current_time, value, value, value)
+            for z, x, y in batch.points.tolist():  # FRD, in m
+                self.writer.obstacle_distance_3d(current_time, z, x, y)
+
+        if batch.distances is not None:
+            log.info(
+                "message",
+                "Distances: %d obstacle sectors, nearest %.2fm",
+                np.count_nonzero(batch.distances <= self.config["MAX_DISTANCE"] * 100),
+                batch.distances.min() / 100,
+            )
+        if batch.empty:
+            log.info("message", "No obstacle")
+        for z, x, y in batch.points.tolist():
+            log.info("message", "x:%.2fm y:%.2fm z:%.2fm", x, -y, z)
+        return len(self.writer.last_frame)  # in bytes
+
+    def encoded_size(self, message_type="DISTANCE"):
+        # Encoded size of a message on the link, in bytes
+        mav = self.writer.mav
+        if message_type == "3D":
+            message = mav.obstacle_distance_3d_encode(0, 4, 12, 65535, 0, 0, 0, 0, 0)
+        else:
+            message = mav.obstacle_distance_encode(
+                0, 4, [0] * SECTOR_NUM, 0, 0, 0, 0, 0, 12
+            )
+        return len(message.pack(mav))
+
+    def sector_distances(self, index, points, rotation=None):
+        # Nearest horizontal distance of each sector, MAX_DISTANCE+1 for none
+        # rotation: body to level frame, horizontal in the level frame if given
+        if rotation is not None:
+            points = points @ rotation.T
+        none = (self.config["MAX_DISTANCE"] + 1) * 100
+        self.column_distance.fill(none)
+        np.minimum.at(
+            self.column_distance,
+            index % self.rays.shape[1],
+            np.hypot(points[:, 0], points[:, 1]) * 100,
+        )
+        distances = np.min(
+            np.broadcast_to(self.column_distance, self.sector_cover.shape),
+            axis=1,
+            initial=none,
+            where=self.sector_cover,
+        )
+        return distances.astype(np.uint16)  # in cm
+
+    def point_sector_distances(self, points):
+        # Nearest horizontal distance of each sector, from each point's azimuth
+        distances = np.full(SECTOR_NUM, (self.config["MAX_DISTANCE"] + 1) * 100.0)
+        azimuth = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+        sector = ((azimuth - self.angle_offset) % 360 // self.increment_f).astype(int)
+        inside = sector < SECTOR_NUM
+        np.minimum.at(
+            distances,
+            sector[inside],
+            np.hypot(points[inside, 0], points[inside, 1]) * 100,
+        )
+        return distances.astype(np.uint16)  # in cm
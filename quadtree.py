@@ -0,0 +1,135 @@
+import numpy as np
+
+from ignore_mask import grid_pixel_counts, load_ignore_mask
+from z2xy import frd_rays, ignore_grids_mask, z2xy_grid
+
+
+class QuadtreeReducer:
+    # GRID_NUM grids, obstacle ones split in four down to LEVELS, nearest first
+    # Every cell costs O(1) from summed-area tables of the finest cells
+    def __init__(self, config, INPUT_SHAPE, intrinsics=None, hfov=None):
+        quadtree = config.get("QUADTREE") or {}
+        self.levels = quadtree.get("LEVELS", 2)  # Splits below GRID_NUM
+        self.refine_distance = quadtree.get("REFINE_DISTANCE", 10)  # in m
+        self.nearest = quadtree.get("NEAREST", 8)  # Obstacles per frame
+        # Depth sums only, a percentile does not add up over summed-area tables
+        statistic = (config.get("GRID_STATISTIC") or {}).get("TYPE", "mean")
+        assert statistic == "mean", "QUADTREE needs GRID_STATISTIC mean"
+        self.width, self.height = INPUT_SHAPE[0], INPUT_SHAPE[1]
+        self.grid_num = np.array(config["GRID_NUM"])
+        assert self.height % (self.grid_num[0] << self.levels) == 0
+        assert self.width % (self.grid_num[1] << self.levels) == 0
+
+        # IGNORE_MASK pixels are never over the mask threshold
+        self.mask_threshold = config["MASK_THRESHOLD"]
+        assert self.mask_threshold >= 0 and self.mask_threshold <= 1
+        valid = load_ignore_mask(config, INPUT_SHAPE)
+        if valid is not None:
+            self.mask_threshold = np.where(
+                valid, np.float16(self.mask_threshold), np.float16(np.inf)
+            )
+
+        # Tables of each level: cell size, obstacle threshold and body frame rays
+        self.cell_shape, self.threshold, self.rays = [], [], []
+        for level in range(self.levels + 1):
+            grid_num = [int(n) << level for n in self.grid_num]
+            self.cell_shape.append(
+                (self.height // grid_num[0], self.width // grid_num[1])
+            )
+            if isinstance(config["GRID_THRESHOLD"], float):
+                assert config["GRID_THRESHOLD"] >= 0 and config["GRID_THRESHOLD"] <= 1
+                size = np.prod(self.cell_shape[-1])  # Pixels not ignored
+                if valid is not None:
+                    size = grid_pixel_counts(valid, grid_num)
+                threshold = np.broadcast_to(config["GRID_THRESHOLD"] * size, grid_num)
+            else:  # Pixels of a GRID_NUM grid, a quarter per level
+                threshold = np.full(grid_num, config["GRID_THRESHOLD"] / 4**level)
+            self.threshold.append(threshold)
+            level_config = dict(config, GRID_NUM=grid_num)
+            z2x, z2y = z2xy_grid(level_config, INPUT_SHAPE, intrinsics, hfov)
+            rays, origins = frd_rays(z2x, z2y, config.get("MOUNT"))
+            self.rays.append(rays)
+        self.origin = origins[0, 0]
+        self.valid = ignore_grids_mask(config)  # IGNORE_GRIDS, of GRID_NUM
+
+        # Summed-area tables of the finest cells, zero first row and column
+        shape = (self.height, self.width)
+        self._mask = np.empty(shape, dtype=bool)
+        self._valid = np.empty(shape, dtype=bool)
+        self._filtered = np.empty(shape, dtype=np.uint16)  # in mm
+        finest = (
+            int(self.grid_num[0]) << self.levels,
+            int(self.grid_num[1]) << self.levels,
+        )
+        self._count = np.zeros((finest[0] + 1, finest[1] + 1), dtype=np.int64)
+        self._sum = np.zeros((finest[0] + 1, finest[1] + 1), dtype=np.int64)
+        self.cells = 0  # Evaluated in the last frame
+
+    def _split(self, frame):
+        # (H,W)->(FINEST_H,cell_height,FINEST_W,cell_width), a view
+        finest = self._count.shape[0] - 1, self._count.shape[1] - 1
+        cell_height, cell_width = self.cell_shape[-1]
+        return frame.reshape(finest[0], cell_height, finest[1], cell_width)
+
+    def _cells(self, table, level, rows, cols):
+        # Sums of the level's cells (rows, cols), O(1) each from a summed-area table
+        size = 1 << (self.levels - level)  # in finest cells
+        top, left = rows * size, cols * size
+        bottom, right = top + size, left + size
+        return (
+            table[bottom, right]
+            - table[top, right]
+            - table[bottom, left]
+            + table[top, left]
+        )
+
+    def __call__(self, mask, depth):
+        # Returns (N,3) body frame points in m, nearest first, N<=NEAREST
+        mask = np.asarray(mask).reshape(self.height, self.width)  # No copy
+        depth = np.asarray(depth).reshape(self.height, self.width)
+
+        np.greater(mask, self.mask_threshold, out=self._mask)
+        np.multiply(depth, self._mask, out=self._filtered)
+        np.not_equal(self._filtered, 0, out=self._valid)
+        for table, frame in ((self._count, self._valid), (self._sum, self._filtered)):
+            cells = table[1:, 1:]
+            np.sum(self._split(frame), axis=(1, 3), out=cells)
+            np.cumsum(cells, axis=0, out=cells)
+            np.cumsum(cells, axis=1, out=cells)
+
+        rows, cols = np.nonzero(self.valid)
+        self.cells, points = 0, []
+        parent = None  # Index of each cell's parent in the previous level
+        for level in range(self.levels + 1):
+            self.cells += len(rows)
+            pixels = self._cells(self._count, level, rows, cols)
+            obstacle = pixels > self.threshold[level][rows, cols]
+            z = self._cells(self._sum, level, rows, cols) / np.maximum(pixels, 1)
+            z /= 1000  # mm->m
+            if parent is not None:
+                # Split cells without any obstacle quarter stay whole
+                found = np.bincount(parent, obstacle, minlength=len(split_rows))
+                keep = found == 0
+                point_rows, point_cols = split_rows[keep], split_cols[keep]
+                points.append(
+                    self.origin
+                    + self.rays[level - 1][point_rows, point_cols] * split_z[keep, None]
+                )
+            split = obstacle & (z < self.refine_distance) & (level < self.levels)
+            leaf = obstacle & ~split
+            points.append(
+                self.origin + self.rays[level][rows[leaf], cols[leaf]] * z[leaf, None]
+            )
+            if not split.any():
+                break
+
+            # The four quarters of each split cell
+            split_rows, split_cols, split_z = rows[split], cols[split], z[split]
+            parent = np.repeat(np.arange(len(split_rows)), 4)
+            rows = (split_rows[:, None] * 2 + [0, 0, 1, 1]).reshape(-1)
+            cols = (split_cols[:, None] * 2 + [0, 1, 0, 1]).reshape(-1)
+
+        points = np.concatenate(points)
+        distance = np.linalg.norm(points, axis=1)
+        order = np.argsort(distance, kind="stable")[: self.nearest]
+        return points[order]
@@ -0,0 +1,299 @@
+import asyncio
+import functools
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pymavlink import mavutil
+
+from depth_filter import create_depth_filter
+from flight_recorder import FlightRecorder
+from host_side_detection import GridReducer
+from ignore_mask import ignored_grids
+from live_feed import create_live_feed
+from log import log
+from metrics import CAPTURE, DETECT, QUEUED, RECEIVE
+from point_cloud import PointCloud
+from quadtree import QuadtreeReducer
+
+
+class LatestChannel:
+    # Bounded (size 1) channel, a new value replaces the unread one
+    def __init__(self, on_drop=None):
+        self.value = None
+        self.event = asyncio.Event()
+        self.on_drop = on_drop  # Called with the replaced value
+
+    def put(self, value):
+        if self.event.is_set() and self.on_drop is not None:
+            self.on_drop(self.value)
+        self.value = value
+        self.event.set()
+
+    async def get(self):
+        await self.event.wait()
+        self.event.clear()
+        value, self.value = self.value, None
+        return value
+
+
+class Runtime:
+    # Acquisition -> detection -> publishing, plus heartbeat (and attitude)
+    def __init__(self, config, source, publisher, writer, metrics):
+        self.config = config
+        self.source = source
+        self.publisher = publisher
+        self.writer = writer
+        self.metrics = metrics
+        self.frame_timeout = config.get("FRAME_TIMEOUT", 5)  # in s
+
+        # Blocking calls, one thread each so they never wait on each other
+        self.acquire_executor = ThreadPoolExecutor(1, "acquire")
+        self.write_executor = ThreadPoolExecutor(1, "write")  # Serialized writes
+        self.receive_executor = ThreadPoolExecutor(1, "receive")
+
+        self.reducer = self.depth_filter = None
+        if config["HOST_SIDE"] and not source.reduced:
+            self.depth_filter = create_depth_filter(config, source.INPUT_SHAPE)
+        point_cloud = (config.get("POINT_CLOUD") or {}).get("ENABLE", False)
+        quadtree = (config.get("QUADTREE") or {}).get("ENABLE", False)
+        assert not (point_cloud and quadtree), "POINT_CLOUD or QUADTREE, not both"
+        self.point_cloud = self.create_point_cloud()
+        if self.point_cloud is None and config["HOST_SIDE"] and not source.reduced:
+            self.reducer = GridReducer(config, source.INPUT_SHAPE)
+
+        # IGNORE_MASK of grids from the blob, the reducer applies it per pixel
+        self.ignored = None
+        if not config["HOST_SIDE"] and not source.reduced:
+            self.ignored = ignored_grids(config, source.INPUT_SHAPE)
+
+        self.recorder = None
+        if (config.get("RECORDER") or {}).get("ENABLE", False):
+            self.recorder = FlightRecorder(config, source.INPUT_SHAPE)
+        self.live = create_live_feed(
+            config, source.INPUT_SHAPE, publisher.rays, publisher.origins
+        )
+
+    def create_point_cloud(self):
+        # Points instead of grids, None for grids
+        config, source = self.config, self.source
+        if (config.get("POINT_CLOUD") or {}).get("ENABLE", False):
+            # Needs every pixel
+            assert config["HOST_SIDE"] and not source.reduced
+            return PointCloud(
+                config,
+                source.INPUT_SHAPE,
+                source.intrinsics,
+                source.hfov,
+                source.distortion,
+            )
+        if (config.get("QUADTREE") or {}).get("ENABLE", False):
+            # Points of the leaves instead of grids, as the point cloud
+            assert config["HOST_SIDE"] and not source.reduced
+            return QuadtreeReducer(
+                config, source.INPUT_SHAPE, source.intrinsics, source.hfov
+            )
+        return None
+
+    def reproject(self):
+        # The source's calibration changed (stale cache), between two frames
+        self.source.calibration_changed = False
+        self.publisher.set_projection(*self.source.projection(self.config))
+        if self.point_cloud is not None:
+            self.point_cloud = self.create_point_cloud()
+        if self.live is not None:
+            self.live.rays = self.publisher.rays
+            self.live.origins = self.publisher.origins
+
+    async def acquire(self, frames):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await asyncio.wait_for(
+                loop.run_in_executor(self.acquire_executor, self.source.get),
+                self.frame_timeout,
+            )
+            if frame is None:
+                log.info("main", "Source exhausted")
+                return
+            self.metrics.mark(frame.seq, CAPTURE, frame.timestamp)
+            self.metrics.mark(frame.seq, RECEIVE)
+            frames.put(frame)
+
+    async def detect(self, frames, grids):
+        shape = (self.config["GRID_NUM"][0], self.config["GRID_NUM"][1], 2)
+        while True:
+            frame = await frames.get()
+            if self.source.calibration_changed:
+                self.reproject()
+            depth = frame.depth
+            if self.depth_filter is not None:
+                depth = self.depth_filter(depth)
+            if self.point_cloud is not None:
+                # (N,3) points instead of grids
+                out = self.point_cloud(mask=frame.nn, depth=depth)
+            else:
+                if self.reducer is not None:
+                    out = self.reducer(mask=frame.nn, depth=depth)
+                else:
+                    out = frame.nn
+                # Copy, the reducer's output is reused
+                out = np.array(out, dtype=np.float64).reshape(shape)
+                if self.ignored is not None:
+                    out[self.ignored, 0] = 0
+                if self.publisher.tracker is not None:
+                    # Every frame, including those superseded before publishing
+                    out = self.publisher.tracker.update(out, frame.timestamp)
+            # Pixels only when detected here, grids unless points
+            pixels = self.reducer is not None or self.point_cloud is not None
+            if self.recorder is not None:
+                self.recorder.record(
+                    frame.seq,
+                    frame.timestamp,
+                    frame.nn if pixels else None,
+                    depth if pixels else None,
+                    out if self.point_cloud is None else None,
+                )
+            if self.live is not None:
+                self.live.write(
+                    frame.seq,
+                    frame.timestamp,
+                    grids=out if self.point_cloud is None else None,
+                    points=out if self.point_cloud is not None else None,
+                    mask=frame.nn if pixels else None,
+                    depth=depth,
+                    img=frame.img,
+                )
+            self.metrics.mark(frame.seq, DETECT)
+            grids.put((out, frame.timestamp, frame.seq))
+
+    async def publish(self, grids):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame, timestamp, seq = await grids.get()
+            if self.point_cloud is not None:
+                batch = self.publisher.plan_points(frame, timestamp)
+            else:
+                batch = self.publisher.plan(frame, timestamp)
+            if batch.delay > 0:
+                await asyncio.sleep(batch.delay)  # Link budget
+            self.metrics.mark(seq, QUEUED)
+            nbytes = 0  # Nothing changed when tracking
+            if batch.count:
+                nbytes = await loop.run_in_executor(
+                    self.write_executor, self.write, batch, seq
+                )
+            self.metrics.written(seq, nbytes)
+
+    def write(self, batch, seq):
+        # Write thread, the frame's bytes stay valid until the next write
+        nbytes = self.publisher.write(batch)
+        if self.recorder is not None:
+            self.recorder.messages(seq, self.writer.last_frame)
+        return nbytes
+
+    async def heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = self.writer.mav.heartbeat_encode(
+                mavutil.mavlink.MAV_TYPE_ONBOARD_CONTROLLER,
+                mavutil.mavlink.MAV_AUTOPILOT_INVALID,
+                0,
+                0,
+                0,
+            )
+            await loop.run_in_executor(self.write_executor, self.writer.send, message)
+            log.info("heartbeat", "Heartbeat sent")
+            await asyncio.sleep(1)  # 1Hz
+
+    async def attitude(self):
+        # ATTITUDE from the autopilot, the only reader of the connection
+        loop = asyncio.get_running_loop()
+        receive = functools.partial(
+            self.writer.connection.recv_match,
+            type="ATTITUDE",
+            blocking=True,
+            timeout=1,
+        )
+        while True:
+            message = await loop.run_in_executor(self.receive_executor, receive)
+            if message is not None:
+                self.publisher.attitude.update(message)
+                continue
+            # None for 1s, (re)request the stream, e.g. after an autopilot reboot
+            message = self.writer.mav.command_long_encode(
+                1,  # Autopilot
+                1,
+                mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+                0,
+                mavutil.mavlink.MAVLINK_MSG_ID_ATTITUDE,
+                1e6 / self.publisher.attitude.rate,  # in us
+                0,
+                0,
+                0,
+                0,
+                0,
+            )
+            await loop.run_in_executor(self.write_executor, self.writer.send, message)
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.metrics.interval)
+            reports = [
+                self.metrics.summary(),
+                "messages: " + self.publisher.scheduler.report(),
+            ]
+            if self.publisher.attitude is not None:
+                reports.append("attitude: " + self.publisher.attitude.report())
+            if self.recorder is not None:
+                reports.append("recorder: " + self.recorder.report())
+            source = self.source.report()  # e.g. frame sync
+            if source:
+                reports.append(source)
+            log.info("summary", "%s", ", ".join(reports))
+
+    def drop(self, value):
+        # A detection superseded before being published
+        if self.point_cloud is not None:
+            self.publisher.scheduler.drop(max(len(value[0]), 1))
+        else:
+            self.publisher.drop(value[0])
+
+    def dump(self):
+        # On SIGUSR1
+        path = self.metrics.dump()
+        log.info("main", "Metrics dumped to %s", path)
+
+    async def run(self):
+        frames = LatestChannel()
+        grids = LatestChannel(on_drop=self.drop)
+        tasks = [
+            asyncio.create_task(self.acquire(frames), name="acquire"),
+            asyncio.create_task(self.detect(frames, grids), name="detect"),
+            asyncio.create_task(self.publish(grids), name="publish"),
+            asyncio.create_task(self.heartbeat(), name="heartbeat"),
+            asyncio.create_task(self.report(), name="report"),
+        ]
+        if self.publisher.attitude is not None:
+            tasks.append(asyncio.create_task(self.attitude(), name="attitude"))
+        if self.recorder is not None:
+            self.recorder.open()
+        if self.metrics.dump_path is not None:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.dump)
+        try:
+            # Any task ending (or failing) stops everything
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # A blocked source.get() ends when the source closes
+            self.acquire_executor.shutdown(wait=False, cancel_futures=True)
+            self.write_executor.shutdown(wait=True)
+            self.receive_executor.shutdown(wait=False, cancel_futures=True)
+            if self.recorder is not None:
+                self.recorder.close()  # After the last messages
+            if self.live is not None:
+                self.live.close()
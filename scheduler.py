@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+
+
+class MessageScheduler:
+    # Byte budget (token bucket) and urgency ranking of obstacle messages
+    def __init__(self, config, message_sizes):
+        # Link budget in bytes/s, 10 bits per byte for 8N1 UART
+        self.rate = config.get("LINK_BUDGET", 0) or config["BAUD_RATE"] / 10
+        self.message_sizes = message_sizes  # Encoded size of each type, in bytes
+        self.capacity = max(self.rate * 0.1, max(message_sizes.values()))  # Burst
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.horizon = config.get("PRIORITY_HORIZON", 1.0)  # in s
+
+        # Per grid history for the closing rate
+        self.grid_num_w = config["GRID_NUM"][1]
+        self.last_distance = np.full(
+            config["GRID_NUM"][0] * config["GRID_NUM"][1], np.inf
+        )
+        self.last_timestamp = None
+        self.frame_interval = 1 / 30  # in s, estimated
+
+        # Counters
+        self.sent = self.dropped = self.deferred = self.merged = 0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+    def acquire(self, message_types):
+        # Returns how long to wait (in s) before the link can take these messages
+        size = sum(self.message_sizes[message_type] for message_type in message_types)
+        self.refill()
+        self.tokens -= size  # Negative for debt, paid by waiting
+        self.sent += len(message_types)
+        if self.tokens < 0:
+            self.deferred += len(message_types)
+            return -self.tokens / self.rate
+        return 0
+
+    def rank(self, index, points, timestamp, closing=None):
+        # Most urgent first: nearest after PRIORITY_HORIZON at the closing rate
+        # closing: per point closing speed(in m/s) if already known, e.g. tracked
+        distance = np.linalg.norm(points, axis=1)
+        interval = None
+        if self.last_timestamp is not None and timestamp > self.last_timestamp:
+            interval = timestamp - self.last_timestamp
+            self.frame_interval += (interval - self.frame_interval) * 0.1
+        self.last_timestamp = timestamp
+        if closing is None:
+            # From the grid history
+            closing = np.zeros_like(distance)
+            if interval is not None:
+                closing = (self.last_distance[index] - distance) / interval
+                closing[~np.isfinite(closing)] = 0  # New obstacle
+            self.last_distance.fill(np.inf)
+            self.last_distance[index] = distance
+
+        order = np.argsort(distance - np.maximum(closing, 0) * self.horizon)
+        index, points, distance = index[order], points[order], distance[order]
+
+        # Saturated: what the link can take until the next frame
+        self.refill()
+        budget = self.tokens + self.rate * self.frame_interval
+        quota = max(int(budget // self.message_sizes["3D"]), 1)
+        if len(index) > quota:
+            # Merge the tail into its nearest grid (conservative)
+            nearest = quota - 1 + np.argmin(distance[quota - 1 :])
+            keep = np.append(np.arange(quota - 1), nearest)
+            self.merged += len(index) - quota
+            index, points = index[keep], points[keep]
+        return index, points
+
+    def drop(self, count):
+        # Superseded by a newer frame before being sent
+        self.dropped += count
+
+    def report(self):
+        report = (
+            f"sent {self.sent} dropped {self.dropped} "
+            f"deferred {self.deferred} merged {self.merged}"
+        )
+        self.sent = self.dropped = self.deferred = self.merged = 0
+        return report
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import itertools
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import yaml
+
+from host_side_detection import GridReducer
+from z2xy import frd_rays, grids2frd, ignore_grids_mask, z2xy_grid
+
+LABELS = "labels.npy"  # Reference of a session: bool (FRAMES, H, W) obstacle cells
+
+
+def message_sizes():
+    # Encoded OBSTACLE_DISTANCE_3D/OBSTACLE_DISTANCE sizes, in bytes
+    os.environ.setdefault("MAVLINK20", "1")  # As main.py, before the first import
+    from pymavlink import mavutil
+
+    mav = mavutil.mavlink.MAVLink(None)
+    sizes = {}
+    message = mav.obstacle_distance_3d_encode(0, 4, 12, 65535, 0, 0, 0, 0, 0)
+    sizes["3D"] = len(message.pack(mav))
+    message = mav.obstacle_distance_encode(0, 4, [65535] * 72, 0, 0, 0, 0, 0, 12)
+    sizes["DISTANCE"] = len(message.pack(mav))
+    return sizes
+
+
+def load_session(path):
+    # Memory-mapped, shared with the other workers through the page cache
+    with open(os.path.join(path, "meta.yaml")) as f:
+        meta = yaml.safe_load(f)
+    assert meta["HOST_SIDE"], f"{path}: mask and depth are needed (HOST_SIDE)"
+
+    def load(name):
+        file = os.path.join(path, name)
+        return np.load(file, mmap_mode="r") if os.path.exists(file) else None
+
+    return {
+        "path": path,
+        "meta": meta,
+        "nn": load("nn.npy"),
+        "depth": load("depth.npy"),
+        "timestamp": load("timestamp.npy"),
+        "labels": load(LABELS),
+    }
+
+
+def session_duration(session):
+    # Recorded time of the frames, in s, the last frame's interval included
+    frames = session["meta"]["FRAMES"]
+    timestamps = session["timestamp"]
+    duration = float(timestamps[frames - 1] - timestamps[0]) if frames > 1 else 0
+    return duration + duration / max(frames - 1, 1)
+
+
+sessions = sizes = None  # Of this worker process
+
+
+def open_sessions(paths):
+    global sessions, sizes
+    sessions = [load_session(path) for path in paths]
+    sizes = message_sizes()
+
+
+def evaluate_session(config, session):
+    # Sums over the session's frames
+    meta = session["meta"]
+    frames = meta["FRAMES"]
+    INPUT_SHAPE = meta["INPUT_SHAPE"]
+    reducer = GridReducer(config, INPUT_SHAPE)
+    valid = ignore_grids_mask(config)
+    z2x, z2y = z2xy_grid(
+        config,
+        INPUT_SHAPE,
+        intrinsics=meta["INTRINSICS"],
+        hfov=meta["HFOV"],
+    )
+    rays, origins = frd_rays(z2x, z2y, config.get("MOUNT"))
+
+    # Stereo depth thresholds, as on the device
+    lo, hi = config["MIN_DISTANCE"] * 1000, config["MAX_DISTANCE"] * 1000  # in mm
+    shape = (INPUT_SHAPE[1], INPUT_SHAPE[0])
+    depth = np.empty(shape, dtype=np.uint16)
+    keep = np.empty(shape, dtype=bool)
+    inside = np.empty(shape, dtype=bool)
+
+    # Grid of GRID_NUM containing each reference cell's center
+    labels = session["labels"]
+    if labels is not None:
+        assert len(labels) == frames, f"{session['path']}: {LABELS} frames"
+        rows = (np.arange(labels.shape[1]) + 0.5) * config["GRID_NUM"][0]
+        cols = (np.arange(labels.shape[2]) + 0.5) * config["GRID_NUM"][1]
+        rows = (rows // labels.shape[1]).astype(np.intp)
+        cols = (cols // labels.shape[2]).astype(np.intp)
+
+    mode = config.get("MESSAGE_MODE", "3D")
+    nearest = config.get("HYBRID_NEAREST", 3)
+    elapsed = np.empty(frames)
+    totals = dict.fromkeys(["detections", "3D", "DISTANCE", "tp", "fp", "fn"], 0)
+    for i in range(frames):
+        np.greater_equal(session["depth"][i], lo, out=keep)
+        np.less_equal(session["depth"][i], hi, out=inside)
+        keep &= inside
+        np.multiply(session["depth"][i], keep, out=depth)
+        start = time.perf_counter()  # Thresholds are applied on the device
+        grids = reducer(mask=session["nn"][i], depth=depth)
+        index, _ = grids2frd(grids, rays, origins, valid)
+        elapsed[i] = time.perf_counter() - start
+
+        count = len(index)
+        totals["detections"] += count
+        if mode == "3D":
+            totals["3D"] += max(count, 1)  # "No obstacle" when none
+        else:
+            totals["DISTANCE"] += 1
+            if mode == "HYBRID":
+                totals["3D"] += min(count, nearest)
+        if labels is not None:
+            detected = (grids[..., 0] > 0) & valid
+            detected = detected[rows[:, None], cols]
+            reference = labels[i]
+            totals["tp"] += np.count_nonzero(detected & reference)
+            totals["fp"] += np.count_nonzero(detected & ~reference)
+            totals["fn"] += np.count_nonzero(~detected & reference)
+
+    return totals, elapsed, session_duration(session), labels is not None
+
+
+def evaluate(task):
+    # One combination of settings over every session
+    number, config, settings = task
+    config = dict(config, **settings, HOST_SIDE=True)
+    result = {"number": number, "settings": settings}
+    try:
+        runs = [evaluate_session(config, session) for session in sessions]
+    except AssertionError as e:  # e.g. GRID_NUM not dividing INPUT_SHAPE
+        result["error"] = str(e) or "invalid settings"
+        return result
+    except Exception as e:  # Reported, the other combinations keep going
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    totals = {key: sum(run[0][key] for run in runs) for key in runs[0][0]}
+    elapsed = np.concatenate([run[1] for run in runs])
+    duration = sum(run[2] for run in runs)
+    frames = len(elapsed)
+    messages = totals["3D"] + totals["DISTANCE"]
+    link_bytes = totals["3D"] * sizes["3D"] + totals["DISTANCE"] * sizes["DISTANCE"]
+    budget = config.get("LINK_BUDGET", 0) or config["BAUD_RATE"] / 10  # in bytes/s
+    result.update(
+        frames=frames,
+        detections=totals["detections"] / frames,  # Per frame
+        messages=messages / duration,  # Per s
+        link_bytes=link_bytes / duration,  # Per s
+        link_load=link_bytes / duration / budget * 100,  # in %
+        over_rate=messages / duration > config["MESSAGE_RATE_MAX"],
+        compute_mean=elapsed.mean() * 1000,  # in ms
+        compute_p95=np.percentile(elapsed, 95) * 1000,  # in ms
+    )
+    if all(run[3] for run in runs):
+        tp, fp, fn = totals["tp"], totals["fp"], totals["fn"]
+        result["precision"] = tp / (tp + fp) if tp + fp else 1.0
+        result["recall"] = tp / (tp + fn) if tp + fn else 1.0
+        result["f1"] = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 1.0
+    return result
+
+
+def combinations(sweep):
+    # Every combination of the swept values, in order
+    keys = list(sweep)
+    for values in itertools.product(*(sweep[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def describe(settings):
+    return " ".join(f"{key}={value}" for key, value in settings.items())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Host side detection of recorded sessions, for every SWEEP setting"
+    )
+    parser.add_argument("sessions", nargs="+", help="Recorded with frame_source.py")
+    parser.add_argument("--sweep", help="YAML of the swept values (default SWEEP)")
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(), help="Worker processes"
+    )
+    parser.add_argument("--csv", help="Also save the results to this file")
+    args = parser.parse_args()
+
+    with open("config.yaml") as f:  # Read only
+        config = yaml.safe_load(f)
+    sweep = config.get("SWEEP") or {}
+    if args.sweep:
+        with open(args.sweep) as f:
+            sweep = yaml.safe_load(f)
+
+    # Rates are per recorded second, a session needs two frames at least
+    paths = []
+    for path in args.sessions:
+        if session_duration(load_session(path)) > 0:
+            paths.append(path)
+        else:
+            print(f"{path} skipped: no recorded duration (single frame?)")
+    if not paths:
+        raise SystemExit("No session to evaluate")
+
+    tasks = [
+        (number, config, settings)
+        for number, settings in enumerate(combinations(sweep))
+    ]
+    print(f"{len(tasks)} settings, {len(paths)} sessions")
+    print(
+        f"Compute times are measured with {args.processes} processes sharing "
+        f"{os.cpu_count()} cores, compare them within a run only"
+    )
+    results = []
+    with Pool(args.processes, initializer=open_sessions, initargs=(paths,)) as pool:
+        for result in pool.imap_unordered(evaluate, tasks):
+            results.append(result)
+            if "error" in result:
+                print(f"[{result['number']}] skipped: {result['error']}")
+    results.sort(key=lambda result: result["number"])
+
+    # Best agreement first when labelled, else cheapest
+    done = [result for result in results if "error" not in result]
+    labelled = all("f1" in result for result in done)
+    done.sort(
+        key=lambda r: (-r["f1"], r["compute_mean"]) if labelled else r["compute_mean"]
+    )
+    for result in done:
+        line = (
+            f"[{result['number']}] {describe(result['settings'])}: "
+            f"{result['detections']:.2f} detections/frame, "
+            f"{result['messages']:.1f} messages/s"
+            f"{' (over MESSAGE_RATE_MAX)' if result['over_rate'] else ''}, "
+            f"{result['link_bytes']:.0f}B/s ({result['link_load']:.0f}% of the link), "
+            f"{result['compute_mean']:.2f}/{result['compute_p95']:.2f}ms mean/p95"
+        )
+        if labelled:
+            line += (
+                f", precision {result['precision']:.3f} recall {result['recall']:.3f}"
+                f" F1 {result['f1']:.3f}"
+            )
+        print(line)
+
+    if args.csv:
+        fields = list(sweep) + [
+            "frames",
+            "detections",
+            "messages",
+            "link_bytes",
+            "link_load",
+            "compute_mean",
+            "compute_p95",
+            "precision",
+            "recall",
+            "f1",
+        ]
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fields, extrasaction="ignore")
+            writer.writeheader()
+            for result in done:
+                writer.writerow(dict(result, **result["settings"]))
+        print(f"Saved to {args.csv}")
@@ -0,0 +1,28 @@
+import numpy as np
+
+# Zero-copy access to depthai message buffers
+# NOTE: The returned arrays are views, only valid while the message is alive
+
+
+def get_layer(msg, name, dtype=np.float16):
+    # Find the layer inside the raw NNData buffer
+    for tensor_info in msg.getAllLayers():
+        if tensor_info.name == name:
+            break
+    else:
+        raise KeyError(f"Layer {name} not found")
+
+    data = np.asarray(msg.getData())  # uint8, raw message buffer
+    count = int(np.prod(tensor_info.dims))
+    start = tensor_info.offset
+    end = start + count * np.dtype(dtype).itemsize
+    return data[start:end].view(dtype)  # Flat, no copy
+
+
+def get_layer_fp16(msg, name):
+    return get_layer(msg, name, dtype=np.float16)
+
+
+def get_frame(msg, dtype=np.uint16):
+    data = np.asarray(msg.getData())  # uint8, raw message buffer
+    return data.view(dtype).reshape(msg.getHeight(), msg.getWidth())  # No copy
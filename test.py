@@ -1,189 +1,117 @@
-import time
+import argparse
 
-import cv2
-import depthai as dai
 import numpy as np
 import yaml
 
-from host_side_detection import detection
-from pipeline import create_pipeline
-from z2xy import z2xy_coefficient, z2xy_coefficient_fov
+from depth_filter import create_depth_filter
+from frame_source import create_frame_source
+from host_side_detection import GridReducer
+from live_feed import LiveFeed
+from metrics import CAPTURE, DETECT, RECEIVE, Metrics
+from visualizer import Visualizer
+
+parser = argparse.ArgumentParser(description="Shows the detection of each frame")
+parser.add_argument(
+    "--attach",
+    nargs="?",
+    const="",
+    help="Watch a running main.py through its LIVE feed (default LIVE.NAME)",
+)
+parser.add_argument(
+    "--output",
+    help="Headless, video file or image directory (default VISUALIZER.OUTPUT)",
+)
+args = parser.parse_args()
 
 # Reading config
 with open("config.yaml") as f:  # Read only
     config = yaml.safe_load(f)
     print(f"Config: {config}")
 
+metrics = Metrics(interval=1)
 
-class FPSHandler:
-    def __init__(self):
-        self.timestamp = time.time()
-        self.start = time.time()
-        self.frame_cnt = 0
 
-    def next_iter(self):
-        self.timestamp = time.time()
-        self.frame_cnt += 1
+def opened():
+    # Frames of the device (or FRAME_SOURCE) opened here, detected here
+    # A plain device, logging from its boot
+    with create_frame_source(
+        config, passthroughs=True, device_options={}, log_level="DEBUG"
+    ) as source:
+        INPUT_SHAPE = source.INPUT_SHAPE
 
-    def fps(self):
-        return self.frame_cnt / (self.timestamp - self.start)
+        # Generating fixed z to x,y coefficient
+        z2x, z2y = source.z2xy(config)
 
+        reducer = GridReducer(config, INPUT_SHAPE)
+        depth_filter = None
+        if config["HOST_SIDE"]:
+            depth_filter = create_depth_filter(config, INPUT_SHAPE)
+
+        for frame in source:
+            nn, img, depth = frame.nn, frame.img, frame.depth
+            metrics.mark(frame.seq, CAPTURE, frame.timestamp)
+            metrics.mark(frame.seq, RECEIVE)
+
+            if depth_filter is not None:
+                depth = depth_filter(depth)  # Also shown filtered
+            if config["HOST_SIDE"]:
+                grids = reducer(mask=nn, depth=depth)
+            else:
+                grids = nn
+            grids = np.asarray(grids).reshape(
+                config["GRID_NUM"][0], config["GRID_NUM"][1], 2
+            )  # label,depth(z)
+            xyz = np.stack(
+                [grids[..., 1] * z2x, grids[..., 1] * z2y, grids[..., 1]], -1
+            )
+            yield frame.seq, grids, xyz, img, depth, source.report
 
-with dai.Device() as device:
-    device.setLogLevel(dai.LogLevel.DEBUG)
-    device.setLogOutputLevel(dai.LogLevel.DEBUG)
-
-    # Loading blob
-    blob = dai.OpenVINO.Blob(config["MODEL_PATH"])
-    for name, tensorInfo in blob.networkInputs.items():
-        print(name, tensorInfo.dims)
-    INPUT_SHAPE = blob.networkInputs["rgb"].dims[:2]  # Auto INPUT_SHAPE
 
-    # Getting calibration data
+def attached(feed):
+    # Frames of a running main.py, detected there (xyz in the body frame)
     try:
-        calibData = device.readCalibration2()
-
-        lensPosition = calibData.getLensPosition(dai.CameraBoardSocket.RGB)
-        print(f"RGB Cam lensPosition: {lensPosition}")
-
-        intrinsics = calibData.getCameraIntrinsics(
-            dai.CameraBoardSocket.RGB, *INPUT_SHAPE  # type: ignore
-        )
-        print(f"RGB Cam intrinsics: {intrinsics}")
-
-        hfov = calibData.getFov(dai.CameraBoardSocket.RGB)
-        print(f"RGB Cam HFOV: {hfov}")
-    except:
-        raise Exception("Fail to get calibration data!")
-
-    # Generating fixed z to x,y coefficient
-    assert INPUT_SHAPE[1] % config["GRID_NUM"][0] == 0
-    assert INPUT_SHAPE[0] % config["GRID_NUM"][1] == 0
-    grid_height = INPUT_SHAPE[1] // config["GRID_NUM"][0]
-    grid_width = INPUT_SHAPE[0] // config["GRID_NUM"][1]
-    if config["USE_INTRINSIC"]:
-        # Use intrinsic matrix
-        z2x, z2y = z2xy_coefficient(
-            grid_height,
-            grid_width,
-            config["GRID_NUM"][0],
-            config["GRID_NUM"][1],
-            np.array(intrinsics),
-        )
-    else:
-        # Use HFOV only
-        z2x, z2y = z2xy_coefficient_fov(
-            grid_height, grid_width, config["GRID_NUM"][0], config["GRID_NUM"][1], hfov
-        )
-    z2x = z2x.reshape(config["GRID_NUM"][0], config["GRID_NUM"][1])
-    z2y = z2y.reshape(config["GRID_NUM"][0], config["GRID_NUM"][1])
-
-    # Start pipeline
-    device.startPipeline(
-        create_pipeline(
-            blob=blob, lensPosition=lensPosition, passthroughs=True, **config
-        )
-    )
-    q_nn = device.getOutputQueue(name="nn", maxSize=4, blocking=False)  # type: ignore
-    q_img = device.getOutputQueue(name="img", maxSize=4, blocking=False)  # type: ignore
-    q_depth = device.getOutputQueue(name="depth", maxSize=4, blocking=False)  # type: ignore
-    fps = FPSHandler()
-
-    while True:
-        msgs = q_nn.get()
-        nn = msgs.getLayerFp16("out")
-        img = q_img.get().getCvFrame()
-        depth = q_depth.get().getFrame()
-        fps.next_iter()
-
-        if config["HOST_SIDE"]:
-            grids = detection(config, INPUT_SHAPE, mask=nn, depth=depth)
-        else:
-            grids = nn
-
-        grids = np.asarray(grids).reshape(
-            config["GRID_NUM"][0], config["GRID_NUM"][1], 2
-        )  # label,depth(z)
-        depth = ((depth - depth.min()) / (depth.max() - depth.min()) * 255).astype(
-            np.uint8
-        )
-        depth = cv2.applyColorMap(depth, cv2.COLORMAP_JET)
-        blend = cv2.addWeighted(img, 0.5, depth, 0.5, 0)
-        blend = cv2.resize(blend, (1280, 720))  # Force 720P for bigger display
-
-        for i in range(1, config["GRID_NUM"][0]):
-            cv2.line(
-                blend,
-                (0, int(blend.shape[0] * i / config["GRID_NUM"][0])),
-                (blend.shape[1] - 1, int(blend.shape[0] * i / config["GRID_NUM"][0])),
-                color=(255, 255, 255),
-                thickness=1,
-            )
-        for i in range(1, config["GRID_NUM"][1]):
-            cv2.line(
-                blend,
-                (int(blend.shape[1] * i / config["GRID_NUM"][1]), 0),
-                (int(blend.shape[1] * i / config["GRID_NUM"][1]), blend.shape[0] - 1),
-                color=(255, 255, 255),
-                thickness=1,
+        while True:
+            frame = feed.read(timeout=config.get("FRAME_TIMEOUT", 5))
+            if frame is None:
+                print(f"No frame from {feed.name} for a while")
+                return
+            seq = int(frame["seq"])
+            metrics.mark(seq, CAPTURE, float(frame["timestamp"]))
+            metrics.mark(seq, RECEIVE)
+            points = len(frame["points"])
+            yield seq, frame["grids"], frame["xyz"], frame["img"], frame["depth"], (
+                lambda: f"feed: {points} points, {feed.retries} retries"
             )
-
-        for i in range(config["GRID_NUM"][0]):
-            for j in range(config["GRID_NUM"][1]):
-                cv2.putText(
-                    blend,
-                    "label:{:d}".format(grids[i][j][0].astype(np.uint8)),
-                    (
-                        int(blend.shape[1] * j / config["GRID_NUM"][1]) + 3,
-                        int(blend.shape[0] * i / config["GRID_NUM"][0]) + 12,
-                    ),
-                    cv2.FONT_HERSHEY_TRIPLEX,
-                    0.4,
-                    color=(255, 255, 255),
-                )
-                cv2.putText(
-                    blend,
-                    "x:{:.1f}m".format(grids[i][j][1] * z2x[i][j]),
-                    (
-                        int(blend.shape[1] * j / config["GRID_NUM"][1]) + 3,
-                        int(blend.shape[0] * i / config["GRID_NUM"][0]) + 24,
-                    ),
-                    cv2.FONT_HERSHEY_TRIPLEX,
-                    0.4,
-                    color=(255, 255, 255),
-                )
-                cv2.putText(
-                    blend,
-                    "y:{:.1f}m".format(grids[i][j][1] * z2y[i][j]),
-                    (
-                        int(blend.shape[1] * j / config["GRID_NUM"][1]) + 3,
-                        int(blend.shape[0] * i / config["GRID_NUM"][0]) + 36,
-                    ),
-                    cv2.FONT_HERSHEY_TRIPLEX,
-                    0.4,
-                    color=(255, 255, 255),
-                )
-                cv2.putText(
-                    blend,
-                    "z:{:.1f}m".format(grids[i][j][1]),
-                    (
-                        int(blend.shape[1] * j / config["GRID_NUM"][1]) + 3,
-                        int(blend.shape[0] * i / config["GRID_NUM"][0]) + 48,
-                    ),
-                    cv2.FONT_HERSHEY_TRIPLEX,
-                    0.4,
-                    color=(255, 255, 255),
+    finally:
+        feed.close()
+
+
+if args.attach is None:
+    frames, axes, grid_shape = opened(), "xyz", config["GRID_NUM"]
+else:
+    # Grids as main.py shares them, e.g. side by side with CAMERAS
+    feed = LiveFeed(args.attach or config["LIVE"]["NAME"])
+    frames, axes, grid_shape = attached(feed), "frd", feed.meta["GRID_SHAPE"]
+
+visualizer = Visualizer(config, grid_shape, axes, output=args.output)
+try:
+    for seq, grids, xyz, img, depth, report in frames:
+        metrics.mark(seq, DETECT)
+        if metrics.due():
+            # Once per summary, the source's counters restart on each report
+            print(
+                ", ".join(
+                    filter(None, [metrics.summary(), report(), visualizer.report()])
                 )
+            )
 
-        cv2.putText(
-            blend,
-            "Fps: {:.2f}".format(fps.fps()),
-            (2, blend.shape[0] - 4),
-            cv2.FONT_HERSHEY_TRIPLEX,
-            0.4,
-            color=(255, 255, 255),
-        )
-        cv2.imshow("BLEND", blend)
-
-        if cv2.waitKey(1) == ord("q"):
+        # Rendered by the visualizer's thread, superseded frames are skipped
+        visualizer.submit(seq, grids, xyz, img, depth, metrics.fps())
+        visualizer.show()  # The last rendered one, if any
+        if visualizer.error is not None:
+            raise visualizer.error  # With the rendering thread's traceback
+        if visualizer.stopped:
             break
+finally:
+    frames.close()
+    visualizer.close()
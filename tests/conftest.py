@@ -0,0 +1,5 @@
+import os
+import sys
+
+os.environ.setdefault("MAVLINK20", "1")  # As main.py, before the first import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
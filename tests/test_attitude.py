@@ -0,0 +1,54 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import attitude
+from attitude import AttitudeProjection
+
+ELEVATIONS = np.arange(-40, 41, 4)  # Of the grid rows, in degree, up positive
+CONFIG = {"ATTITUDE": {"MAX_AGE": 0.5, "STEP": 1.0, "ELEVATION": [-12, 12]}}
+
+
+@pytest.fixture
+def projection(monkeypatch):
+    # One column of forward rays, clock stood still at 10s
+    monkeypatch.setattr(attitude.time, "monotonic", lambda: 10.0)
+    e = np.radians(ELEVATIONS)
+    rays = np.stack([np.cos(e), np.zeros_like(e), -np.sin(e)], -1)[:, None]
+    return AttitudeProjection(CONFIG, rays, np.ones((len(e), 1), dtype=bool))
+
+
+def message(roll, pitch):
+    return SimpleNamespace(roll=math.radians(roll), pitch=math.radians(pitch))
+
+
+def rows(valid):
+    return ELEVATIONS[valid[:, 0]].tolist()
+
+
+def test_level_without_attitude(projection):
+    rotation, valid = projection.at(10.0)
+    np.testing.assert_allclose(rotation, np.eye(3), atol=1e-12)
+    assert rows(valid) == [-12, -8, -4, 0, 4, 8, 12]
+
+
+def test_bow_up_moves_the_horizon_down_the_image(projection):
+    projection.update(message(0, 20))
+    _, valid = projection.at(10.1)
+    assert rows(valid) == [-32, -28, -24, -20, -16, -12, -8]
+
+
+def test_stale_attitude_assumed_level(projection):
+    projection.update(message(0, 20))
+    _, valid = projection.at(10.6)  # Older than MAX_AGE
+    assert rows(valid) == [-12, -8, -4, 0, 4, 8, 12]
+
+
+def test_quantized_attitudes_share_a_table(projection):
+    projection.update(message(0.2, 19.8))
+    projection.at(10.0)
+    projection.update(message(-0.3, 20.3))
+    projection.at(10.0)
+    assert projection.report() == "received 2 cache hits 1/2"
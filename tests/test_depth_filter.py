@@ -0,0 +1,49 @@
+import numpy as np
+
+from depth_filter import create_depth_filter
+
+SHAPE = (6, 5)  # W,H
+
+
+def create(**filters):
+    # filters: NAME={settings}, enabled
+    config = {"DEPTH_FILTER": {k: dict(v, ENABLE=True) for k, v in filters.items()}}
+    return create_depth_filter(config, SHAPE)
+
+
+def test_none_enabled():
+    assert create_depth_filter({}, SHAPE) is None
+
+
+def test_speckle_removed():
+    depth = np.full((5, 6), 3000, dtype=np.uint16)
+    depth[2, 2] = 9000  # No similar neighbor
+    depth[0, 0] = 0
+    out = create(SPECKLE={"DIFF": 200, "NEIGHBORS": 2})(depth)
+    assert out[2, 2] == 0
+    assert (out[depth == 3000] == 3000).all()  # Corners have 2 neighbors
+
+
+def test_temporal_average_steps_and_persistence():
+    depth_filter = create(TEMPORAL={"ALPHA": 0.5, "DELTA": 500, "PERSISTENCE": 1})
+    frame = np.full((5, 6), 3000, dtype=np.uint16)
+    assert (depth_filter(frame) == 3000).all()
+    frame[:] = 3200
+    assert (depth_filter(frame) == 3100).all()  # Smoothed
+    frame[:] = 5000
+    assert (depth_filter(frame) == 5000).all()  # A step larger than DELTA resets
+    frame[:] = 0
+    assert (depth_filter(frame) == 5000).all()  # Kept for PERSISTENCE frames
+    assert (depth_filter(frame) == 0).all()
+
+
+def test_holes_filled_by_nearest_neighbor():
+    depth = np.zeros((5, 6), dtype=np.uint16)
+    depth[2, 0] = 4000
+    depth[2, 2] = 2000
+    out = create(HOLE_FILLING={"RADIUS": 1})(depth)
+    assert out[2, 1] == 2000  # The nearer of its neighbors
+    assert out[1, 2] == out[3, 2] == 2000
+    assert out[0, 0] == 0  # Beyond RADIUS
+    out = create(HOLE_FILLING={"RADIUS": 2})(depth)
+    assert out[0, 2] == 2000 and out[2, 4] == 2000
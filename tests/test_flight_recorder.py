@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from flight_recorder import FlightRecorder, read_records, record_dtype, unpack_mask
+
+INPUT_SHAPE = (16, 8)  # W,H
+SLOTS = 3
+
+
+def create(path):
+    recorder = {"PATH": str(path), "RATE": 0, "DECIMATION": 2, "MAX_MESSAGE_BYTES": 8}
+    config = {"RECORDER": recorder, "MASK_THRESHOLD": 0.5, "GRID_NUM": [2, 2]}
+    itemsize = FlightRecorder(config, INPUT_SHAPE).dtype.itemsize
+    recorder["SIZE"] = (SLOTS + 0.5) * itemsize / 2**20  # in MB
+    return FlightRecorder(config, INPUT_SHAPE)
+
+
+def record(recorder, seq):
+    mask = np.zeros((8, 16), dtype=np.float16)
+    mask[:, :seq] = 1
+    depth = np.full((8, 16), 1000 + seq, dtype=np.uint16)
+    grids = np.full((2, 2, 2), seq, dtype=np.float64)
+    recorder.record(seq, float(seq), mask, depth, grids)
+    recorder.messages(seq, bytes(range(seq, seq + 10)))  # More than kept
+    while not recorder.tasks.empty():
+        time.sleep(0.001)  # One at a time, none dropped
+
+
+def test_ring_keeps_the_latest_records(tmp_path):
+    with create(tmp_path) as recorder:
+        assert recorder.slots == SLOTS
+        for seq in range(5):
+            record(recorder, seq)
+    records = list(read_records(str(tmp_path)))
+    assert [float(r["timestamp"]) for r, _ in records] == [2.0, 3.0, 4.0]
+    record_, meta = records[-1]
+    assert record_["seq"] == 4 and (record_["depth"] == 1004).all()
+    assert unpack_mask(record_, meta)[0].tolist() == [True] * 2 + [False] * 6
+    assert (record_["grids"][..., :2] == 4).all() and (
+        record_["grids"][..., 2] == 0
+    ).all()
+    assert record_["message_bytes"] == 10
+    assert bytes(record_["messages"]) == bytes(range(4, 12))
+
+
+def test_reopened_ring_continues(tmp_path):
+    with create(tmp_path) as recorder:
+        for seq in range(2):
+            record(recorder, seq)
+    with create(tmp_path) as recorder:
+        record(recorder, 5)
+    records = [r for r, _ in read_records(str(tmp_path))]
+    assert [int(r["seq"]) for r in records] == [0, 1, 2]
+    assert [float(r["timestamp"]) for r in records] == [0.0, 1.0, 5.0]
+
+
+def test_rate_limited(tmp_path):
+    recorder = create(tmp_path)
+    recorder.rate = 10
+    with recorder:
+        for seq in range(3):
+            recorder.record(seq, 0.0, None, None, None)  # Within 0.1s
+    assert recorder.report() == "recorded 1 dropped 0"
+    assert record_dtype(recorder.meta) == recorder.dtype
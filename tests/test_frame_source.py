@@ -0,0 +1,46 @@
+import queue
+import threading
+
+import numpy as np
+
+from frame_source import ParallelSource
+
+
+def parallel_source(results, workers=2):
+    # get() only, without starting any process
+    source = ParallelSource.__new__(ParallelSource)
+    source.workers = workers
+    source.reorder_wait = 0.05
+    source.results = queue.Queue()
+    for result in results:
+        source.results.put(result)
+    source.stopped = threading.Event()
+    source.processes = [threading.current_thread()]  # Alive
+    source.next_seq = 0
+    source.pending = {}
+    source.waiting = None
+    source.ended = 0
+    source.late = 0
+    return source
+
+
+def grids(seq):
+    return ("grids", seq, float(seq), np.full((2, 2), seq, dtype=np.float32))
+
+
+def test_results_are_reordered():
+    source = parallel_source([grids(1), grids(0), grids(3), grids(2), ("end",)])
+    source.results.put(("end",))
+    seqs = [frame.seq for frame in iter(source.get, None)]
+    assert seqs == [0, 1, 2, 3]
+    assert source.late == 0
+
+
+def test_lost_result_is_skipped_after_waiting():
+    source = parallel_source([grids(0), grids(2), grids(3)])
+    assert [source.get().seq for _ in range(3)] == [0, 2, 3]
+    source.results.put(grids(1))  # Given up on
+    source.results.put(("end",))
+    source.results.put(("end",))
+    assert source.get() is None
+    assert source.late == 1
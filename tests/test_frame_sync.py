@@ -0,0 +1,37 @@
+from frame_sync import FrameSync
+
+
+def test_matched_within_tolerance():
+    sync = FrameSync(["nn", "depth"], tolerance=0.01)
+    assert sync.add("nn", 1.000, "nn0") is None
+    assert sync.add("depth", 1.015, "depth0") is None  # Too far apart
+    assert sync.add("depth", 1.005, "depth1") == ["nn0", "depth1"]
+    assert sync.report() == "sync: matched 1 dropped 0/1 skew mean/max 5.0/5.0ms"
+
+
+def test_unmatched_older_messages_dropped():
+    sync = FrameSync(["nn", "depth"], tolerance=0.01)
+    sync.add("nn", 1.0, "nn0")  # Its depth never arrives
+    sync.add("nn", 2.0, "nn1")
+    assert sync.add("depth", 2.002, "depth1") == ["nn1", "depth1"]
+    assert not sync.buffers["nn"] and not sync.buffers["depth"]
+    assert sync.report().startswith("sync: matched 1 dropped 1/0")
+
+
+def test_full_buffer_drops_the_oldest():
+    sync = FrameSync(["nn", "depth"], tolerance=0.01, max_buffer=2)
+    for i in range(3):
+        sync.add("nn", float(i), f"nn{i}")
+    assert [key for key, _ in sync.buffers["nn"]] == [1.0, 2.0]
+    assert sync.add("depth", 0.0, "depth0") is None  # nn0 is gone
+    assert sync.report() == "sync: matched 0 dropped 1/0 skew mean/max 0.0/0.0ms"
+
+
+def test_matched_by_sequence_number():
+    sync = FrameSync(["nn", "depth", "img"], key="seq", tolerance=0.5)
+    assert sync.tolerance == 0  # Exact
+    sync.add("nn", 7, "nn7")
+    sync.add("depth", 7, "depth7")
+    assert sync.add("img", 8, "img8") is None
+    sync.add("nn", 8, "nn8")
+    assert sync.add("depth", 8, "depth8") == ["nn8", "depth8", "img8"]
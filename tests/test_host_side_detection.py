@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from host_side_detection import GridReducer
+
+INPUT_SHAPE = (160, 120)  # W,H
+BIN = 50  # in mm
+
+
+def reducer(statistic):
+    config = {
+        "GRID_NUM": [3, 4],
+        "MASK_THRESHOLD": 0.5,
+        "GRID_THRESHOLD": 0.0,
+        "MAX_DISTANCE": 35,
+        "GRID_STATISTIC": dict(statistic, BIN=BIN),
+    }
+    return GridReducer(config, INPUT_SHAPE)
+
+
+def frame(seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (INPUT_SHAPE[1], INPUT_SHAPE[0])
+    mask = (rng.random(shape) > 0.3).astype(np.float16)
+    depth = rng.integers(300, 30000, shape).astype(np.uint16)
+    depth[rng.random(shape) < 0.1] = 0  # No depth
+    return mask, depth
+
+
+def grid_depths(mask, depth):
+    # Valid obstacle depths(in mm) of each grid, (3,4) lists
+    masked = np.where(mask > 0.5, depth, 0).reshape(3, 40, 4, 40)
+    return [[masked[i, :, j][masked[i, :, j] > 0] for j in range(4)] for i in range(3)]
+
+
+@pytest.mark.parametrize("percentile", [1, 5, 50, 95])
+def test_percentile_matches_numpy(percentile):
+    mask, depth = frame(percentile)
+    out = reducer({"TYPE": "percentile", "PERCENTILE": percentile})(mask, depth)
+    for i, row in enumerate(grid_depths(mask, depth)):
+        for j, values in enumerate(row):
+            expected = np.percentile(values, percentile, method="inverted_cdf")
+            assert abs(out[i, j, 1] * 1000 - expected) <= BIN / 2
+
+
+def test_trimmed_matches_sort():
+    mask, depth = frame()
+    out = reducer({"TYPE": "trimmed", "TRIM": 10})(mask, depth)
+    for i, row in enumerate(grid_depths(mask, depth)):
+        for j, values in enumerate(row):
+            expected = np.sort(values)[10]
+            assert abs(out[i, j, 1] * 1000 - expected) <= BIN / 2
+
+
+def test_percentile_of_empty_grid_is_zero():
+    mask, depth = frame()
+    mask[:40, :40] = 0
+    out = reducer({"TYPE": "percentile", "PERCENTILE": 5})(mask, depth)
+    assert out[0, 0, 1] == 0
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+from host_side_detection import GridReducer
+from ignore_mask import ignored_grids, load_ignore_mask, polygons_mask
+
+INPUT_SHAPE = (8, 6)  # W,H
+HULL = [[0, 4], [8, 4], [8, 6], [0, 6]]  # Bottom two rows
+
+
+def test_polygon_covers_pixel_centers():
+    inside = polygons_mask([[[1, 1], [4, 1], [4, 3], [1, 3]]], INPUT_SHAPE)
+    expected = np.zeros((6, 8), dtype=bool)
+    expected[1:3, 1:4] = True
+    assert (inside == expected).all()
+    # A triangle, as OpenCV rasterizes it away from the edges
+    triangle = [[0, 0], [8, 0], [0, 6]]
+    reference = np.zeros((60, 80), dtype=np.uint8)
+    cv2.fillPoly(reference, [np.array(triangle) * 10], 1)
+    inside = polygons_mask([triangle], INPUT_SHAPE)
+    assert (inside == reference[5::10, 5::10].astype(bool)).all()
+
+
+def test_image_resized_to_the_input(tmp_path):
+    image = np.zeros((60, 80), dtype=np.uint8)
+    image[40:] = 255  # White for ignored
+    path = str(tmp_path / "hull.png")
+    cv2.imwrite(path, image)
+    valid = load_ignore_mask({"IGNORE_MASK": path}, INPUT_SHAPE)
+    assert (valid == ~polygons_mask([HULL], INPUT_SHAPE)).all()
+    assert load_ignore_mask({"IGNORE_MASK": None}, INPUT_SHAPE) is None
+
+
+def test_grids_mostly_ignored():
+    config = {"GRID_NUM": [3, 2], "IGNORE_MASK": [[[0, 3], [8, 3], [8, 6], [0, 6]]]}
+    # Bottom half: the bottom grids entirely, the middle ones by half (not more)
+    assert ignored_grids(config, INPUT_SHAPE).tolist() == [
+        [False, False],
+        [False, False],
+        [True, True],
+    ]
+
+
+def test_ignored_pixels_never_detected():
+    config = {
+        "GRID_NUM": [2, 2],
+        "MASK_THRESHOLD": 0.5,
+        "GRID_THRESHOLD": 0.5,  # Of the pixels not ignored
+        "MAX_DISTANCE": 35,
+        "IGNORE_MASK": [HULL],
+    }
+    reducer = GridReducer(config, INPUT_SHAPE)
+    mask = np.ones((6, 8), dtype=np.float16)
+    depth = np.full((6, 8), 2000, dtype=np.uint16)
+    depth[4:] = 500  # The hull, nearer
+    out = reducer(mask, depth)
+    assert (out[..., 0] > 0).all()
+    assert out[1, 0, 1] == 2.0  # Without the hull's depth
+    mask[3] = 0  # The only row of the lower grids not ignored
+    out = reducer(mask, depth)
+    assert (out[1, :, 0] == 0).all()
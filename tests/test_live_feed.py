@@ -0,0 +1,79 @@
+import os
+from multiprocessing import resource_tracker
+
+import numpy as np
+import pytest
+
+from live_feed import LiveFeed, create_live_feed
+
+GRID_SHAPE = (2, 3)
+
+
+@pytest.fixture
+def writer():
+    config = {"LIVE": {"ENABLE": True, "NAME": f"test_feed_{os.getpid()}"}}
+    rays = np.zeros(GRID_SHAPE + (3,))
+    rays[..., 0] = 1  # Forward
+    feed = create_live_feed(config, (8, 4), rays, np.zeros_like(rays))
+    yield feed
+    feed.close()
+
+
+@pytest.fixture
+def reader(writer):
+    feed = LiveFeed(writer.name)
+    # Same process as the writer, which still unlinks it
+    resource_tracker.register(feed.shm._name, "shared_memory")
+    yield feed
+    feed.close()
+
+
+def grids(z):
+    out = np.zeros(GRID_SHAPE + (2,))
+    out[0, 1] = [1, z]
+    return out
+
+
+def test_nothing_before_the_first_write(writer, reader):
+    assert reader.read(timeout=0) is None
+
+
+def test_each_frame_read_once(writer, reader):
+    depth = np.full((4, 8), 1234, dtype=np.uint16)
+    writer.write(7, 1.5, grids=grids(3.0), depth=depth)
+    frame = reader.read(timeout=0)
+    assert int(frame["seq"]) == 7 and float(frame["timestamp"]) == 1.5
+    np.testing.assert_allclose(frame["xyz"][0, 1], [3.0, 0, 0])
+    np.testing.assert_allclose(frame["points"], [[3.0, 0, 0]])
+    assert frame["depth"].shape == (2, 4) and (frame["depth"] == 1234).all()
+    assert frame["mask"] is None and frame["img"] is None  # Not sent
+    assert reader.read(timeout=0) is None  # Not again
+
+    writer.write(8, 2.0, grids=grids(5.0))
+    assert int(reader.read(timeout=0)["seq"]) == 8
+
+
+def test_frame_being_written_is_not_read(writer, reader):
+    writer.write(1, 1.0, grids=grids(3.0))
+    writer.counter[...] += 1  # Odd, as while writing the next one
+    assert reader.read(timeout=0) is None
+    writer.counter[...] += 1
+    assert int(reader.read(timeout=0)["seq"]) == 1  # Same data, complete again
+
+
+def test_overwritten_while_copying_is_retried(writer, reader, monkeypatch):
+    writer.write(1, 1.0, grids=grids(3.0))
+    copyto = np.copyto
+    calls = []
+
+    def overwriting(dst, src, *args, **kwargs):
+        # The writer finishes the next frame while the reader copies the first
+        if not calls:
+            writer.write(2, 2.0, grids=grids(4.0))
+        calls.append(1)
+        return copyto(dst, src, *args, **kwargs)
+
+    monkeypatch.setattr(np, "copyto", overwriting)
+    frame = reader.read(timeout=0)
+    assert int(frame["seq"]) == 2
+    assert reader.retries == 1
@@ -0,0 +1,14 @@
+from log import Log
+
+
+def test_stop_flushes_rate_limited_lines(capsys):
+    log = Log()
+    log.start({"RATE_LIMITS": {"message": 60}})
+    log.info("message", "x:%.2fm", 1.0)
+    log.info("message", "x:%.2fm", 2.0)
+    log.error("main", "failed")
+    log.stop()
+    out = capsys.readouterr().out
+    assert "failed" in out
+    assert "x:2.00m (2 in" in out
+    assert "x:1.00m" not in out
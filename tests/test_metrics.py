@@ -0,0 +1,36 @@
+import math
+
+import numpy as np
+
+from metrics import BIN_EDGES, CAPTURE, DETECT, RECEIVE, WRITTEN, Metrics
+
+
+def test_percentiles_are_bin_upper_edges():
+    metrics = Metrics()
+    for seq, latency in enumerate([0.001] * 90 + [0.01] * 9 + [0.1]):
+        metrics.mark(seq, CAPTURE, 100.0)
+        metrics.mark(seq, RECEIVE, 100.0 + latency)
+    p50, p95, p99 = Metrics.percentiles(metrics.total[RECEIVE])
+    for value, latency in ((p50, 0.001), (p95, 0.01), (p99, 0.01)):
+        index = np.searchsorted(BIN_EDGES, value)
+        assert BIN_EDGES[index - 1] < latency <= value  # Within its bin
+    assert Metrics.percentiles(metrics.total[WRITTEN]) == [math.nan] * 3
+
+
+def test_marks_before_capture_are_not_counted():
+    metrics = Metrics()
+    metrics.mark(0, RECEIVE, 1.0)
+    assert not metrics.total[RECEIVE].any()
+    assert metrics.counts[RECEIVE] == 1  # Still a frame, for fps
+
+
+def test_summary_only_has_marked_stages():
+    metrics = Metrics()
+    metrics.mark(0, CAPTURE)
+    metrics.mark(0, RECEIVE)
+    metrics.mark(0, DETECT)
+    summary = metrics.summary()
+    assert summary.startswith("capture ")
+    assert "detect " in summary
+    assert "queued" not in summary and "written" not in summary
+    assert not metrics.window.any() and not metrics.counts.any()  # New window
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+import pytest
+
+from point_cloud import PointCloud, undistort
+
+SHAPE = (64, 40)  # W,H
+CONFIG = {
+    "POINT_CLOUD": {"STRIDE": 2, "VOXEL": 2.0, "MIN_POINTS": 3, "NEAREST": 2},
+    "MASK_THRESHOLD": 0.5,
+    "MAX_DISTANCE": 35,
+    "USE_INTRINSIC": False,
+    "GRID_NUM": [5, 4],
+    "IGNORE_GRIDS": [0, 0, 0, 0],
+}
+
+
+def frame(*boxes):
+    # boxes: (top, bottom, left, right, depth in mm)
+    mask = np.zeros((SHAPE[1], SHAPE[0]), dtype=np.float16)
+    depth = np.zeros((SHAPE[1], SHAPE[0]), dtype=np.uint16)
+    for top, bottom, left, right, z in boxes:
+        mask[top:bottom, left:right] = 1
+        depth[top:bottom, left:right] = z
+    return mask, depth
+
+
+def test_nearest_voxels_first():
+    cloud = PointCloud(CONFIG, SHAPE, hfov=90.0)
+    # Right of and below the center at 6m, at the left edge at 4m, a voxel each
+    points = cloud(*frame((20, 28, 34, 42, 6000), (20, 28, 0, 8, 4000)))
+    assert len(points) == 2
+    left, center = points
+    assert np.linalg.norm(left) < np.linalg.norm(center)
+    assert center[0] == pytest.approx(6.0)  # Forward is the depth
+    assert 0 < center[1] < 2 and 0 <= center[2] < 2  # Starboard, down
+    assert left[0] == pytest.approx(4.0) and left[1] < -3  # Port
+
+
+def test_sparse_and_out_of_range_points_dropped():
+    cloud = PointCloud(CONFIG, SHAPE, hfov=90.0)
+    assert len(cloud(*frame((20, 21, 30, 31, 5000)))) == 0  # Below MIN_POINTS
+    assert len(cloud(*frame((20, 28, 34, 42, 40000)))) == 0  # Beyond MAX_DISTANCE
+
+
+def test_ignore_grids():
+    config = dict(CONFIG, IGNORE_GRIDS=[0, 0, 1, 0])  # Left 16 pixels
+    cloud = PointCloud(config, SHAPE, hfov=90.0)
+    assert len(cloud(*frame((20, 28, 0, 8, 4000)))) == 0
+    assert len(cloud(*frame((20, 28, 34, 42, 4000)))) == 1
+
+
+def test_undistort_matches_opencv():
+    distortion = np.array([-0.2, 0.05, 0.001, -0.002, 0.01])
+    x, y = np.meshgrid(np.linspace(-0.6, 0.6, 7), np.linspace(-0.4, 0.4, 5))
+    expected = cv2.undistortPoints(
+        np.stack([x, y], -1).reshape(-1, 1, 2), np.eye(3), distortion
+    ).reshape(-1, 2)
+    ux, uy = undistort(x.reshape(-1), y.reshape(-1), distortion)
+    np.testing.assert_allclose(np.stack([ux, uy], -1), expected, atol=1e-4)
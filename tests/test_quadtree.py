@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from quadtree import QuadtreeReducer
+from z2xy import frd_rays, z2xy_grid
+
+SHAPE = (32, 32)  # W,H, cells of 16, 8 and 4 pixels
+CONFIG = {
+    "QUADTREE": {"LEVELS": 2, "REFINE_DISTANCE": 10, "NEAREST": 8},
+    "MASK_THRESHOLD": 0.5,
+    "GRID_THRESHOLD": 40,  # Pixels, 10 and 2.5 below
+    "USE_INTRINSIC": False,
+    "GRID_NUM": [2, 2],
+    "IGNORE_GRIDS": [0, 0, 0, 0],
+}
+
+
+def frame(*boxes):
+    # boxes: (top, bottom, left, right, depth in mm)
+    mask = np.zeros((SHAPE[1], SHAPE[0]), dtype=np.float16)
+    depth = np.zeros((SHAPE[1], SHAPE[0]), dtype=np.uint16)
+    for top, bottom, left, right, z in boxes:
+        mask[top:bottom, left:right] = 1
+        depth[top:bottom, left:right] = z
+    return mask, depth
+
+
+def rays(level):
+    grid_num = [n << level for n in CONFIG["GRID_NUM"]]
+    z2x, z2y = z2xy_grid(dict(CONFIG, GRID_NUM=grid_num), SHAPE, hfov=90.0)
+    return frd_rays(z2x, z2y)[0]
+
+
+def test_near_obstacle_split_to_the_finest_cells():
+    reducer = QuadtreeReducer(CONFIG, SHAPE, hfov=90.0)
+    points = reducer(*frame((0, 8, 0, 8, 2000)))
+    assert reducer.cells == 4 + 4 + 4  # Grids, one's quarters, their quarters
+    expected = rays(2)[:2, :2].reshape(-1, 3) * 2.0
+    assert sorted(map(tuple, points)) == pytest.approx(sorted(map(tuple, expected)))
+
+
+def test_far_obstacle_not_split():
+    reducer = QuadtreeReducer(CONFIG, SHAPE, hfov=90.0)
+    points = reducer(*frame((0, 8, 0, 8, 20000)))
+    assert reducer.cells == 4
+    assert points == pytest.approx(rays(0)[:1, 0] * 20.0)
+
+
+def test_split_cell_without_obstacle_quarters_stays_whole():
+    reducer = QuadtreeReducer(CONFIG, SHAPE, hfov=90.0)
+    reducer.threshold[1] = np.full((4, 4), 20.0)  # Stricter than a quarter
+    # 48 pixels over the grid threshold, 12 in each quarter
+    boxes = [(top, top + 4, left, left + 3, 2000) for top in (0, 8) for left in (0, 8)]
+    points = reducer(*frame(*boxes))
+    assert reducer.cells == 4 + 4
+    assert points == pytest.approx(rays(0)[:1, 0] * 2.0)
+
+
+def test_nearest_first_across_levels():
+    reducer = QuadtreeReducer(
+        dict(CONFIG, QUADTREE=dict(CONFIG["QUADTREE"], NEAREST=5)), SHAPE, hfov=90.0
+    )
+    # Far grids at 15m and 12m, not split, a near obstacle at 3m, split
+    points = reducer(
+        *frame((16, 32, 16, 32, 15000), (0, 16, 16, 32, 12000), (16, 24, 0, 8, 3000))
+    )
+    assert len(points) == 5  # The 15m grid is cut
+    distance = np.linalg.norm(points, axis=1)
+    assert (np.diff(distance) >= 0).all()
+    assert points[0] == pytest.approx(rays(2)[4, 1] * 3.0)  # Nearest the axis
+    assert points[4] == pytest.approx(rays(0)[0, 1] * 12.0)
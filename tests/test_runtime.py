@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+import pytest
+import yaml
+from pymavlink import mavutil
+
+from flight_recorder import read_records
+from frame_source import create_frame_source, expand_cameras
+from metrics import DETECT, RECEIVE, WRITTEN, Metrics
+from publisher import ObstaclePublisher
+from runtime import LatestChannel, Runtime
+from test_transport import Connection
+from transport import MavlinkWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def config():
+    # One synthetic camera, detected here
+    with open(os.path.join(ROOT, "config.yaml")) as f:
+        config = yaml.safe_load(f)
+    synthetic = dict(config["SYNTHETIC"], FPS=30, FRAMES=10)
+    return dict(
+        config,
+        FRAME_SOURCE="synthetic",
+        HOST_SIDE=True,
+        SYNTHETIC=synthetic,
+        FRAME_TIMEOUT=10,
+    )
+
+
+def cameras(config):
+    # Two of them, one process each
+    camera = {key: config[key] for key in ("FRAME_SOURCE", "HOST_SIDE", "SYNTHETIC")}
+    return dict(
+        config,
+        CAMERAS=[dict(camera, MOUNT={"YAW": -60}), dict(camera, MOUNT={"YAW": 60})],
+    )
+
+
+def run(config):
+    # Until the frames run out, as main.py
+    config = expand_cameras(config)
+    connection = Connection()
+    writer = MavlinkWriter(connection, config)
+    publisher = ObstaclePublisher(config, writer, lambda: 0)
+    metrics = Metrics(interval=60)
+    with create_frame_source(config) as source:
+        publisher.set_projection(*source.projection(config))
+        runtime = Runtime(config, source, publisher, writer, metrics)
+        asyncio.run(runtime.run())
+    return runtime, metrics, connection
+
+
+def test_latest_channel_replaces_unread_value():
+    async def main():
+        dropped = []
+        channel = LatestChannel(on_drop=dropped.append)
+        channel.put(1)
+        channel.put(2)  # 1 never read
+        assert await channel.get() == 2
+        channel.put(3)
+        assert await channel.get() == 3
+        return dropped
+
+    assert asyncio.run(main()) == [1]
+
+
+def test_frames_detected_and_published(config):
+    runtime, metrics, connection = run(config)
+    assert runtime.reducer is not None
+    assert metrics.counts[RECEIVE] == 10
+    assert 0 < metrics.counts[DETECT] <= 10  # A frame may be superseded
+    assert metrics.counts[WRITTEN] > 0
+    messages = mavutil.mavlink.MAVLink(None).parse_buffer(b"".join(connection.written))
+    types = {message.get_type() for message in messages}
+    assert "OBSTACLE_DISTANCE_3D" in types and "HEARTBEAT" in types
+
+
+def test_cameras_with_live_feed(config):
+    config = cameras(config)
+    name = f"test_live_{os.getpid()}"
+    config["LIVE"] = dict(config["LIVE"], ENABLE=True, NAME=name)
+    runtime, metrics, _ = run(config)
+    assert metrics.total[0].sum() > 0  # Frames went through
+    assert runtime.live.meta["GRID_SHAPE"] == [5, 10]
+    assert runtime.live.meta["DECIMATION"] == 0  # No pixels to share
+
+
+def test_cameras_with_recorder(config, tmp_path):
+    config = cameras(config)
+    config["RECORDER"] = dict(config["RECORDER"], ENABLE=True, PATH=str(tmp_path))
+    config["RECORDER"].update(RATE=0, SIZE=1)  # Every frame, 1MB
+    run(config)
+    records = [record for record, _ in read_records(str(tmp_path))]
+    assert records
+    assert records[0]["grids"].shape == (5, 10, 3)
+    assert records[0]["depth"].size == 0  # Grids only
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import scheduler
+from scheduler import MessageScheduler
+
+SIZES = {"3D": 40, "DISTANCE": 160}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    return clock
+
+
+def create(clock, rate=1000, grid_num=(2, 2)):
+    return MessageScheduler(
+        {"LINK_BUDGET": rate, "GRID_NUM": list(grid_num), "PRIORITY_HORIZON": 1.0},
+        SIZES,
+    )
+
+
+def test_token_bucket_paces_after_the_burst(clock):
+    link = create(clock)  # 1000B/s, 160B burst (the largest message)
+    assert link.capacity == 160
+    assert link.acquire(["3D"] * 4) == 0  # The burst
+    assert link.acquire(["3D"]) == pytest.approx(0.04)  # 40B of debt at 1000B/s
+    clock.now += 0.04  # Waited, paid
+    assert link.acquire(["3D"]) == pytest.approx(0.04)
+    clock.now += 10  # Refilled to the burst, not beyond
+    assert link.acquire(["DISTANCE"]) == 0
+    assert link.acquire(["3D"]) == pytest.approx(0.04)
+    assert link.report() == "sent 8 dropped 0 deferred 3 merged 0"
+
+
+def test_approaching_obstacle_ranked_first(clock):
+    link = create(clock, rate=100000)
+    index = np.array([0, 1])
+    link.rank(index, np.array([[5.0, 0, 0], [8.0, 0, 0]]), timestamp=0.0)
+    # Grid 1 closed 4m in 1s, nearer than grid 0 after PRIORITY_HORIZON
+    order, _ = link.rank(index, np.array([[5.0, 0, 0], [4.0, 0, 0]]), timestamp=1.0)
+    assert order.tolist() == [1, 0]
+    order, _ = link.rank(
+        index,
+        np.array([[5.0, 0, 0], [4.0, 0, 0]]),
+        timestamp=2.0,
+        closing=np.array([3.0, 0.0]),  # Known, e.g. tracked
+    )
+    assert order.tolist() == [0, 1]
+
+
+def test_saturated_tail_merged_into_its_nearest(clock):
+    link = create(clock, rate=1000, grid_num=(1, 8))
+    link.tokens = 0  # Nothing left for this frame
+    link.frame_interval = 0.1  # 100B until the next one: 2 messages
+    index = np.arange(4)
+    points = np.array([[3.0, 0, 0], [9.0, 0, 0], [2.0, 0, 0], [6.0, 0, 0]])
+    kept, kept_points = link.rank(index, points, timestamp=0.0)
+    # The nearest one first, then the nearest of the rest stands for them all
+    assert kept.tolist() == [2, 0]
+    assert kept_points[:, 0].tolist() == [2.0, 3.0]
+    assert link.merged == 2
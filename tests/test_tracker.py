@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from tracker import GridTracker
+
+CONFIG = {
+    "GRID_NUM": [1, 2],
+    "TRACKER": {
+        "ALPHA": 0.5,
+        "ENTER": 2,
+        "EXIT": 2,
+        "CHANGE_DISTANCE": 0.5,
+        "KEEPALIVE": 1.0,
+    },
+}
+VALID = np.ones((1, 2), dtype=bool)
+
+
+def grids(*z):
+    # Grid i detected at z[i] m, None for not detected
+    out = np.zeros((1, len(z), 2))
+    for i, value in enumerate(z):
+        if value is not None:
+            out[0, i] = [1, value]
+    return out
+
+
+def test_obstacle_enters_after_enter_frames():
+    tracker = GridTracker(CONFIG)
+    out = tracker.update(grids(10.0, None), 0.0)
+    assert out[0, 0, 0] == 0  # Once is noise
+    out = tracker.update(grids(9.0, None), 1.0)
+    assert out[0, 0, 0] == pytest.approx(0.75)  # Smoothed detection rate
+    assert out[0, 0, 1] == pytest.approx(9.5)  # Smoothed from its first depth
+    assert out[0, 0, 2] == pytest.approx(0.25)  # Closing 0.5m/s, smoothed
+    assert out[0, 1, 0] == 0
+
+
+def test_obstacle_kept_through_a_miss_then_expires():
+    tracker = GridTracker(CONFIG)
+    tracker.update(grids(10.0, None), 0.0)
+    tracker.update(grids(10.0, None), 1.0)
+    out = tracker.update(grids(None, None), 2.0)
+    assert out[0, 0, 0] > 0 and out[0, 0, 1] == 10.0  # A single miss
+    out = tracker.update(grids(None, None), 3.0)
+    assert out[0, 0, 0] == 0 and out[0, 0, 2] == 0  # EXIT misses
+    assert np.isnan(tracker.depth[0, 0])  # Forgotten
+    tracker.update(grids(4.0, None), 4.0)
+    out = tracker.update(grids(4.0, None), 5.0)
+    assert out[0, 0, 1] == 4.0  # A new obstacle, not smoothed from the old one
+
+
+def test_only_changes_are_reported():
+    tracker = GridTracker(CONFIG)
+    tracker.update(grids(10.0, 5.0), 0.0)
+    first = tracker.update(grids(10.0, 5.0), 0.1)
+    changed, frame_due = tracker.changes(first, VALID, 0.1)
+    assert changed.tolist() == [[True, True]] and frame_due
+    tracker.reported(first, VALID, np.flatnonzero(changed), 0.1, frame=True)
+
+    out = tracker.update(grids(10.2, 5.0), 0.2)  # Moved less than 0.5m
+    changed, frame_due = tracker.changes(out, VALID, 0.2)
+    assert not changed.any() and not frame_due
+
+    out = tracker.update(grids(8.0, 5.0), 0.3)  # Smoothed, moved about 1m
+    changed, frame_due = tracker.changes(out, VALID, 0.3)
+    assert changed.tolist() == [[True, False]] and frame_due
+    tracker.reported(out, VALID, np.flatnonzero(changed), 0.3)
+
+    changed, frame_due = tracker.changes(out, VALID, 1.1)  # KEEPALIVE
+    assert changed.tolist() == [[False, True]] and frame_due
@@ -0,0 +1,40 @@
+from pymavlink import mavutil
+
+from transport import MavlinkWriter
+
+CONFIG = {"MIN_DISTANCE": 0.35, "MAX_DISTANCE": 35}
+
+
+class Connection:
+    # Stands in for a mavutil connection, keeps the written bytes
+    def __init__(self):
+        self.mav = mavutil.mavlink.MAVLink(None)
+        self.written = []
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+
+def test_template_matches_pymavlink():
+    connection = Connection()
+    writer = MavlinkWriter(connection, CONFIG)
+    assert writer.use_template
+
+    reference = mavutil.mavlink.MAVLink(None)
+    expected = b""
+    for i, (forward, right, down) in enumerate([(1.0, -2.5, 0.25), (30.0, 4.0, 0)]):
+        expected += reference.obstacle_distance_3d_encode(
+            1000 + i, 4, 12, 65535, forward, right, down, 0.35, 35
+        ).pack(reference)
+        reference.seq += 1
+    with writer:
+        writer.obstacle_distance_3d(1000, 1.0, -2.5, 0.25)
+        writer.obstacle_distance_3d(1001, 30.0, 4.0, 0)
+    assert connection.written == [expected]
+
+
+def test_template_mismatch_detected():
+    connection = Connection()
+    writer = MavlinkWriter(connection, CONFIG)
+    writer.template[-3] ^= 0xFF  # As if the message definition had changed
+    assert not writer.template_matches()
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class GridTracker:
+    # Per grid state over frames, the whole grid updated in one step
+    def __init__(self, config):
+        tracker_config = config.get("TRACKER") or {}
+        self.alpha = tracker_config.get("ALPHA", 0.3)  # Smoothing, 1 for none
+        self.enter = tracker_config.get("ENTER", 2)  # in frames
+        self.exit = tracker_config.get("EXIT", 3)  # in frames
+        self.change_distance = tracker_config.get("CHANGE_DISTANCE", 0.5)  # in m
+        self.keepalive = tracker_config.get("KEEPALIVE", 0.5)  # in s
+
+        shape = (config["GRID_NUM"][0], config["GRID_NUM"][1])
+        self.depth = np.full(shape, np.nan)  # Smoothed z, in m
+        self.confidence = np.zeros(shape)  # Smoothed detection rate, 0-1
+        self.speed = np.zeros(shape)  # Smoothed closing speed, in m/s
+        self.hits = np.zeros(shape, dtype=np.int64)  # Consecutive detections
+        self.misses = np.zeros(shape, dtype=np.int64)  # Consecutive misses
+        self.present = np.zeros(shape, dtype=bool)  # After hysteresis
+        self.last_timestamp = None
+
+        # What the publisher has reported
+        self.reported_present = np.zeros(shape, dtype=bool)
+        self.reported_depth = np.full(shape, np.nan)
+        self.reported_time = np.full(shape, -np.inf)
+        self.frame_time = -np.inf  # Last whole-frame report
+
+    def update(self, grids, timestamp):
+        # grids: (GRID_NUM, 2) label,z(in m), from detection
+        # Returns (GRID_NUM, 3) confidence(0 if cleared),z(in m),closing speed(in m/s)
+        detected = grids[..., 0] > 0
+        z = grids[..., 1]
+
+        np.copyto(self.hits, np.where(detected, self.hits + 1, 0))
+        np.copyto(self.misses, np.where(detected, 0, self.misses + 1))
+        self.present |= self.hits >= self.enter
+        self.present &= self.misses < self.exit
+        self.confidence += (detected - self.confidence) * self.alpha
+
+        # New obstacles start at their depth, cleared ones forget it
+        depth = np.where(
+            np.isnan(self.depth), z, self.depth + (z - self.depth) * self.alpha
+        )
+        depth = np.where(detected, depth, self.depth)
+        if self.last_timestamp is not None and timestamp > self.last_timestamp:
+            closing = (self.depth - depth) / (timestamp - self.last_timestamp)
+            closing = np.where(np.isfinite(closing), closing, 0)
+            self.speed += (closing - self.speed) * self.alpha
+        self.last_timestamp = timestamp
+        self.depth = np.where(self.present | detected, depth, np.nan)
+        self.speed[~(self.present | detected)] = 0
+
+        out = np.empty(self.depth.shape + (3,))
+        out[..., 0] = np.where(self.present, self.confidence, 0)
+        out[..., 1] = np.where(self.present, self.depth, 0)
+        out[..., 2] = self.speed
+        return out
+
+    def changes(self, grids, valid, timestamp):
+        # Grids to report: new, moved more than CHANGE_DISTANCE, or due for keep-alive
+        # Plus whether a whole-frame message is due (anything changed or cleared)
+        present = (grids[..., 0] > 0) & valid
+        changed = present & (
+            ~self.reported_present
+            | (np.abs(grids[..., 1] - self.reported_depth) > self.change_distance)
+            | (timestamp - self.reported_time >= self.keepalive)
+        )
+        cleared = self.reported_present & ~present
+        frame_due = (
+            changed.any()
+            or cleared.any()
+            or timestamp - self.frame_time >= self.keepalive
+        )
+        return changed, frame_due
+
+    def reported(self, grids, valid, index, timestamp, frame=False):
+        # index: flat index of the grids sent, frame: a whole-frame message was sent
+        present = (grids[..., 0] > 0) & valid
+        if frame:
+            index = np.flatnonzero(present)
+            self.frame_time = timestamp
+        self.reported_present &= present  # Cleared ones need no message
+        self.reported_present.flat[index] = True
+        self.reported_depth.flat[index] = grids[..., 1].flat[index]
+        self.reported_time.flat[index] = timestamp
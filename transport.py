@@ -0,0 +1,148 @@
+import struct
+import threading
+
+from pymavlink import mavutil
+
+mavlink = mavutil.mavlink
+
+OBSTACLE_DISTANCE_3D = mavlink.MAVLink_obstacle_distance_3d_message
+HEADER = struct.Struct("<BBBBBBBHB")  # magic,len,incompat,compat,seq,sys,comp,msgid
+VARIABLE = struct.Struct("<Ifff")  # time_boot_ms,x,y,z
+CONSTANT = struct.Struct("<ffHBB")  # min_distance,max_distance,obstacle_id,type,frame
+
+
+class MavlinkWriter:
+    # The only writer of the connection: one write syscall per frame
+    def __init__(self, connection, config, max_bytes=8192):
+        self.connection = connection
+        self.mav = connection.mav
+        self.lock = threading.Lock()
+        self.buffer = bytearray(max_bytes)  # Preallocated frame buffer
+        self.view = memoryview(self.buffer)
+        self.length = 0
+        self.last_frame = self.view[:0]  # Last flushed frame, valid until the next
+
+        # OBSTACLE_DISTANCE_3D template, all but seq/time/x/y/z never change
+        self.min_distance = float(config["MIN_DISTANCE"])  # in m
+        self.max_distance = float(config["MAX_DISTANCE"])  # in m
+        constant = CONSTANT.pack(
+            self.min_distance,
+            self.max_distance,
+            65535,  # UINT16_MAX (Unknown)
+            4,  # MAV_DISTANCE_SENSOR_UNKNOWN
+            12,  # MAV_FRAME_BODY_FRD
+        )
+        self.payload_len = VARIABLE.size + len(constant)  # frame!=0, no truncation
+        self.template = bytearray(HEADER.size + self.payload_len + 2)
+        HEADER.pack_into(
+            self.template,
+            0,
+            mavlink.PROTOCOL_MARKER_V2,
+            self.payload_len,
+            0,  # incompat_flags
+            0,  # compat_flags
+            0,  # seq
+            self.mav.srcSystem,
+            self.mav.srcComponent,
+            OBSTACLE_DISTANCE_3D.id & 0xFFFF,
+            OBSTACLE_DISTANCE_3D.id >> 16,
+        )
+        self.template[HEADER.size + VARIABLE.size : -2] = constant
+        self.crc_extra = bytes([OBSTACLE_DISTANCE_3D.crc_extra])
+        # Only plain MAVLink2 can use the template
+        self.use_template = (
+            float(mavlink.WIRE_PROTOCOL_VERSION) == 2.0
+            and not self.mav.signing.sign_outgoing
+        )
+        if self.use_template and not self.template_matches():
+            # e.g. another pymavlink version or dialect
+            self.use_template = False
+
+    def template_matches(self):
+        # Same bytes as pymavlink for one message
+        args = (123456, 1.5, -2.25, 0.75)
+        packet = bytearray(len(self.template))
+        self._pack(packet, *args)
+        expected = self.mav.obstacle_distance_3d_encode(
+            args[0],
+            4,  # MAV_DISTANCE_SENSOR_UNKNOWN
+            12,  # MAV_FRAME_BODY_FRD
+            65535,  # UINT16_MAX (Unknown)
+            *args[1:],
+            self.min_distance,
+            self.max_distance,
+        ).pack(self.mav)
+        return bytes(packet) == bytes(expected)
+
+    def __enter__(self):
+        # One frame, serialized with other writers
+        self.lock.acquire()
+        self.length = 0
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.flush()
+        finally:
+            self.lock.release()
+
+    def _reserve(self, size):
+        start = self.length
+        if start + size > len(self.buffer):
+            self.flush()  # Full, should not happen with a proper max_bytes
+            start = 0
+        self.length = start + size
+        return start
+
+    def _sent(self, size):
+        self.mav.seq = (self.mav.seq + 1) % 256
+        self.mav.total_packets_sent += 1
+        self.mav.total_bytes_sent += size
+
+    def obstacle_distance_3d(self, time_boot_ms, forward, right, down):
+        if not self.use_template:
+            return self.message(
+                self.mav.obstacle_distance_3d_encode(
+                    time_boot_ms,
+                    4,  # MAV_DISTANCE_SENSOR_UNKNOWN
+                    12,  # MAV_FRAME_BODY_FRD
+                    65535,  # UINT16_MAX (Unknown)
+                    forward,
+                    right,
+                    down,
+                    self.min_distance,
+                    self.max_distance,
+                )
+            )
+
+        size = len(self.template)
+        start = self._reserve(size)
+        self._pack(self.view[start : start + size], time_boot_ms, forward, right, down)
+        self._sent(size)
+
+    def _pack(self, packet, time_boot_ms, forward, right, down):
+        # OBSTACLE_DISTANCE_3D from the template, seq not advanced
+        packet[:] = self.template
+        packet[4] = self.mav.seq
+        VARIABLE.pack_into(packet, HEADER.size, time_boot_ms, forward, right, down)
+        crc = mavlink.x25crc(packet[1:-2])
+        crc.accumulate(self.crc_extra)
+        struct.pack_into("<H", packet, len(packet) - 2, crc.crc)
+
+    def message(self, message):
+        # Any other message, encoded by pymavlink
+        packet = message.pack(self.mav)
+        start = self._reserve(len(packet))
+        self.view[start : start + len(packet)] = packet
+        self._sent(len(packet))
+
+    def flush(self):
+        if self.length:
+            self.last_frame = self.view[: self.length]
+            self.connection.write(self.last_frame)  # Single syscall
+            self.length = 0
+
+    def send(self, message):
+        # A standalone message, e.g. heartbeat
+        with self:
+            self.message(message)
@@ -0,0 +1,227 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_TRIPLEX
+SCALE = 0.4
+WHITE = 255
+TEXT_CACHE = 4096  # Rendered strings kept, cleared when full
+VIDEO = {".mp4": "mp4v", ".avi": "MJPG", ".mkv": "MJPG"}  # Extension -> fourcc
+
+
+class Visualizer:
+    # Grids over the colorized depth (and RGB), rendered by a background thread
+    # Only the latest submitted frame is rendered, acquisition never waits
+    # The window is only touched by the main thread, see show
+    def __init__(self, config, grid_shape, axes="xyz", output=None):
+        # output: video file (see VIDEO) or image directory instead of a window
+        vis = config.get("VISUALIZER") or {}
+        self.width, self.height = vis.get("SIZE", [1280, 720])
+        self.output = output if output is not None else vis.get("OUTPUT")
+        self.rows, self.cols = grid_shape
+        self.axes = axes
+
+        # Depth(in mm) to BGR, fixed MIN_DISTANCE/MAX_DISTANCE scaling
+        lo, hi = config["MIN_DISTANCE"] * 1000, config["MAX_DISTANCE"] * 1000
+        scaled = (np.arange(2**16, dtype=np.float32) - lo) / (hi - lo) * 255
+        scaled = np.clip(scaled, 0, 255).astype(np.uint8).reshape(-1, 1)
+        self.depth_colors = cv2.applyColorMap(scaled, cv2.COLORMAP_JET).reshape(-1, 3)
+        self.depth_colors[0] = 0  # No depth
+
+        # White text and lines, composed with np.maximum
+        self.texts = {}  # string -> (mask, top offset)
+        self.static = np.zeros((self.height, self.width), np.uint8)
+        self.cells = []  # (top, bottom, left, right) of each grid
+        for i in range(self.rows):
+            for j in range(self.cols):
+                top, bottom = (
+                    self.height * i // self.rows,
+                    self.height * (i + 1) // self.rows,
+                )
+                left, right = (
+                    self.width * j // self.cols,
+                    self.width * (j + 1) // self.cols,
+                )
+                self.cells.append((top, bottom, left, right))
+        for i in range(1, self.rows):
+            y = int(self.height * i / self.rows)
+            cv2.line(self.static, (0, y), (self.width - 1, y), WHITE, 1)
+        for j in range(1, self.cols):
+            x = int(self.width * j / self.cols)
+            cv2.line(self.static, (x, 0), (x, self.height - 1), WHITE, 1)
+        full = (0, self.height, 0, self.width)
+        # Value positions of each cell, after their static names
+        self.slots = []
+        for top, bottom, left, right in self.cells:
+            slots = []
+            for k, name in enumerate(["label"] + list(axes)):
+                x, y = left + 3, top + 12 * (k + 1)
+                x += self.blit(self.static, name + ":", x, y, full)
+                slots.append((x, y))
+            self.slots.append(slots)
+        x, y = 2, self.height - 4
+        self.fps_slot = (x + self.blit(self.static, "Fps: ", x, y, full), y)
+        self.fps_region = (y - 16, self.height, self.fps_slot[0], self.width)
+        self.fps_cells = np.array(
+            [
+                top < self.fps_region[1]
+                and bottom > self.fps_region[0]
+                and left < self.fps_region[3]
+                and right > self.fps_region[2]
+                for top, bottom, left, right in self.cells
+            ]
+        ).reshape(self.rows, self.cols)
+        self.overlay = self.static.copy()
+        self.shown_labels = np.full((self.rows, self.cols), -1, np.int32)
+        self.shown_xyz = np.zeros((self.rows, self.cols, 3), np.int32)  # in dm
+        self.shown_fps = None
+
+        self.black = np.zeros((self.height, self.width, 3), np.uint8)
+        self.frame = np.empty_like(self.black)  # Rendered, reused
+        self.writer = None
+        if self.output is not None:
+            extension = os.path.splitext(self.output)[1].lower()
+            if extension in VIDEO:
+                self.writer = cv2.VideoWriter(
+                    self.output,
+                    cv2.VideoWriter_fourcc(*VIDEO[extension]),
+                    vis.get("FPS", 30),
+                    (self.width, self.height),
+                )
+            else:
+                os.makedirs(self.output, exist_ok=True)
+
+        self.cond = threading.Condition()
+        self.pending = None
+        self.latest = None  # Rendered, not shown yet
+        self.closing = False
+        self.stopped = False  # q pressed in the window
+        self.error = None  # Exception that stopped the thread
+        self.rendered = self.dropped = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, seq, grids, xyz, img=None, depth=None, fps=0.0):
+        # grids: (GRID_SHAPE,2 or more) label,z, xyz: (GRID_SHAPE,3) in m
+        # Copied, the callers reuse their buffers
+        frame = (
+            seq,
+            np.array(grids[..., 0], dtype=np.int32),
+            np.rint(np.asarray(xyz) * 10).astype(np.int32),
+            None if img is None else np.array(img),
+            None if depth is None else np.array(depth, dtype=np.uint16),
+            fps,
+        )
+        with self.cond:
+            if self.pending is not None:
+                self.dropped += 1  # Superseded before rendering
+            self.pending = frame
+            self.cond.notify()
+
+    def run(self):
+        try:
+            while True:
+                with self.cond:
+                    while self.pending is None and not self.closing:
+                        self.cond.wait()
+                    if self.pending is None:
+                        return
+                    frame, self.pending = self.pending, None
+                self.emit(frame[0], self.render(*frame[1:]))
+        except Exception as e:  # Raised again by the caller, see error
+            print(f"Visualizer stopped: {e!r}")
+            self.error = e
+
+    def render(self, labels, xyz, img, depth, fps):
+        if depth is not None:
+            blend = self.depth_colors[depth]
+            if img is not None:
+                blend = cv2.addWeighted(img, 0.5, blend, 0.5, 0)
+        elif img is not None:
+            blend = img
+        else:
+            blend = self.black
+        if blend.shape[:2] != (self.height, self.width):
+            blend = cv2.resize(
+                blend, (self.width, self.height), interpolation=cv2.INTER_NEAREST
+            )
+
+        # Only the cells whose shown values changed
+        changed = (labels != self.shown_labels) | (xyz != self.shown_xyz).any(-1)
+        for i, j in zip(*np.nonzero(changed)):
+            top, bottom, left, right = region = self.cells[i * self.cols + j]
+            self.overlay[top:bottom, left:right] = self.static[top:bottom, left:right]
+            values = ["{:d}".format(labels[i, j] & 0xFF)]
+            values += ["{:.1f}m".format(v / 10) for v in xyz[i, j]]
+            for (x, y), value in zip(self.slots[i * self.cols + j], values):
+                self.blit(self.overlay, value, x, y, region)
+        self.shown_labels[...] = labels
+        self.shown_xyz[...] = xyz
+        fps = "{:.2f}".format(fps)
+        if fps != self.shown_fps or changed[self.fps_cells].any():
+            top, bottom, left, right = self.fps_region
+            self.overlay[top:bottom, left:right] = self.static[top:bottom, left:right]
+            self.blit(self.overlay, fps, *self.fps_slot, self.fps_region)
+            self.shown_fps = fps
+
+        np.maximum(blend, self.overlay[..., None], out=self.frame)
+        return self.frame
+
+    def emit(self, seq, frame):
+        if self.output is None:
+            with self.cond:
+                self.latest = frame.copy()  # The next render reuses frame
+        elif self.writer is not None:
+            self.writer.write(frame)
+        else:
+            cv2.imwrite(os.path.join(self.output, f"{seq:08d}.jpg"), frame)
+        self.rendered += 1
+
+    def show(self):
+        # Main thread: the latest rendered frame to the window, q to stop
+        if self.output is not None:
+            return
+        with self.cond:
+            frame, self.latest = self.latest, None
+        if frame is not None:
+            cv2.imshow("BLEND", frame)
+        if cv2.waitKey(1) == ord("q"):
+            self.stopped = True
+
+    def text(self, string):
+        # Mask of a string, rendered once
+        cached = self.texts.get(string)
+        if cached is None:
+            (width, height), baseline = cv2.getTextSize(string, FONT, SCALE, 1)
+            mask = np.zeros((height + baseline + 2, width + 2), np.uint8)
+            cv2.putText(mask, string, (1, height + 1), FONT, SCALE, WHITE)
+            if len(self.texts) >= TEXT_CACHE:
+                self.texts.clear()
+            cached = self.texts[string] = (mask, height + 1)
+        return cached
+
+    def blit(self, layer, string, x, y, region):
+        # As cv2.putText at (x, y), clipped to region, returns the text width
+        mask, above = self.text(string)
+        top, left = y - above, x - 1
+        t, b = max(top, region[0]), min(top + mask.shape[0], region[1])
+        l, r = max(left, region[2]), min(left + mask.shape[1], region[3])
+        if t < b and l < r:
+            view = layer[t:b, l:r]
+            np.maximum(view, mask[t - top : b - top, l - left : r - left], out=view)
+        return mask.shape[1] - 2
+
+    def report(self):
+        return f"visualizer: {self.rendered} rendered, {self.dropped} dropped"
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.thread.join()
+        if self.writer is not None:
+            self.writer.release()
+        if self.output is None:
+            cv2.destroyAllWindows()
@@ -72,3 +72,88 @@ def z2xy_coefficient_fov(grid_height, grid_width, grid_num_h, grid_num_w, hfov=6
     y_coefficient = ((cy - grid_cy) * fy_r).flatten()
 
     return x_coefficient, y_coefficient
+
+
+def z2xy_grid(config, INPUT_SHAPE, intrinsics=None, hfov=None):
+    # Fixed z to x,y coefficient of each grid, shaped as GRID_NUM
+    assert INPUT_SHAPE[1] % config["GRID_NUM"][0] == 0
+    assert INPUT_SHAPE[0] % config["GRID_NUM"][1] == 0
+    grid_height = INPUT_SHAPE[1] // config["GRID_NUM"][0]
+    grid_width = INPUT_SHAPE[0] // config["GRID_NUM"][1]
+    if config["USE_INTRINSIC"]:
+        # Use intrinsic matrix
+        z2x, z2y = z2xy_coefficient(
+            grid_height,
+            grid_width,
+            config["GRID_NUM"][0],
+            config["GRID_NUM"][1],
+            np.array(intrinsics),
+        )
+    else:
+        # Use HFOV only
+        z2x, z2y = z2xy_coefficient_fov(
+            grid_height,
+            grid_width,
+            config["GRID_NUM"][0],
+            config["GRID_NUM"][1],
+            hfov,
+        )
+    z2x = z2x.reshape(config["GRID_NUM"][0], config["GRID_NUM"][1])
+    z2y = z2y.reshape(config["GRID_NUM"][0], config["GRID_NUM"][1])
+    return z2x, z2y
+
+
+def ignore_grids_mask(config):
+    # True for the grids not ignored by IGNORE_GRIDS
+    valid = np.zeros(config["GRID_NUM"], dtype=bool)
+    upper, lower, left, right = config["IGNORE_GRIDS"]
+    valid[
+        upper : config["GRID_NUM"][0] - lower, left : config["GRID_NUM"][1] - right
+    ] = True
+    return valid
+
+
+def mount_transform(mount=None):
+    # Rotation(camera FRD to body FRD) and position(in m, FRD) of a camera's MOUNT
+    mount = mount or {}
+    yaw, pitch, roll = np.radians(
+        [mount.get("YAW", 0), mount.get("PITCH", 0), mount.get("ROLL", 0)]
+    )  # Right, up and right-down positive
+    rz = np.array(
+        [[np.cos(yaw), -np.sin(yaw), 0], [np.sin(yaw), np.cos(yaw), 0], [0, 0, 1]]
+    )
+    ry = np.array(
+        [
+            [np.cos(pitch), 0, np.sin(pitch)],
+            [0, 1, 0],
+            [-np.sin(pitch), 0, np.cos(pitch)],
+        ]
+    )
+    rx = np.array(
+        [[1, 0, 0], [0, np.cos(roll), -np.sin(roll)], [0, np.sin(roll), np.cos(roll)]]
+    )
+    return rz @ ry @ rx, np.array(mount.get("POSITION", [0, 0, 0]), dtype=np.float64)
+
+
+def frd_rays(z2x, z2y, mount=None):
+    # Body frame (FRD) point of each grid is origin+ray*z
+    rays = np.stack((np.ones_like(z2x), z2x, -z2y), axis=-1)
+    rotation, position = mount_transform(mount)
+    origins = np.broadcast_to(position, rays.shape).copy()
+    return rays @ rotation.T, origins
+
+
+def grids2frd(grids, rays, origins, valid):
+    # Obstacle grids to body frame (FRD) points in one step
+    obstacle = (grids[..., 0] > 0) & valid
+    z = grids[..., 1][obstacle].astype(np.float64)  # depth(z) in m
+    points = origins[obstacle] + rays[obstacle] * z[:, None]
+    return np.flatnonzero(obstacle), points  # Flat grid index, (N,3) in m
+
+
+def deduplicate(points, voxel):
+    # Index of the nearest point in each voxel(in m), e.g. seen by two cameras
+    order = np.argsort(np.linalg.norm(points, axis=1), kind="stable")
+    keys = np.floor(points[order] / voxel).astype(np.int64)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    return np.sort(order[first])